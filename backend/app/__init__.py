@@ -10,12 +10,37 @@ def create_app():
     # Load configuration
     app.config.from_object(Config)
     
+    # Trust X-Forwarded-For from known reverse proxies (client IPs for login throttling)
+    if Config.TRUSTED_PROXY_COUNT:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXY_COUNT)
+    
     # Enable CORS
     CORS(app, resources={r"/api/*": {"origins": "*"}})
     
     # Initialize database
     init_db(app)
     
+    # Per-request deadlines, statement timeouts and 503s on timeout
+    from app.utils import deadline
+    deadline.init_app(app)
+    
+    # Count the SQL statements of each request against route budgets
+    from app.utils import query_budget
+    query_budget.init_app(app)
+    
+    # Flush buffered last_login updates in the background and at exit
+    from app.utils.last_login_buffer import last_login_buffer
+    last_login_buffer.init_app(app)
+    
+    # Group-commit answer saves in the background
+    from app.utils.answer_buffer import answer_buffer
+    answer_buffer.init_app(app)
+    
+    # Keep the per-process set of revoked access tokens in sync
+    from app.utils.token_revocation import revocation_filter
+    revocation_filter.init_app(app)
+    
     # Configure file upload
     app.config['MAX_CONTENT_LENGTH'] = Config.MAX_CONTENT_LENGTH
     
@@ -26,6 +51,8 @@ def create_app():
     from app.routes.test_routes import test_bp
     from app.routes.employee_routes import employee_bp
     from app.routes.access_control_routes import access_control_bp
+    from app.routes.metrics_routes import metrics_bp
+    from app.routes.auth_routes import auth_bp
     
     app.register_blueprint(admin_bp)
     app.register_blueprint(tenant_bp)
@@ -33,6 +60,12 @@ def create_app():
     app.register_blueprint(test_bp)
     app.register_blueprint(employee_bp)
     app.register_blueprint(access_control_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(auth_bp)
+    
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
     
     # Health check route
     @app.route('/health', methods=['GET'])
@@ -45,6 +78,7 @@ def create_app():
             'message': 'Welcome to Multi-tenant SaaS Platform API',
             'version': '1.0.0',
             'endpoints': {
+                'auth': '/api/auth',
                 'admin': '/api/admin',
                 'tenant': '/api/tenant',
                 'user': '/api/user',
@@ -52,5 +86,9 @@ def create_app():
             }
         }, 200
     
+    # Run requests again when the embedded SQLite database was busy (wraps every route above)
+    from app.utils import sqlite
+    sqlite.init_app(app)
+    
     return app
 
@@ -0,0 +1,248 @@
+"""
+Flask CLI commands
+
+Usage:
+    flask --app app.main <command>
+"""
+import time
+import click
+import bcrypt
+from flask.cli import with_appcontext
+from app.config import Config
+
+def register_commands(app):
+    """Register all CLI commands with the Flask app"""
+    app.cli.add_command(migrate)
+    app.cli.add_command(bootstrap)
+    app.cli.add_command(calibrate_bcrypt)
+    app.cli.add_command(init_access_matrix)
+    app.cli.add_command(check_query_plans)
+    app.cli.add_command(partition_test_responses)
+    app.cli.add_command(add_test_response_partitions)
+    app.cli.add_command(drop_test_response_partitions)
+    app.cli.add_command(init_shards)
+    app.cli.add_command(move_tenant)
+
+@click.command('migrate')
+@click.option('--status', is_flag=True, help='List pending migrations without applying them')
+@with_appcontext
+def migrate(status):
+    """Create missing tables and apply pending schema migrations"""
+    from app.migrations import get_databases, get_pending_migrations, run_migrations
+
+    if status:
+        pending = 0
+        for shard, engine in get_databases():
+            for migration in get_pending_migrations(engine):
+                pending += 1
+                click.echo(f'pending  {migration.id} ({shard}): {migration.description}')
+        click.echo(f'{pending} pending migration(s)')
+        return
+
+    applied = run_migrations(echo=click.echo)
+    click.echo(f'Database is up to date ({len(applied)} migration(s) applied)')
+
+@click.command('bootstrap')
+@with_appcontext
+def bootstrap():
+    """Migrate the database and seed the default admin and access matrix"""
+    from app.migrations import run_migrations
+    from app.database import create_default_admin, initialize_default_rbac
+
+    applied = run_migrations(echo=click.echo)
+    click.echo(f'Database is up to date ({len(applied)} migration(s) applied)')
+
+    create_default_admin()
+    initialize_default_rbac()
+
+@click.command('calibrate-bcrypt')
+@click.option('--target-ms', default=250, show_default=True, help='Target verify latency in milliseconds')
+@click.option('--min-rounds', default=10, show_default=True, help='Lowest cost factor to consider')
+@click.option('--max-rounds', default=16, show_default=True, help='Highest cost factor to consider')
+@click.option('--samples', default=3, show_default=True, help='Verifications timed per cost factor')
+def calibrate_bcrypt(target_ms, min_rounds, max_rounds, samples):
+    """Pick the bcrypt cost that best fits a target verify latency on this machine"""
+    password = b'Calibrate@12345'
+    best_rounds = None
+    min_rounds_ms = None
+
+    for rounds in range(min_rounds, max_rounds + 1):
+        hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.checkpw(password, hashed)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        median_ms = sorted(timings)[len(timings) // 2]
+        click.echo(f'rounds={rounds:2d}  verify={median_ms:8.1f} ms')
+        if rounds == min_rounds:
+            min_rounds_ms = median_ms
+
+        if median_ms > target_ms:
+            break
+        best_rounds = rounds
+
+    if best_rounds is None:
+        click.echo(
+            f'\nWarning: the {target_ms} ms target cannot be met on this machine; '
+            f'even the minimum cost (rounds={min_rounds}) takes {min_rounds_ms:.1f} ms per verify'
+        )
+        best_rounds = min_rounds
+
+    click.echo(f'\nRecommended: BCRYPT_ROUNDS={best_rounds} (target {target_ms} ms)')
+
+@click.command('init-access-matrix')
+@click.option('--tenant-id', 'tenant_ids', type=int, multiple=True, help='Tenant to initialize (repeatable)')
+@click.option('--all-tenants', is_flag=True, help='Initialize every tenant')
+@click.option('--global', 'include_global', is_flag=True, help='Also initialize the global matrix')
+@click.option('--batch-size', default=500, show_default=True, help='Tenants committed per transaction')
+@with_appcontext
+def init_access_matrix(tenant_ids, all_tenants, include_global, batch_size):
+    """Write the default access matrix for tenants with batched upserts"""
+    from app.utils.initialize_rbac import (
+        initialize_default_access_matrix, bulk_initialize_default_access_matrix, unknown_tenant_ids
+    )
+
+    if not (tenant_ids or all_tenants or include_global):
+        raise click.UsageError('Pass --tenant-id, --all-tenants or --global')
+
+    unknown = unknown_tenant_ids(tenant_ids) if tenant_ids and not all_tenants else []
+    if unknown:
+        raise click.UsageError(f'Unknown tenant ID(s): {", ".join(map(str, unknown))}')
+
+    if include_global:
+        result = initialize_default_access_matrix(tenant_id=None)
+        click.echo(f'global: {len(result["created"])} created, {len(result["updated"])} updated')
+
+    if tenant_ids or all_tenants:
+        def report(batch, tenants, created, updated):
+            click.echo(f'batch {batch}: {tenants} tenants, {created} created, {updated} updated')
+
+        start = time.perf_counter()
+        totals = bulk_initialize_default_access_matrix(
+            None if all_tenants else list(tenant_ids),
+            batch_size=batch_size,
+            on_batch=report
+        )
+        click.echo(
+            f'{totals["tenants"]} tenants in {totals["batches"]} batches '
+            f'({time.perf_counter() - start:.1f}s): {totals["created"]} created, {totals["updated"]} updated'
+        )
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans():
+    """Fail if a hot query shape does not use the index built for it (PostgreSQL only)"""
+    from app.database import db
+    from app.query_plans import check_query_plans as check
+
+    if db.engine.dialect.name != 'postgresql':
+        raise click.ClickException('check-query-plans needs PostgreSQL')
+
+    try:
+        failures = check(echo=click.echo)
+    finally:
+        db.session.rollback()
+
+    if failures:
+        raise click.ClickException(f'{failures} query shape(s) do not use their index')
+
+def _partitioning_command(operation):
+    """Run a partitioning operation, reporting its errors as CLI errors"""
+    from app.database import db
+
+    if db.engine.dialect.name != 'postgresql':
+        raise click.ClickException('Partitioning needs PostgreSQL')
+
+    try:
+        return operation()
+    except (RuntimeError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+@click.command('partition-test-responses')
+@click.option('--strategy', type=click.Choice(['hash', 'range']),
+              default=Config.TEST_RESPONSE_PARTITION_STRATEGY, help='hash by tenant_id, or range by month of created_at')
+@click.option('--partitions', type=int, default=Config.TEST_RESPONSE_PARTITIONS,
+              help='Number of hash partitions')
+@click.option('--months-ahead', type=int, default=3, help='Future monthly partitions to create (range)')
+@click.option('--batch-size', type=int, default=10000, help='Rows copied per transaction')
+@click.option('--drop-old', is_flag=True, help='Drop the unpartitioned table after the swap')
+@with_appcontext
+def partition_test_responses(strategy, partitions, months_ahead, batch_size, drop_old):
+    """Convert test_responses into a partitioned table while the app keeps running (PostgreSQL only)"""
+    from app.partitioning import partition_test_responses as convert
+
+    if strategy != Config.TEST_RESPONSE_PARTITION_STRATEGY:
+        click.echo(f'Warning: TestResponse is keyed for {Config.TEST_RESPONSE_PARTITION_STRATEGY} partitioning; '
+                   f'set TEST_RESPONSE_PARTITION_STRATEGY={strategy} for the app before serving traffic', err=True)
+
+    start = time.perf_counter()
+    copied = _partitioning_command(lambda: convert(
+        strategy=strategy,
+        partitions=partitions,
+        months_ahead=months_ahead,
+        batch_size=batch_size,
+        drop_old=drop_old,
+        echo=click.echo
+    ))
+    click.echo(f'{copied} rows copied in {time.perf_counter() - start:.1f}s')
+
+@click.command('add-test-response-partitions')
+@click.option('--months-ahead', type=int, default=3, help='Create monthly partitions up to this many months ahead')
+@with_appcontext
+def add_test_response_partitions(months_ahead):
+    """Create upcoming monthly partitions of a range-partitioned test_responses"""
+    from app.partitioning import add_test_response_partitions as add
+
+    created = _partitioning_command(lambda: add(months_ahead))
+    for name in created:
+        click.echo(f'created  {name}')
+    click.echo(f'{len(created)} partition(s) created')
+
+@click.command('drop-test-response-partitions')
+@click.option('--older-than-months', type=int, default=Config.TEST_RESPONSE_RETENTION_MONTHS,
+              help='Keep this many whole months before the current one')
+@click.option('--dry-run', is_flag=True, help='List the partitions without dropping them')
+@with_appcontext
+def drop_test_response_partitions(older_than_months, dry_run):
+    """Retention: drop monthly test_responses partitions past the cutoff"""
+    from app.partitioning import drop_test_response_partitions as drop
+
+    expired = _partitioning_command(lambda: drop(older_than_months, dry_run=dry_run))
+    for name in expired:
+        click.echo(f'{"would drop" if dry_run else "dropped"}  {name}')
+    click.echo(f'{len(expired)} partition(s) {"past retention" if dry_run else "dropped"}')
+
+@click.command('init-shards')
+@with_appcontext
+def init_shards():
+    """Migrate every shard and interleave their id sequences (run after adding a shard)"""
+    from app.migrations import run_migrations
+    from app.shard_moves import configure_id_sequences
+
+    applied = run_migrations(echo=click.echo)
+    click.echo(f'Databases are up to date ({len(applied)} migration(s) applied)')
+
+    try:
+        configure_id_sequences(echo=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+@click.command('move-tenant')
+@click.argument('tenant_id', type=int)
+@click.argument('shard')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Rows copied per transaction')
+@with_appcontext
+def move_tenant(tenant_id, shard, batch_size):
+    """Move a tenant's data to another shard while the app keeps serving it"""
+    from app.shard_moves import move_tenant as move
+    from app.utils.sharding import ShardNotResolved
+
+    start = time.perf_counter()
+    try:
+        copied = move(tenant_id, shard, batch_size=batch_size, echo=click.echo)
+    except (RuntimeError, ValueError, ShardNotResolved) as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{copied} rows copied in {time.perf_counter() - start:.1f}s')
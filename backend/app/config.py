@@ -1,5 +1,6 @@
 import os
 from dotenv import load_dotenv
+from sqlalchemy.pool import NullPool
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,9 +15,46 @@ class Config:
     DATABASE_USER = os.getenv('DATABASE_USER', 'postgres')
     DATABASE_PASSWORD = os.getenv('DATABASE_PASSWORD', '')
     
+    # Database backend: postgresql, or sqlite for an embedded single-node database (see app/utils/sqlite.py)
+    DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'postgresql')
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'instance/multitenant.db')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', 64))
+    SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', 256))
+    
     # SQLAlchemy Database URI
-    SQLALCHEMY_DATABASE_URI = f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+    if DATABASE_ENGINE == 'sqlite':
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.abspath(SQLITE_PATH)}"
+    else:
+        SQLALCHEMY_DATABASE_URI = f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Connection Pool (per worker process)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'True') == 'True'
+    # Behind PgBouncer in transaction pooling mode: no app-side pool, PgBouncer owns the connections
+    DB_PGBOUNCER_TRANSACTION_MODE = os.getenv('DB_PGBOUNCER_TRANSACTION_MODE', 'False') == 'True'
+    
+    # Read replicas (comma-separated SQLAlchemy URLs); GET requests read from them
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    # Seconds a caller reads from the primary after writing (read-your-writes)
+    READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+    
+    # Tenant shards (comma-separated name=URL pairs); tenants without a shard map entry,
+    # and all catalog data, stay in the main database (see app/utils/sharding.py)
+    DATABASE_SHARD_URLS = dict(
+        pair.strip().split('=', 1) for pair in os.getenv('DATABASE_SHARD_URLS', '').split(',') if '=' in pair
+    )
+    # Shard new tenants are placed on ('default' = the main database)
+    NEW_TENANT_SHARD = os.getenv('NEW_TENANT_SHARD', 'default')
+    # Seconds each worker caches a tenant's shard map entry
+    SHARD_MAP_TTL_SECONDS = float(os.getenv('SHARD_MAP_TTL_SECONDS', 5))
+    # Id sequences are interleaved across databases: at most this many shards, default included
+    SHARD_ID_STRIDE = int(os.getenv('SHARD_ID_STRIDE', 16))
+    
     SQLALCHEMY_ENGINE_OPTIONS = {
         "connect_args": {
             "host": DATABASE_HOST,
@@ -24,25 +62,81 @@ class Config:
             "dbname": DATABASE_NAME,
             "user": DATABASE_USER,
             "password": DATABASE_PASSWORD
-        }
+        },
+        **({"poolclass": NullPool} if DB_PGBOUNCER_TRANSACTION_MODE else {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING
+        })
     }
     
     # JWT Configuration
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
     JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
-    JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRE_MINUTES', 30))
+    JWT_ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRE_MINUTES', 15))
+    JWT_REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('JWT_REFRESH_TOKEN_EXPIRE_DAYS', 14))
+    
+    # How often each worker pulls newly revoked access tokens
+    TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv('TOKEN_REVOCATION_SYNC_SECONDS', 5))
+    
+    # Password Hashing Pool (0 workers hashes inline on the request thread)
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 32))
+    PASSWORD_HASH_RETRY_AFTER = int(os.getenv('PASSWORD_HASH_RETRY_AFTER', 1))
+    # Concurrent bcrypt calls across all gunicorn workers of a host (0 = no cap; gunicorn.conf.py defaults it to the cores)
+    PASSWORD_HASH_HOST_LIMIT = int(os.getenv('PASSWORD_HASH_HOST_LIMIT', 0))
+    
+    # bcrypt work factor; stored hashes with a different cost are rehashed on login
+    # Use `flask calibrate-bcrypt` to pick a value for the deployment hardware
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    
+    # Failed Login Throttling (sliding window)
+    LOGIN_THROTTLE_WINDOW_SECONDS = int(os.getenv('LOGIN_THROTTLE_WINDOW_SECONDS', 300))
+    LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.getenv('LOGIN_MAX_FAILURES_PER_ACCOUNT', 5))
+    LOGIN_MAX_FAILURES_PER_IP = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', 50))
+    
+    # Optional Redis for state shared across workers (e.g. login throttling)
+    REDIS_URL = os.getenv('REDIS_URL', '')
+    REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.5))
+    
+    # Write-behind last_login updates: max staleness in seconds (0 = write on every login)
+    LAST_LOGIN_FLUSH_SECONDS = float(os.getenv('LAST_LOGIN_FLUSH_SECONDS', 5))
+    
+    # Group commit of answer saves: milliseconds to wait for more saves before each commit (0 = commit every save)
+    ANSWER_FLUSH_MS = float(os.getenv('ANSWER_FLUSH_MS', 5))
+    
+    # How `flask partition-test-responses` partitions test_responses (see app/partitioning.py):
+    # 'hash' by tenant_id or 'range' by month of created_at. TestResponse's key follows it.
+    TEST_RESPONSE_PARTITION_STRATEGY = os.getenv('TEST_RESPONSE_PARTITION_STRATEGY', 'hash')
+    TEST_RESPONSE_PARTITIONS = int(os.getenv('TEST_RESPONSE_PARTITIONS', 16))
+    # Months of range partitions kept by `flask drop-test-response-partitions`
+    TEST_RESPONSE_RETENTION_MONTHS = int(os.getenv('TEST_RESPONSE_RETENTION_MONTHS', 24))
+    
+    # Serialized test definitions: seconds a worker serves one without re-checking its version, and entries kept
+    TEST_DEFINITION_CACHE_SECONDS = float(os.getenv('TEST_DEFINITION_CACHE_SECONDS', 5))
+    TEST_DEFINITION_CACHE_SIZE = int(os.getenv('TEST_DEFINITION_CACHE_SIZE', 1000))
+    
+    # Default per-request latency budget in ms, applied as statement_timeout (0 = none)
+    DEFAULT_LATENCY_BUDGET_MS = int(os.getenv('DEFAULT_LATENCY_BUDGET_MS', 5000))
     
     # Admin Credentials
     ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@multitenant.com')
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'Admin@12345')
     
     # Flask Configuration
-    DEBUG = os.getenv('FLASK_DEBUG', 'True') == 'True'
+    DEBUG = os.getenv('FLASK_DEBUG', 'False') == 'True'
     
     # Application Settings
     APP_HOST = os.getenv('APP_HOST', '0.0.0.0')
     APP_PORT = int(os.getenv('APP_PORT', 5000))
     
+    # Number of reverse proxies in front of the app (for client IPs via X-Forwarded-For).
+    # Behind a proxy, 0 makes every client look like the proxy: LOGIN_MAX_FAILURES_PER_IP
+    # then counts everyone's failures together and throttles all logins at once
+    TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+    
     # File Upload Settings
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
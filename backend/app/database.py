@@ -1,46 +1,68 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from app.utils.db_routing import RoutingSession
 
-# Initialize SQLAlchemy
-db = SQLAlchemy()
+# Initialize SQLAlchemy (reads of GET requests may be routed to replicas)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def init_db(app):
-    """Initialize database with Flask app"""
+    """
+    Initialize database with Flask app
+    
+    Does no DB work, so workers start without a round trip. Tables, migrations
+    and seed data are handled by `flask bootstrap` (see app/cli.py).
+    """
+    from app.utils.db_pool import InstrumentedQueuePool, instrument_engine
+    from app.utils import db_routing
+    from app.utils.sharding import shard_binds
+    from app.utils import sqlite
+    
     # Apply engine options if they exist
     if hasattr(app.config, 'SQLALCHEMY_ENGINE_OPTIONS'):
         app.config['SQLALCHEMY_ENGINE_OPTIONS'] = app.config.SQLALCHEMY_ENGINE_OPTIONS
     
+    # Time pool checkouts unless a pool class (e.g. NullPool for PgBouncer) is configured
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    engine_options.setdefault('poolclass', InstrumentedQueuePool)
+    
+    # The PostgreSQL connect_args do not apply to an embedded SQLite file
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        engine_options['connect_args'] = sqlite.sqlite_connect_args()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    
+    # Register read replicas as binds
+    replica_urls = app.config.get('DATABASE_REPLICA_URLS')
+    if replica_urls:
+        app.config['SQLALCHEMY_BINDS'] = {**(app.config.get('SQLALCHEMY_BINDS') or {}), **db_routing.replica_binds(replica_urls)}
+    
+    # Register tenant shards as binds
+    shard_urls = app.config.get('DATABASE_SHARD_URLS')
+    if shard_urls:
+        app.config['SQLALCHEMY_BINDS'] = {**(app.config.get('SQLALCHEMY_BINDS') or {}), **shard_binds(shard_urls)}
+    
     db.init_app(app)
+    db_routing.init_app(app)
     
     with app.app_context():
-        # Import all models to ensure they're registered with SQLAlchemy
-        from app.models import admin, tenant, user, test, access_matrix
-        
-        # Create all tables
-        db.create_all()
-        print("✅ Database tables created successfully!")
-        
-        # Create default admin if not exists
-        create_default_admin()
-        
-        # Initialize default RBAC access matrix
-        initialize_default_rbac()
+        for bind_key, engine in db.engines.items():
+            instrument_engine(engine, 'db' if bind_key is None else f'db.{bind_key}')
+            sqlite.configure_engine(engine)
+    
+    # Import all models to ensure they're registered with SQLAlchemy
+    from app.models import admin, tenant, user, test, access_matrix, refresh_token, shard_map
 
 def create_default_admin():
     """Create default admin user if not exists"""
     from app.models.admin import Admin
     from app.config import Config
-    import bcrypt
+    from app.utils.auth import hash_password
     
     # Check if admin already exists
     existing_admin = Admin.query.filter_by(email=Config.ADMIN_EMAIL).first()
     
     if not existing_admin:
         # Hash the admin password
-        hashed_password = bcrypt.hashpw(
-            Config.ADMIN_PASSWORD.encode('utf-8'), 
-            bcrypt.gensalt()
-        ).decode('utf-8')
+        hashed_password = hash_password(Config.ADMIN_PASSWORD)
         
         # Create admin user
         admin = Admin(
@@ -4,6 +4,7 @@ from app.config import Config
 # Create Flask application
 app = create_app()
 
+# Development server only; production runs gunicorn (see gunicorn.conf.py)
 if __name__ == '__main__':
     print("=" * 50)
     print("🚀 Starting Multi-tenant SaaS Platform API")
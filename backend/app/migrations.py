@@ -0,0 +1,259 @@
+"""
+Schema migrations
+
+Migrations are applied in list order by `flask migrate` (and `flask bootstrap`),
+never by create_app, and each ID is recorded in schema_migrations so it runs
+once per database: the main one and every tenant shard. New tables still come from the models via db.create_all(); list here
+only changes create_all cannot make to existing tables.
+
+Statements must be idempotent where possible (IF NOT EXISTS; indexes built
+concurrently use _create_index_concurrently, which also redoes a failed
+build). A statement may also be a callable taking the connection. Migrations marked autocommit
+run outside a transaction, which statements such as CREATE INDEX
+CONCURRENTLY require, and data changes done in committed batches.
+
+Migrations limited to some dialects are only recorded on the others: a
+SQLite database is always created by create_all with the current schema.
+"""
+from datetime import datetime
+from sqlalchemy import inspect, text
+from app.database import db
+from app.utils.sharding import bind_key, shard_names
+
+# Arbitrary key for the advisory lock that serializes concurrent migrators
+MIGRATION_LOCK_KEY = 7314209
+
+class Migration:
+    """
+    One schema change
+
+    Args:
+        id: Unique, sortable migration ID
+        description: Short human-readable summary
+        statements: SQL statements or callables to run in order
+        autocommit: Run each statement outside a transaction
+        dialects: Database dialects the statements are for (None = all)
+    """
+
+    def __init__(self, id, description, statements, autocommit=False, dialects=None):
+        self.id = id
+        self.description = description
+        self.statements = statements
+        self.autocommit = autocommit
+        self.dialects = dialects
+
+    def applies_to(self, engine):
+        """Check if the statements are meant for an engine's dialect"""
+        return self.dialects is None or engine.dialect.name in self.dialects
+
+def _backfill_response_tenants(conn, batch_size=10000):
+    """Copy each response's tenant from its test, one committed id range at a time"""
+    last_id = conn.execute(text('SELECT COALESCE(MAX(id), 0) FROM test_responses')).scalar()
+    for low in range(0, last_id, batch_size):
+        conn.execute(text(
+            'UPDATE test_responses r SET tenant_id = t.tenant_id FROM tests t '
+            'WHERE t.id = r.test_id AND r.tenant_id IS NULL AND r.id > :low AND r.id <= :high'
+        ), {'low': low, 'high': low + batch_size})
+
+def _add_column(table, column, ddl):
+    """Statement adding a column unless it exists, on any dialect"""
+    def add(conn):
+        if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    return add
+
+def _create_index_concurrently(name, definition):
+    """
+    Statement building an index without blocking writes, on PostgreSQL
+
+    A CREATE INDEX CONCURRENTLY that failed or was interrupted leaves an
+    INVALID index behind, which IF NOT EXISTS would take as done: such a
+    leftover is dropped and the index built again.
+    """
+    def create(conn):
+        valid = conn.execute(
+            text('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+            {'name': name}
+        ).scalar()
+        if valid:
+            return
+        if valid is not None:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY {name}'))
+        conn.execute(text(f'CREATE INDEX CONCURRENTLY {name} ON {definition}'))
+    return create
+
+MIGRATIONS = [
+    Migration(
+        '0001_unique_global_role',
+        'Partial unique index for global access matrix roles',
+        [
+            'CREATE UNIQUE INDEX IF NOT EXISTS unique_global_role '
+            'ON access_matrix (role) WHERE tenant_id IS NULL'
+        ]
+    ),
+    Migration(
+        '0002_jsonb_columns',
+        'Store JSON documents as JSONB',
+        [
+            'ALTER TABLE test_responses ALTER COLUMN responses TYPE JSONB USING responses::jsonb',
+            'ALTER TABLE users ALTER COLUMN profile_data TYPE JSONB USING profile_data::jsonb',
+            'ALTER TABLE tenants ALTER COLUMN business_metadata TYPE JSONB USING business_metadata::jsonb',
+            'ALTER TABLE questions ALTER COLUMN options TYPE JSONB USING options::jsonb',
+            'ALTER TABLE access_matrix ALTER COLUMN permissions TYPE JSONB USING permissions::jsonb'
+        ],
+        dialects=('postgresql',)
+    ),
+    Migration(
+        '0003_hot_query_indexes',
+        'Composite and partial indexes for the hot user, test and response filters',
+        [
+            _create_index_concurrently('ix_users_tenant_role', 'users (tenant_id, role)'),
+            _create_index_concurrently('ix_users_tenant_active', 'users (tenant_id) WHERE is_active'),
+            _create_index_concurrently('ix_users_email_active', 'users (email) WHERE is_active'),
+            _create_index_concurrently('ix_test_responses_open', 'test_responses (test_id, user_id) WHERE NOT is_completed'),
+            _create_index_concurrently('ix_tests_tenant_active', 'tests (tenant_id) WHERE is_active')
+        ],
+        autocommit=True,
+        dialects=('postgresql',)
+    ),
+    Migration(
+        '0004_test_responses_tenant_id',
+        'Tenant column on test_responses, the hash partitioning key',
+        [
+            'ALTER TABLE test_responses ADD COLUMN IF NOT EXISTS tenant_id INTEGER '
+            'REFERENCES tenants (id) ON DELETE CASCADE',
+            _backfill_response_tenants,
+            _create_index_concurrently('ix_test_responses_tenant_user', 'test_responses (tenant_id, user_id)')
+        ],
+        autocommit=True,
+        dialects=('postgresql',)
+    ),
+    Migration(
+        '0005_user_directory',
+        'Login directory of (email, tenant) for existing users',
+        [
+            'INSERT INTO user_directory (email, tenant_id) '
+            'SELECT DISTINCT email, tenant_id FROM users WHERE true ON CONFLICT DO NOTHING'
+        ]
+    ),
+    Migration(
+        '0006_test_content_version',
+        'Content version of tests, for cached test definitions',
+        [
+            _add_column('tests', 'content_version', 'INTEGER NOT NULL DEFAULT 1')
+        ]
+    ),
+    Migration(
+        '0007_question_order_rank',
+        'Fractional rank of questions, for single-row moves',
+        [
+            _add_column('questions', 'order_rank', "VARCHAR(64) NOT NULL DEFAULT ''")
+        ]
+    ),
+    Migration(
+        '0008_test_response_answers_version',
+        'Version of test response answers, returned by answer saves',
+        [
+            _add_column('test_responses', 'answers_version', 'INTEGER NOT NULL DEFAULT 0')
+        ]
+    ),
+    Migration(
+        '0009_drop_users_email_index',
+        'Drop the email-only users index, which the planner picked over ix_users_email_active for login',
+        [
+            # Other email lookups also filter by tenant and use unique_tenant_user_email
+            'DROP INDEX CONCURRENTLY IF EXISTS ix_users_email'
+        ],
+        autocommit=True,
+        dialects=('postgresql',)
+    ),
+]
+
+def _run(conn, statement):
+    if callable(statement):
+        statement(conn)
+    else:
+        conn.execute(text(statement))
+
+def _ensure_migrations_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'id VARCHAR(255) PRIMARY KEY, '
+        'applied_at TIMESTAMP NOT NULL)'
+    ))
+
+def _record(conn, migration):
+    conn.execute(
+        text('INSERT INTO schema_migrations (id, applied_at) VALUES (:id, :applied_at)'),
+        {'id': migration.id, 'applied_at': datetime.utcnow()}
+    )
+
+def get_databases():
+    """Get (shard name, engine) for the main database and every tenant shard"""
+    return [(shard, db.engines[bind_key(shard)]) for shard in shard_names()]
+
+def get_applied_migrations(engine=None):
+    """Get the set of applied migration IDs of a database (default: the main one)"""
+    with (engine or db.engine).begin() as conn:
+        _ensure_migrations_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT id FROM schema_migrations'))}
+
+def get_pending_migrations(engine=None):
+    """Get migrations not yet applied to a database, in order"""
+    applied = get_applied_migrations(engine)
+    return [migration for migration in MIGRATIONS if migration.id not in applied]
+
+def _apply(migration, engine):
+    if not migration.applies_to(engine):
+        with engine.begin() as conn:
+            _record(conn, migration)
+    elif migration.autocommit:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for statement in migration.statements:
+                _run(conn, statement)
+        with engine.begin() as conn:
+            _record(conn, migration)
+    else:
+        with engine.begin() as conn:
+            for statement in migration.statements:
+                _run(conn, statement)
+            _record(conn, migration)
+
+def run_migrations(echo=print):
+    """
+    Create missing tables and apply pending migrations on every database
+
+    Safe to run from several containers at once: on PostgreSQL an advisory
+    lock on the main database makes the others wait and then find nothing
+    pending. Shards get the full schema, so any of them can hold any tenant.
+
+    Returns:
+        list of applied migration IDs
+    """
+    applied = []
+
+    with db.engine.connect() as lock_conn:
+        use_lock = db.engine.dialect.name == 'postgresql'
+        if use_lock:
+            lock_conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            lock_conn.commit()
+
+        try:
+            databases = get_databases()
+            for shard, engine in databases:
+                db.metadata.create_all(bind=engine)
+
+                for migration in get_pending_migrations(engine):
+                    label = migration.id if len(databases) == 1 else f'{migration.id} on {shard}'
+                    if migration.applies_to(engine):
+                        echo(f'Applying {label}: {migration.description}')
+                    else:
+                        echo(f'Recording {label}: not needed on {engine.dialect.name}')
+                    _apply(migration, engine)
+                    applied.append(migration.id)
+        finally:
+            if use_lock:
+                lock_conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                lock_conn.commit()
+
+    return applied
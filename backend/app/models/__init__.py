@@ -3,7 +3,12 @@ from app.models.admin import Admin
 from app.models.tenant import Tenant
 from app.models.user import User
 from app.models.test import Test, Question, TestResponse
-from app.models.access_matrix import AccessMatrix
-
-__all__ = ['Admin', 'Tenant', 'User', 'Test', 'Question', 'TestResponse', 'AccessMatrix']
+from app.models.access_matrix import AccessMatrix, AccessMatrixVersion
+from app.models.refresh_token import RefreshToken, RevokedToken
+from app.models.shard_map import TenantShard, UserDirectoryEntry
 
+__all__ = [
+    'Admin', 'Tenant', 'User', 'Test', 'Question', 'TestResponse',
+    'AccessMatrix', 'AccessMatrixVersion', 'RefreshToken', 'RevokedToken',
+    'TenantShard', 'UserDirectoryEntry'
+]
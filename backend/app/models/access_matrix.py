@@ -1,6 +1,6 @@
 from app.database import db
 from datetime import datetime
-from sqlalchemy.dialects.postgresql import JSON
+from app.models.types import JSONDocument
 
 class AccessMatrix(db.Model):
     """Access Control Matrix - Defines permissions for each role"""
@@ -16,7 +16,9 @@ class AccessMatrix(db.Model):
     
     # Permissions stored as JSON
     # Format: {"resource": ["create", "read", "update", "delete"], ...}
-    permissions = db.Column(JSON, nullable=False, default={})
+    # Resources may be nested ("tests.responses") or wildcards ("reports.*", "*");
+    # "all" or "*" as an action grants every action (see utils/permission_trie.py)
+    permissions = db.Column(JSONDocument, nullable=False, default={})
     
     # Metadata
     description = db.Column(db.Text, nullable=True)
@@ -27,8 +29,10 @@ class AccessMatrix(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Unique constraint: role must be unique per tenant (or global if tenant_id is null)
+    # NULL tenant_ids never collide in unique_tenant_role, so global roles need a partial index
     __table_args__ = (
         db.UniqueConstraint('tenant_id', 'role', name='unique_tenant_role'),
+        db.Index('unique_global_role', 'role', unique=True, postgresql_where=db.text('tenant_id IS NULL'), sqlite_where=db.text('tenant_id IS NULL')),
     )
     
     def __repr__(self):
@@ -53,6 +57,25 @@ class AccessMatrix(db.Model):
         if not self.is_active:
             return False
         
-        resource_perms = self.permissions.get(resource, [])
-        return action in resource_perms or 'all' in resource_perms
+        from app.utils.permission_trie import CompiledPermissions
+        
+        # Recompile only when the permissions object is replaced
+        compiled = getattr(self, '_compiled_permissions', None)
+        if compiled is None or compiled[0] is not self.permissions:
+            compiled = (self.permissions, CompiledPermissions(self.permissions))
+            self._compiled_permissions = compiled
+        
+        return compiled[1].allows(resource, action)
 
+
+class AccessMatrixVersion(db.Model):
+    """Single-row counter bumped on every access matrix change"""
+    
+    __tablename__ = 'access_matrix_version'
+    
+    id = db.Column(db.Integer, primary_key=True)  # Always 1
+    version = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<AccessMatrixVersion {self.version}>'
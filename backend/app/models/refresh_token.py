@@ -0,0 +1,41 @@
+from app.database import db
+from datetime import datetime
+
+class RefreshToken(db.Model):
+    """Refresh Token Model - Rotating refresh tokens, stored hashed"""
+    
+    __tablename__ = 'refresh_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)  # SHA-256 hex
+    family_id = db.Column(db.String(32), nullable=False, index=True)  # Shared by all rotations of one login
+    
+    # Owner (admin, tenant or user, so not a foreign key)
+    user_id = db.Column(db.Integer, nullable=False)
+    user_type = db.Column(db.String(20), nullable=False)
+    tenant_id = db.Column(db.Integer, nullable=True)
+    
+    # Lifetime
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<RefreshToken {self.id} - {self.user_type} {self.user_id}>'
+    
+    @property
+    def is_usable(self):
+        return self.revoked_at is None and self.expires_at > datetime.utcnow()
+
+class RevokedToken(db.Model):
+    """Revoked Token Model - Access token IDs revoked before they expire"""
+    
+    __tablename__ = 'revoked_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    jti = db.Column(db.String(32), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)  # Sync cursor for workers
+    
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
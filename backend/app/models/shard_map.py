@@ -0,0 +1,35 @@
+from app.database import db
+from datetime import datetime
+
+class TenantShard(db.Model):
+    """Shard Map Model - The database holding a tenant's data (no row: the main database)"""
+    
+    __tablename__ = 'tenant_shards'
+    
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.String(100), nullable=False, index=True)  # Name from DATABASE_SHARD_URLS, or 'default'
+    status = db.Column(db.String(20), default='active', nullable=False)  # active, moving (writes rejected)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<TenantShard {self.tenant_id} - {self.shard} ({self.status})>'
+    
+    def to_dict(self):
+        """Convert shard map entry to dictionary"""
+        return {
+            'tenant_id': self.tenant_id,
+            'shard': self.shard,
+            'status': self.status,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class UserDirectoryEntry(db.Model):
+    """User Directory Model - Tenants with a user of a given email, for logins without a tenant"""
+    
+    __tablename__ = 'user_directory'
+    
+    email = db.Column(db.String(255), primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id', ondelete='CASCADE'), primary_key=True)
+    
+    def __repr__(self):
+        return f'<UserDirectoryEntry {self.email} - Tenant {self.tenant_id}>'
@@ -1,6 +1,6 @@
 from app.database import db
 from datetime import datetime
-from sqlalchemy.dialects.postgresql import JSON
+from app.models.types import JSONDocument
 
 class Tenant(db.Model):
     """Tenant Model - Represents businesses/organizations using the platform"""
@@ -14,7 +14,7 @@ class Tenant(db.Model):
     phone = db.Column(db.String(20), nullable=True)
     
     # Business Information stored as JSON metadata
-    business_metadata = db.Column(JSON, nullable=True, default={})  # GST, PAN, Address, etc.
+    business_metadata = db.Column(JSONDocument, nullable=True, default={})  # GST, PAN, Address, etc.
     
     # Tenant Admin Credentials
     admin_name = db.Column(db.String(255), nullable=False)
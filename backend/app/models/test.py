@@ -1,6 +1,7 @@
 from app.database import db
+from app.config import Config
 from datetime import datetime
-from sqlalchemy.dialects.postgresql import JSON
+from app.models.types import JSONDocument
 
 class Test(db.Model):
     """Test/Questionnaire Model"""
@@ -17,17 +18,36 @@ class Test(db.Model):
     # Status
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
+    # Bumped on every change to the test or its questions (see app/utils/definition_cache.py)
+    content_version = db.Column(db.Integer, default=1, server_default='1', nullable=False)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Relationships
-    questions = db.relationship('Question', backref='test', lazy=True, cascade='all, delete-orphan', order_by='Question.priority_order')
+    questions = db.relationship('Question', backref='test', lazy=True, cascade='all, delete-orphan', order_by='[Question.priority_order, Question.order_rank, Question.id]')
     responses = db.relationship('TestResponse', backref='test', lazy=True, cascade='all, delete-orphan')
     
+    # Index for active tests per tenant (get_tests); see migration 0003
+    __table_args__ = (
+        db.Index('ix_tests_tenant_active', 'tenant_id', postgresql_where=db.text('is_active'), sqlite_where=db.text('is_active')),
+    )
+    
     def __repr__(self):
         return f'<Test {self.title} - Tenant {self.tenant_id}>'
     
+    def count_questions(self):
+        """
+        Get the number of questions without loading them
+        
+        Uses the questions if they are loaded, else questions_count (undefer
+        it in list queries to fetch every count with the tests themselves).
+        """
+        if 'questions' not in db.inspect(self).unloaded:
+            return len(self.questions)
+        return self.questions_count
+    
     def to_dict(self):
         """Convert test object to dictionary"""
         return {
@@ -36,7 +56,7 @@ class Test(db.Model):
             'title': self.title,
             'description': self.description,
             'is_active': self.is_active,
-            'questions_count': len(self.questions),
+            'questions_count': self.count_questions(),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -55,11 +75,12 @@ class Question(db.Model):
     section = db.Column(db.String(100), nullable=True)  # Section A, B, C, etc.
     
     # Options for radio/checkbox
-    options = db.Column(JSON, nullable=True)  # List of options for radio/checkbox
+    options = db.Column(JSONDocument, nullable=True)  # List of options for radio/checkbox
     
     # Ordering
     default_order = db.Column(db.Integer, nullable=False)  # Original order
     priority_order = db.Column(db.Integer, nullable=False)  # User-defined priority order
+    order_rank = db.Column(db.String(64), default='', server_default='', nullable=False)  # Fractional rank within a priority_order (see app/utils/question_order.py)
     
     # Settings
     is_required = db.Column(db.Boolean, default=True, nullable=False)
@@ -83,12 +104,22 @@ class Question(db.Model):
             'options': self.options,
             'default_order': self.default_order,
             'priority_order': self.priority_order,
+            'order_rank': self.order_rank,
             'is_required': self.is_required,
             'placeholder': self.placeholder,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+# Number of questions per test: a correlated COUNT served by the questions.test_id index
+Test.questions_count = db.column_property(
+    db.select(db.func.count(Question.id)).where(Question.test_id == Test.id).correlate_except(Question).scalar_subquery(),
+    deferred=True
+)
+
+# Display order of a test's questions: priority, then fractional rank, then age
+QUESTION_ORDER = (Question.priority_order, Question.order_rank, Question.id)
+
 class TestResponse(db.Model):
     """Test Response Model - Stores user responses to tests"""
     
@@ -97,9 +128,12 @@ class TestResponse(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     test_id = db.Column(db.Integer, db.ForeignKey('tests.id', ondelete='CASCADE'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    # Copied from the test; the hash partitioning key (see app/partitioning.py)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id', ondelete='CASCADE'), nullable=False)
     
     # Responses
-    responses = db.Column(JSON, nullable=False, default={})  # {question_id: answer}
+    responses = db.Column(JSONDocument, nullable=False, default={})  # {question_id: answer}
+    answers_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Bumped by every answer save
     
     # Image Upload
     image_path = db.Column(db.String(500), nullable=True)
@@ -117,6 +151,20 @@ class TestResponse(db.Model):
     # Relationships
     user = db.relationship('User', backref='test_responses')
     
+    # Index for a user's open response to a test (start_test) and a user's responses
+    # within their tenant (get_user_responses); see migrations 0003 and 0004
+    __table_args__ = (
+        db.Index('ix_test_responses_open', 'test_id', 'user_id', postgresql_where=db.text('NOT is_completed'), sqlite_where=db.text('NOT is_completed')),
+        db.Index('ix_test_responses_tenant_user', 'tenant_id', 'user_id'),
+    )
+    
+    # Identify rows by (id, partitioning key) so lookups, UPDATEs and DELETEs all
+    # carry it and touch a single partition: tenant_id for hash partitioning,
+    # created_at for monthly range partitioning (see app/partitioning.py)
+    __mapper_args__ = {
+        'primary_key': [id, tenant_id] if Config.TEST_RESPONSE_PARTITION_STRATEGY == 'hash' else [id, created_at]
+    }
+    
     def __repr__(self):
         return f'<TestResponse {self.id} - User {self.user_id} - Test {self.test_id}>'
     
@@ -126,7 +174,9 @@ class TestResponse(db.Model):
             'id': self.id,
             'test_id': self.test_id,
             'user_id': self.user_id,
+            'tenant_id': self.tenant_id,
             'responses': self.responses,
+            'answers_version': self.answers_version,
             'image_path': self.image_path,
             'image_url': self.image_url,
             'is_completed': self.is_completed,
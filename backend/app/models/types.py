@@ -0,0 +1,6 @@
+"""Column types shared by the models"""
+from sqlalchemy import JSON
+from sqlalchemy.dialects.postgresql import JSONB
+
+# JSON document: JSONB on PostgreSQL, JSON text on SQLite
+JSONDocument = JSON().with_variant(JSONB(), 'postgresql')
@@ -1,6 +1,6 @@
 from app.database import db
 from datetime import datetime
-from sqlalchemy.dialects.postgresql import JSON
+from app.models.types import JSONDocument
 
 class User(db.Model):
     """User Model - End users who interact with tenant services"""
@@ -12,12 +12,12 @@ class User(db.Model):
     
     # User Information
     name = db.Column(db.String(255), nullable=False)
-    email = db.Column(db.String(255), nullable=False, index=True)
+    email = db.Column(db.String(255), nullable=False)  # Logins use ix_users_email_active, the rest unique_tenant_user_email
     phone = db.Column(db.String(20), nullable=True)
     password = db.Column(db.String(255), nullable=False)
     
     # Profile Data
-    profile_data = db.Column(JSON, nullable=True, default={})  # Age, gender, preferences, etc.
+    profile_data = db.Column(JSONDocument, nullable=True, default={})  # Age, gender, preferences, etc.
     
     # Role and Access
     role = db.Column(db.String(50), default='user', nullable=False)  # user, employee, manager, sales_rep, etc.
@@ -37,8 +37,12 @@ class User(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Unique constraint: email must be unique within a tenant
+    # Indexes for the hot filters (employee lists, dashboards, login); see migrations 0003 and 0009
     __table_args__ = (
         db.UniqueConstraint('tenant_id', 'email', name='unique_tenant_user_email'),
+        db.Index('ix_users_tenant_role', 'tenant_id', 'role'),
+        db.Index('ix_users_tenant_active', 'tenant_id', postgresql_where=db.text('is_active'), sqlite_where=db.text('is_active')),
+        db.Index('ix_users_email_active', 'email', postgresql_where=db.text('is_active'), sqlite_where=db.text('is_active')),
     )
     
     def __repr__(self):
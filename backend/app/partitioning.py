@@ -0,0 +1,341 @@
+"""
+Declarative partitioning for test_responses
+
+test_responses is converted online, by `flask partition-test-responses`,
+into a partitioned table of the same name, with one of two strategies
+(TEST_RESPONSE_PARTITION_STRATEGY, or --strategy):
+
+    hash   HASH (tenant_id) into N partitions, primary key (id, tenant_id).
+           Every route looks responses up by the caller's tenant, so reads
+           and writes touch one partition.
+    range  RANGE (created_at) by month plus a DEFAULT partition, primary
+           key (id, created_at). Retention is a cheap DROP of whole months
+           (`drop-test-response-partitions`); flushes of loaded responses
+           touch one partition, but lookups by ID probe every month.
+
+TestResponse's mapper key follows the configured strategy, so the setting
+must match the table's actual strategy.
+
+The conversion never locks the table for longer than a rename:
+
+    1. create test_responses_partitioned with its partitions and indexes
+    2. install a trigger on the old table that mirrors every write into it
+    3. copy the existing rows over in committed id ranges
+    4. in one short transaction, drop the trigger and swap the names
+
+The old table is kept as test_responses_unpartitioned until dropped.
+An interrupted conversion can simply be run again.
+"""
+import re
+from contextlib import contextmanager
+from datetime import date, datetime
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app.database import db
+
+TABLE = 'test_responses'
+NEW_TABLE = 'test_responses_partitioned'
+OLD_TABLE = 'test_responses_unpartitioned'
+TRIGGER = 'test_responses_dual_write'
+
+STRATEGIES = ('hash', 'range')
+
+# Partitioning key, which the primary key must include
+PARTITION_KEYS = {'hash': 'tenant_id', 'range': 'created_at'}
+
+# Indexes of the partitioned table (created with a _new suffix, renamed at the swap)
+INDEXES = [
+    ('ix_test_responses_test_id', '(test_id)'),
+    ('ix_test_responses_user_id', '(user_id)'),
+    ('ix_test_responses_tenant_user', '(tenant_id, user_id)'),
+    ('ix_test_responses_open', '(test_id, user_id) WHERE NOT is_completed'),
+]
+
+FOREIGN_KEYS = [
+    ('test_id', 'tests'),
+    ('user_id', 'users'),
+    ('tenant_id', 'tenants'),
+]
+
+# Give up on a DDL lock rather than queue application queries behind it
+LOCK_TIMEOUT = '5s'
+
+# Postgres SQLSTATE for deadlock_detected, and tries per copied batch
+DEADLOCK_DETECTED = '40P01'
+COPY_ATTEMPTS = 3
+
+@contextmanager
+def _ddl_connection():
+    """Autocommit connection whose lock waits give up after LOCK_TIMEOUT"""
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}'"))
+        try:
+            yield conn
+        finally:
+            conn.execute(text('RESET lock_timeout'))
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def _table_exists(conn, table):
+    return conn.execute(text('SELECT to_regclass(:table) IS NOT NULL'), {'table': table}).scalar()
+
+def get_strategy(conn, table=TABLE):
+    """
+    Get the partitioning strategy of a table
+
+    Returns:
+        'hash', 'range', 'list', or None if the table is not partitioned
+    """
+    strategy = conn.execute(text(
+        'SELECT partstrat FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)'
+    ), {'table': table}).scalar()
+    return {'h': 'hash', 'r': 'range', 'l': 'list'}.get(strategy)
+
+def _columns(conn, table):
+    return [row[0] for row in conn.execute(text(
+        'SELECT column_name FROM information_schema.columns '
+        'WHERE table_schema = current_schema() AND table_name = :table ORDER BY ordinal_position'
+    ), {'table': table})]
+
+def create_monthly_partitions(conn, parent, first_month, last_month):
+    """
+    Create the missing monthly range partitions from first_month to last_month
+
+    Returns:
+        list of created partition names
+    """
+    created = []
+    month = _month_start(first_month)
+    while month <= last_month:
+        name = f'{TABLE}_y{month.year}m{month.month:02d}'
+        if not _table_exists(conn, name):
+            conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {parent} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+        month = _add_months(month, 1)
+    return created
+
+def _create_partitioned_table(conn, strategy, partitions, months_ahead):
+    key = PARTITION_KEYS[strategy]
+    conn.execute(text(
+        f'CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS) PARTITION BY {strategy.upper()} ({key})'
+    ))
+
+    # The partition key must be part of every unique constraint
+    conn.execute(text(f'ALTER TABLE {NEW_TABLE} ADD CONSTRAINT {NEW_TABLE}_pkey PRIMARY KEY (id, {key})'))
+    for column, target in FOREIGN_KEYS:
+        conn.execute(text(
+            f'ALTER TABLE {NEW_TABLE} ADD FOREIGN KEY ({column}) REFERENCES {target} (id) ON DELETE CASCADE'
+        ))
+
+    if strategy == 'hash':
+        for remainder in range(partitions):
+            conn.execute(text(
+                f'CREATE TABLE {TABLE}_p{remainder:02d} PARTITION OF {NEW_TABLE} '
+                f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+            ))
+    else:
+        oldest = conn.execute(text(f'SELECT MIN(created_at) FROM {TABLE}')).scalar()
+        this_month = _month_start(datetime.utcnow().date())
+        create_monthly_partitions(conn, NEW_TABLE, oldest or this_month, _add_months(this_month, months_ahead))
+        conn.execute(text(f'CREATE TABLE {TABLE}_default PARTITION OF {NEW_TABLE} DEFAULT'))
+
+    # Created on the parent, so every partition gets them
+    for name, definition in INDEXES:
+        conn.execute(text(f'CREATE INDEX {name}_new ON {NEW_TABLE} {definition}'))
+
+def _install_dual_write(conn, columns):
+    """Mirror every later write to the old table into the new one"""
+    values = ', '.join(
+        'COALESCE(NEW.tenant_id, (SELECT tenant_id FROM tests WHERE id = NEW.test_id))'
+        if column == 'tenant_id' else f'NEW.{column}'
+        for column in columns
+    )
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION {TRIGGER}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                DELETE FROM {NEW_TABLE} WHERE id = OLD.id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO {NEW_TABLE} ({', '.join(columns)}) VALUES ({values})
+                ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END $$
+    """))
+    conn.execute(text(f'DROP TRIGGER IF EXISTS {TRIGGER} ON {TABLE}'))
+    conn.execute(text(
+        f'CREATE TRIGGER {TRIGGER} AFTER INSERT OR UPDATE OR DELETE ON {TABLE} '
+        f'FOR EACH ROW EXECUTE FUNCTION {TRIGGER}()'
+    ))
+
+def _copy_rows(conn, columns, batch_size, echo):
+    """
+    Copy the old table's rows in id ranges, each its own transaction
+
+    FOR SHARE makes a concurrent UPDATE or DELETE of a row wait until its
+    batch has committed, so the trigger then replaces or removes the copy;
+    rows the trigger already wrote are skipped by ON CONFLICT.
+    """
+    select = ', '.join(
+        'COALESCE(r.tenant_id, t.tenant_id)' if column == 'tenant_id' else f'r.{column}'
+        for column in columns
+    )
+    last_id = conn.execute(text(f'SELECT COALESCE(MAX(id), 0) FROM {TABLE}')).scalar()
+    copied = 0
+
+    for low in range(0, last_id, batch_size):
+        for attempt in range(COPY_ATTEMPTS):
+            try:
+                result = conn.execute(text(
+                    f'INSERT INTO {NEW_TABLE} ({", ".join(columns)}) '
+                    f'SELECT {select} FROM {TABLE} r JOIN tests t ON t.id = r.test_id '
+                    f'WHERE r.id > :low AND r.id <= :high FOR SHARE OF r '
+                    f'ON CONFLICT DO NOTHING'
+                ), {'low': low, 'high': low + batch_size})
+                break
+            except OperationalError as e:
+                # A write locking several rows can deadlock with a batch; the batch is safe to redo
+                if getattr(e.orig, 'pgcode', None) != DEADLOCK_DETECTED or attempt == COPY_ATTEMPTS - 1:
+                    raise
+        copied += result.rowcount
+        echo(f'copied ids {low + 1}..{min(low + batch_size, last_id)} ({copied} rows)')
+
+    return copied
+
+def _swap():
+    """Put the partitioned table in place; the only step that blocks the table"""
+    with db.engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        conn.execute(text(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE'))
+
+        old_max, new_max = (
+            conn.execute(text(f'SELECT MAX(id) FROM {table}')).scalar() for table in (TABLE, NEW_TABLE)
+        )
+        if old_max != new_max:
+            raise RuntimeError(f'{NEW_TABLE} is behind {TABLE} (max id {new_max} vs {old_max})')
+
+        conn.execute(text(f'DROP TRIGGER {TRIGGER} ON {TABLE}'))
+        conn.execute(text(f'DROP FUNCTION {TRIGGER}()'))
+        conn.execute(text(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}'))
+        conn.execute(text(f'ALTER INDEX IF EXISTS {TABLE}_pkey RENAME TO {OLD_TABLE}_pkey'))
+        for name, _ in INDEXES:
+            conn.execute(text(f'ALTER INDEX IF EXISTS {name} RENAME TO {name}_old'))
+            conn.execute(text(f'ALTER INDEX {name}_new RENAME TO {name}'))
+
+        conn.execute(text(f'ALTER TABLE {NEW_TABLE} RENAME TO {TABLE}'))
+        conn.execute(text(f'ALTER INDEX {NEW_TABLE}_pkey RENAME TO {TABLE}_pkey'))
+        # Keep the id sequence alive when the old table is dropped
+        conn.execute(text(f'ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id'))
+
+def partition_test_responses(strategy='hash', partitions=16, months_ahead=3, batch_size=10000,
+                             drop_old=False, echo=print):
+    """
+    Convert test_responses into a partitioned table without taking it offline
+
+    Args:
+        strategy: 'hash' (by tenant_id) or 'range' (monthly by created_at)
+        partitions: Number of hash partitions
+        months_ahead: Monthly range partitions to create beyond the current month
+        batch_size: Rows copied per transaction
+        drop_old: Drop the unpartitioned table after the swap
+        echo: Progress callback
+
+    Returns:
+        Number of rows copied
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f'strategy must be one of {", ".join(STRATEGIES)}')
+    if partitions < 1:
+        raise ValueError('partitions must be at least 1')
+
+    with _ddl_connection() as conn:
+        if get_strategy(conn):
+            raise RuntimeError(f'{TABLE} is already partitioned by {get_strategy(conn)}')
+
+        if _table_exists(conn, NEW_TABLE):
+            if get_strategy(conn, NEW_TABLE) != strategy:
+                raise RuntimeError(f'{NEW_TABLE} from an earlier run is partitioned by {get_strategy(conn, NEW_TABLE)}')
+            echo(f'Resuming with the existing {NEW_TABLE}')
+        else:
+            echo(f'Creating {NEW_TABLE} ({strategy} partitioned by {PARTITION_KEYS[strategy]})')
+            _create_partitioned_table(conn, strategy, partitions, months_ahead)
+
+        columns = _columns(conn, TABLE)
+        _install_dual_write(conn, columns)
+        copied = _copy_rows(conn, columns, batch_size, echo)
+
+        conn.execute(text(f'ANALYZE {NEW_TABLE}'))
+        _swap()
+        echo(f'{TABLE} is now partitioned by {PARTITION_KEYS[strategy]}; the old table is {OLD_TABLE}')
+
+        if drop_old:
+            conn.execute(text(f'DROP TABLE {OLD_TABLE}'))
+            echo(f'Dropped {OLD_TABLE}')
+
+    return copied
+
+def _range_partitions(conn):
+    """Get (name, upper bound) of each monthly partition of test_responses"""
+    rows = conn.execute(text(
+        'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)'
+    ), {'table': TABLE})
+
+    partitions = []
+    for name, bound in rows:
+        match = re.search(r"TO \('([^']+)'\)", bound)
+        if match:
+            partitions.append((name, datetime.fromisoformat(match.group(1))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def add_test_response_partitions(months_ahead=3):
+    """
+    Create the monthly partitions up to months_ahead beyond the current month
+
+    Returns:
+        list of created partition names
+    """
+    with _ddl_connection() as conn:
+        if get_strategy(conn) != 'range':
+            raise RuntimeError(f'{TABLE} is not range partitioned')
+
+        this_month = _month_start(datetime.utcnow().date())
+        return create_monthly_partitions(conn, TABLE, this_month, _add_months(this_month, months_ahead))
+
+def drop_test_response_partitions(older_than_months, dry_run=False):
+    """
+    Retention: drop the monthly partitions that end before the cutoff
+
+    Dropping a partition takes an ACCESS EXCLUSIVE lock on the parent only
+    for the catalog change, not for deleting its rows one by one.
+
+    Args:
+        older_than_months: Keep this many whole months before the current one
+        dry_run: Only report what would be dropped
+
+    Returns:
+        list of dropped partition names
+    """
+    if older_than_months < 0:
+        raise ValueError('older_than_months must not be negative')
+
+    with _ddl_connection() as conn:
+        if get_strategy(conn) != 'range':
+            raise RuntimeError(f'{TABLE} is not range partitioned; retention by partition needs --strategy range')
+
+        cutoff = _add_months(_month_start(datetime.utcnow().date()), -older_than_months)
+        expired = [name for name, upper in _range_partitions(conn) if upper.date() <= cutoff]
+
+        if not dry_run:
+            for name in expired:
+                conn.execute(text(f'DROP TABLE {name}'))
+        return expired
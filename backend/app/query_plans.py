@@ -0,0 +1,94 @@
+"""
+Plan checks for the hot query shapes
+
+Each hot filter has an index built for it (migrations 0003 and 0004).
+check_query_plans() EXPLAINs every shape with parameters taken from
+existing rows, leaving the planner's costs alone, and reports each shape
+whose plan does not use its own index. Another index counts as a
+failure: the older single-column indexes can serve every shape, just
+worse, so "no sequential scan" would not notice a lost or unused index.
+
+Plans depend on table statistics, so check against realistic volumes: a
+copy of production, or the database seeded by tests/test_query_plans.py.
+"""
+from sqlalchemy import text
+from app.database import db
+
+# Hot query shape -> the index built for it
+HOT_QUERY_INDEXES = {
+    'employees by tenant and role': 'ix_users_tenant_role',
+    'users by tenant and role': 'ix_users_tenant_role',
+    'active users by tenant': 'ix_users_tenant_active',
+    'login by email': 'ix_users_email_active',
+    'open test response': 'ix_test_responses_open',
+    'responses by tenant and user': 'ix_test_responses_tenant_user',
+    'active tests by tenant': 'ix_tests_tenant_active'
+}
+
+def hot_queries():
+    """Build each hot query shape, with parameters taken from existing rows"""
+    from app.models.user import User
+    from app.models.test import Test, TestResponse
+
+    tenant_id, email = db.session.query(User.tenant_id, User.email).filter_by(
+        is_active=True).order_by(User.id).first() or (1, 'user@example.com')
+    test_id, user_id, response_tenant_id = db.session.query(
+        TestResponse.test_id, TestResponse.user_id, TestResponse.tenant_id
+    ).filter_by(is_completed=False).order_by(TestResponse.id).first() or (1, 1, 1)
+    test_tenant_id = db.session.query(Test.tenant_id).order_by(Test.id).limit(1).scalar() or 1
+
+    return {
+        'employees by tenant and role': User.query.filter_by(tenant_id=tenant_id).filter(
+            User.role.in_(['employee', 'manager', 'sales_rep'])),
+        'users by tenant and role': User.query.filter_by(tenant_id=tenant_id, role='user'),
+        'active users by tenant': User.query.filter_by(tenant_id=tenant_id, is_active=True),
+        'login by email': User.query.filter_by(email=email, is_active=True),
+        'open test response': TestResponse.query.filter_by(
+            tenant_id=response_tenant_id, test_id=test_id, user_id=user_id, is_completed=False),
+        'responses by tenant and user': TestResponse.query.filter_by(tenant_id=response_tenant_id, user_id=user_id),
+        'active tests by tenant': Test.query.filter_by(tenant_id=test_tenant_id, is_active=True)
+    }
+
+def _plan_nodes(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan"""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+def _root_index(name):
+    """Name of the partitioned index a partition's index belongs to, or the index itself"""
+    return db.session.execute(text(
+        'SELECT pg_partition_root(to_regclass(:index))::text'
+    ), {'index': name}).scalar() or name
+
+def plan_indexes(query):
+    """
+    Get the names of the indexes a query's plan reads (PostgreSQL only)
+
+    On a partitioned table (see app/partitioning.py) the plan reads each
+    partition's index; those are reported as the index on the parent.
+    """
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()[0]['Plan']
+    names = [node['Index Name'] for node in _plan_nodes(plan) if node.get('Index Name')]
+    return list(dict.fromkeys(_root_index(name) for name in names))
+
+def check_query_plans(echo=print):
+    """
+    EXPLAIN every hot query shape and report whether it uses its index
+
+    Returns:
+        Number of shapes whose plan does not use their index
+    """
+    queries = hot_queries()
+    failures = 0
+
+    for name, index in HOT_QUERY_INDEXES.items():
+        used = plan_indexes(queries[name])
+        if index in used:
+            echo(f'ok    {name} ({index})')
+        else:
+            failures += 1
+            echo(f'FAIL  {name}: expected {index}, plan uses {", ".join(used) or "a sequential scan"}')
+
+    return failures
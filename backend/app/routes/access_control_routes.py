@@ -1,8 +1,13 @@
-from flask import Blueprint, request, jsonify
+import hashlib
+from flask import Blueprint, request, jsonify, make_response
 from app.database import db
 from app.models.access_matrix import AccessMatrix
 from app.utils.jwt_manager import token_required
-from app.utils.rbac import role_required, get_user_tenant_id, get_default_permissions
+from app.utils.rbac import role_required, get_user_tenant_id, bump_matrix_version
+from app.utils.initialize_rbac import (
+    initialize_default_access_matrix, bulk_initialize_default_access_matrix, unknown_tenant_ids
+)
+from app.utils.deadline import latency_budget
 
 # Create Blueprint
 access_control_bp = Blueprint('access_control', __name__, url_prefix='/api/access-control')
@@ -84,6 +89,7 @@ def create_access_matrix():
             existing.permissions = data['permissions']
             existing.description = data.get('description')
             existing.is_active = data.get('is_active', True)
+            bump_matrix_version()
             db.session.commit()
             
             return jsonify({
@@ -101,6 +107,7 @@ def create_access_matrix():
             )
             
             db.session.add(matrix)
+            bump_matrix_version()
             db.session.commit()
             
             return jsonify({
@@ -138,6 +145,7 @@ def update_access_matrix(matrix_id):
         if 'is_active' in data:
             matrix.is_active = data['is_active']
         
+        bump_matrix_version()
         db.session.commit()
         
         return jsonify({
@@ -156,50 +164,51 @@ def initialize_default_matrix():
     """Initialize default access matrix for all roles"""
     try:
         tenant_id = get_user_tenant_id()
-        default_perms = get_default_permissions()
+        result = initialize_default_access_matrix(tenant_id if tenant_id else None)
         
-        created = []
-        updated = []
+        return jsonify({
+            'message': 'Default access matrix initialized',
+            'created': result['created'],
+            'updated': result['updated']
+        }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@access_control_bp.route('/initialize-default-matrix/bulk', methods=['POST'])
+@latency_budget(600000)
+@token_required(user_types=['admin'])
+@role_required('super_admin')
+def bulk_initialize_default_matrix():
+    """Initialize the default access matrix for many tenants in batched transactions"""
+    try:
+        data = request.get_json() or {}
+        tenant_ids = data.get('tenant_ids')
+        batch_size = data.get('batch_size', 500)
         
-        for role, permissions in default_perms.items():
-            # Skip super_admin if not admin
-            if role == 'super_admin' and not tenant_id is None:
-                continue
-            
-            existing = None
-            if tenant_id:
-                existing = AccessMatrix.query.filter_by(
-                    tenant_id=tenant_id,
-                    role=role
-                ).first()
-            else:
-                existing = AccessMatrix.query.filter_by(
-                    tenant_id=None,
-                    role=role
-                ).first()
+        if not data.get('all_tenants'):
+            if not isinstance(tenant_ids, list) or not tenant_ids:
+                return jsonify({'error': 'tenant_ids (non-empty list) or all_tenants is required'}), 400
+            if not all(isinstance(tenant_id, int) for tenant_id in tenant_ids):
+                return jsonify({'error': 'tenant_ids must be integers'}), 400
             
-            if existing:
-                existing.permissions = permissions
-                existing.is_active = True
-                updated.append(role)
-            else:
-                matrix = AccessMatrix(
-                    tenant_id=tenant_id if tenant_id else None,
-                    role=role,
-                    permissions=permissions,
-                    description=f'Default permissions for {role}',
-                    is_active=True
-                )
-                db.session.add(matrix)
-                created.append(role)
+            # An unknown tenant would fail the foreign key and roll back its whole batch
+            unknown = unknown_tenant_ids(tenant_ids)
+            if unknown:
+                return jsonify({'error': 'Unknown tenant_ids', 'unknown_tenant_ids': unknown}), 400
+        else:
+            tenant_ids = None
         
-        db.session.commit()
+        if not isinstance(batch_size, int) or not 1 <= batch_size <= 5000:
+            return jsonify({'error': 'batch_size must be between 1 and 5000'}), 400
+        
+        result = bulk_initialize_default_access_matrix(tenant_ids, batch_size=batch_size)
         
         return jsonify({
             'message': 'Default access matrix initialized',
-            'created': created,
-            'updated': updated
-        }), 201
+            **result
+        }), 200
     
     except Exception as e:
         db.session.rollback()
@@ -237,3 +246,76 @@ def check_permission():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@access_control_bp.route('/check-permissions', methods=['POST'])
+@token_required(user_types=['tenant', 'admin', 'user'])
+def check_permissions():
+    """Check several (resource, action) pairs for the current user in one call"""
+    try:
+        from app.utils.rbac import get_user_role_from_token, has_permission, get_user_tenant_id
+        
+        data = request.get_json()
+        checks = data.get('checks') if data else None
+        
+        if not isinstance(checks, list) or not checks:
+            return jsonify({'error': 'checks must be a non-empty list of {resource, action}'}), 400
+        
+        role = get_user_role_from_token()
+        tenant_id = get_user_tenant_id()
+        
+        if not role:
+            return jsonify({'error': 'Unable to determine user role'}), 403
+        
+        results = []
+        for check in checks:
+            resource = check.get('resource') if isinstance(check, dict) else None
+            action = check.get('action') if isinstance(check, dict) else None
+            
+            if not resource or not action:
+                return jsonify({'error': 'Each check requires resource and action'}), 400
+            
+            results.append({
+                'resource': resource,
+                'action': action,
+                'has_permission': has_permission(role, tenant_id, resource, action)
+            })
+        
+        return jsonify({
+            'role': role,
+            'results': results
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@access_control_bp.route('/my-permissions', methods=['GET'])
+@token_required(user_types=['tenant', 'admin', 'user'])
+def get_my_permissions():
+    """Get the current user's full effective permission map (supports ETag / If-None-Match)"""
+    try:
+        from app.utils.rbac import get_user_role_from_token, get_user_tenant_id, get_matrix_version, get_effective_permissions
+        
+        role = get_user_role_from_token()
+        tenant_id = get_user_tenant_id()
+        
+        if not role:
+            return jsonify({'error': 'Unable to determine user role'}), 403
+        
+        # The map only changes with the role, the tenant or the access matrix version
+        etag = hashlib.sha256(f'{role}:{tenant_id}:{get_matrix_version()}'.encode('utf-8')).hexdigest()[:32]
+        
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(jsonify({
+                'role': role,
+                'tenant_id': tenant_id,
+                'permissions': get_effective_permissions(role, tenant_id)
+            }), 200)
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
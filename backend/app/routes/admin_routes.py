@@ -3,7 +3,22 @@ from app.database import db
 from app.models.admin import Admin
 from app.models.tenant import Tenant
 from app.utils.auth import authenticate_admin, hash_password
+from app.utils.password_hasher import PasswordHasherBusy, hasher_busy_response
+from app.utils.login_throttle import login_throttle, throttled_response
 from app.utils.jwt_manager import create_access_token, token_required
+from app.utils.jsonb import jsonb_merge
+from app.utils.deadline import latency_budget
+from app.utils.refresh_tokens import issue_refresh_token
+from app.utils.sharding import (
+    DEFAULT_SHARD,
+    drop_tenant_row,
+    each_shard,
+    place_tenant,
+    shard_map,
+    shard_names,
+    sharding_enabled,
+    use_tenant
+)
 from app.utils.validators import (
     validate_email_format, 
     validate_password_strength,
@@ -30,12 +45,20 @@ def admin_login():
         email = data['email']
         password = data['password']
         
+        # Reject over-limit attempts before any DB or bcrypt work
+        retry_after = login_throttle.check('admin', email, request.remote_addr)
+        if retry_after:
+            return throttled_response(retry_after)
+        
         # Authenticate admin
         admin = authenticate_admin(email, password)
         
         if not admin:
+            login_throttle.record_failure('admin', email, request.remote_addr)
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        login_throttle.record_success('admin', email, request.remote_addr)
+        
         # Create JWT token
         token = create_access_token(
             user_id=admin.id,
@@ -47,9 +70,13 @@ def admin_login():
         return jsonify({
             'message': 'Login successful',
             'token': token,
-            'admin': admin.to_dict()
+            'admin': admin.to_dict(),
+            'refresh_token': issue_refresh_token(admin.id, 'admin')
         }), 200
     
+    except PasswordHasherBusy as e:
+        return hasher_busy_response(e)
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -166,6 +193,9 @@ def create_tenant():
                 return jsonify({'error': result}), 400
             metadata['pan'] = result
         
+        if data.get('shard') and data['shard'] not in shard_names():
+            return jsonify({'error': f'Unknown shard: {data["shard"]}'}), 400
+        
         # Hash admin password
         hashed_password = hash_password(data['admin_password'])
         
@@ -185,11 +215,19 @@ def create_tenant():
         db.session.add(tenant)
         db.session.commit()
         
+        # Place the tenant's data on the shard for new tenants
+        place_tenant(tenant.id, data.get('shard'))
+        db.session.commit()
+        
         return jsonify({
             'message': 'Tenant created successfully',
             'tenant': tenant.to_dict()
         }), 201
     
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -261,24 +299,23 @@ def update_tenant(tenant_id):
             tenant.subscription_status = data['subscription_status']
         
         if data.get('metadata'):
-            # Merge metadata
-            current_metadata = tenant.business_metadata or {}
-            current_metadata.update(data['metadata'])
+            metadata_patch = dict(data['metadata'])
             
-            # Validate GST and PAN if provided
-            if current_metadata.get('gst'):
-                is_valid, result = validate_gst_number(current_metadata['gst'])
+            # Validate GST and PAN if provided (stored values were validated when set)
+            if metadata_patch.get('gst'):
+                is_valid, result = validate_gst_number(metadata_patch['gst'])
                 if not is_valid:
                     return jsonify({'error': result}), 400
-                current_metadata['gst'] = result
+                metadata_patch['gst'] = result
             
-            if current_metadata.get('pan'):
-                is_valid, result = validate_pan_number(current_metadata['pan'])
+            if metadata_patch.get('pan'):
+                is_valid, result = validate_pan_number(metadata_patch['pan'])
                 if not is_valid:
                     return jsonify({'error': result}), 400
-                current_metadata['pan'] = result
+                metadata_patch['pan'] = result
             
-            tenant.business_metadata = current_metadata
+            # Merge metadata server-side
+            tenant.business_metadata = jsonb_merge(Tenant.business_metadata, metadata_patch)
         
         db.session.commit()
         
@@ -287,6 +324,10 @@ def update_tenant(tenant_id):
             'tenant': tenant.to_dict()
         }), 200
     
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -302,11 +343,17 @@ def delete_tenant(tenant_id):
             return jsonify({'error': 'Tenant not found'}), 404
         
         tenant_name = tenant.name
+        shard = shard_map.lookup(tenant_id)[0] if sharding_enabled() else DEFAULT_SHARD
         
         # Delete tenant (users will be deleted due to cascade)
+        use_tenant(tenant_id)
         db.session.delete(tenant)
         db.session.commit()
         
+        # The rest of its data goes with its row on the shard
+        drop_tenant_row(tenant_id, shard)
+        shard_map.invalidate(tenant_id)
+        
         return jsonify({
             'message': f'Tenant "{tenant_name}" deleted successfully'
         }), 200
@@ -316,6 +363,7 @@ def delete_tenant(tenant_id):
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/dashboard', methods=['GET'])
+@latency_budget(15000)
 @token_required(user_types=['admin'])
 def admin_dashboard():
     """Get admin dashboard stats"""
@@ -324,7 +372,7 @@ def admin_dashboard():
         active_tenants = Tenant.query.filter_by(is_active=True).count()
         
         from app.models.user import User
-        total_users = User.query.count()
+        total_users = sum(User.query.count() for _ in each_shard())
         
         return jsonify({
             'stats': {
@@ -0,0 +1,96 @@
+from flask import Blueprint, request, jsonify
+from app.database import db
+from app.models.admin import Admin
+from app.models.tenant import Tenant
+from app.models.user import User
+from app.utils.jwt_manager import create_access_token, token_required, revoke_access_token
+from app.utils.refresh_tokens import (
+    InvalidRefreshToken,
+    rotate_refresh_token,
+    revoke_refresh_token,
+    revoke_refresh_family
+)
+from app.routes.user_routes import create_user_token
+from app.utils.sharding import use_tenant
+
+# Create Blueprint
+auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
+
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh():
+    """Exchange a refresh token for a new access token and a rotated refresh token"""
+    try:
+        data = request.get_json()
+        
+        if not data or not data.get('refresh_token'):
+            return jsonify({'error': 'refresh_token is required'}), 400
+        
+        try:
+            record, refresh_token = rotate_refresh_token(data['refresh_token'])
+        except InvalidRefreshToken as e:
+            return jsonify({'error': str(e)}), 401
+        
+        # Re-read the account so deactivations and role changes take effect
+        if record.user_type == 'admin':
+            admin = Admin.query.get(record.user_id)
+            if admin and admin.is_active:
+                token = create_access_token(
+                    user_id=admin.id,
+                    user_type='admin',
+                    email=admin.email,
+                    role='super_admin'
+                )
+            else:
+                token = None
+        elif record.user_type == 'tenant':
+            tenant = Tenant.query.get(record.user_id)
+            if tenant and tenant.is_active:
+                token = create_access_token(
+                    user_id=tenant.id,
+                    user_type='tenant',
+                    email=tenant.admin_email,
+                    tenant_id=tenant.id,
+                    role='tenant_admin'
+                )
+            else:
+                token = None
+        else:
+            use_tenant(record.tenant_id)
+            user = User.query.get(record.user_id)
+            if user and user.is_active and not user.password_reset_required:
+                token = create_user_token(user)
+            else:
+                token = None
+        
+        if not token:
+            revoke_refresh_family(record.family_id)
+            return jsonify({'error': 'Account is no longer active'}), 401
+        
+        return jsonify({
+            'message': 'Token refreshed',
+            'token': token,
+            'refresh_token': refresh_token
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@auth_bp.route('/logout', methods=['POST'])
+@token_required()
+def logout():
+    """Revoke the current access token and, if given, its refresh token family"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        revoke_access_token(request.current_user)
+        db.session.commit()
+        
+        if data.get('refresh_token'):
+            revoke_refresh_token(data['refresh_token'])
+        
+        return jsonify({'message': 'Logged out successfully'}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
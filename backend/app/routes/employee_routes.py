@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from app.database import db
 from app.models.user import User
+from app.utils.password_hasher import PasswordHasherBusy, hasher_busy_response
 from app.utils.jwt_manager import token_required
+from app.utils.jsonb import jsonb_merge
 from app.utils.rbac import permission_required, role_required, get_user_role_from_token, get_user_tenant_id
 from app.utils.auth import hash_password, generate_temp_password
 from app.utils.validators import validate_email_format, validate_password_strength, validate_phone_number
@@ -150,6 +152,10 @@ def create_employee():
             'employee': response_data
         }), 201
     
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -211,9 +217,8 @@ def update_employee(employee_id):
             employee.is_active = data['is_active']
         
         if data.get('profile_data'):
-            current_profile = employee.profile_data or {}
-            current_profile.update(data['profile_data'])
-            employee.profile_data = current_profile
+            # Merge the given keys server-side
+            employee.profile_data = jsonb_merge(User.profile_data, data['profile_data'])
         
         db.session.commit()
         
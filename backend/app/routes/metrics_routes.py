@@ -0,0 +1,15 @@
+from flask import Blueprint, jsonify
+from app.utils.jwt_manager import token_required
+from app.utils.metrics import metrics
+
+# Create Blueprint
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/api/metrics')
+
+@metrics_bp.route('', methods=['GET'])
+@token_required(user_types=['admin'])
+def get_metrics():
+    """Get in-process metrics for this worker - Admin only"""
+    try:
+        return jsonify(metrics.snapshot()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -3,7 +3,12 @@ from app.database import db
 from app.models.tenant import Tenant
 from app.models.user import User
 from app.utils.auth import authenticate_tenant, hash_password, generate_temp_password
+from app.utils.password_hasher import PasswordHasherBusy, hasher_busy_response
+from app.utils.login_throttle import login_throttle, throttled_response
 from app.utils.jwt_manager import create_access_token, token_required
+from app.utils.jsonb import jsonb_merge
+from app.utils.deadline import latency_budget
+from app.utils.refresh_tokens import issue_refresh_token
 from app.utils.validators import (
     validate_email_format,
     validate_password_strength,
@@ -26,12 +31,20 @@ def tenant_login():
         email = data['email']
         password = data['password']
         
+        # Reject over-limit attempts before any DB or bcrypt work
+        retry_after = login_throttle.check('tenant', email, request.remote_addr)
+        if retry_after:
+            return throttled_response(retry_after)
+        
         # Authenticate tenant
         tenant = authenticate_tenant(email, password)
         
         if not tenant:
+            login_throttle.record_failure('tenant', email, request.remote_addr)
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        login_throttle.record_success('tenant', email, request.remote_addr)
+        
         # Create JWT token
         token = create_access_token(
             user_id=tenant.id,
@@ -44,9 +57,13 @@ def tenant_login():
         return jsonify({
             'message': 'Login successful',
             'token': token,
-            'tenant': tenant.to_dict()
+            'tenant': tenant.to_dict(),
+            'refresh_token': issue_refresh_token(tenant.id, 'tenant', tenant.id)
         }), 200
     
+    except PasswordHasherBusy as e:
+        return hasher_busy_response(e)
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -90,9 +107,7 @@ def update_tenant_profile():
             tenant.admin_name = data['admin_name']
         
         if data.get('metadata'):
-            current_metadata = tenant.business_metadata or {}
-            current_metadata.update(data['metadata'])
-            tenant.business_metadata = current_metadata
+            tenant.business_metadata = jsonb_merge(Tenant.business_metadata, data['metadata'])
         
         db.session.commit()
         
@@ -261,6 +276,10 @@ def create_user():
                 'user': user.to_dict()
             }), 201
     
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -302,9 +321,8 @@ def update_user(user_id):
             user.is_active = data['is_active']
         
         if data.get('profile_data'):
-            current_profile = user.profile_data or {}
-            current_profile.update(data['profile_data'])
-            user.profile_data = current_profile
+            # Merge the given keys server-side
+            user.profile_data = jsonb_merge(User.profile_data, data['profile_data'])
         
         db.session.commit()
         
@@ -346,6 +364,7 @@ def delete_user(user_id):
         return jsonify({'error': str(e)}), 500
 
 @tenant_bp.route('/dashboard', methods=['GET'])
+@latency_budget(15000)
 @token_required(user_types=['tenant'])
 def tenant_dashboard():
     """Get tenant dashboard stats"""
@@ -1,10 +1,21 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, current_app, request, jsonify, send_from_directory
 from app.database import db
-from app.models.test import Test, Question, TestResponse
+from app.models.test import QUESTION_ORDER, Test, Question, TestResponse
 from app.models.user import User
 from app.utils.jwt_manager import token_required
+from app.utils.jsonb import jsonb_merge
+from app.utils.answer_buffer import answer_buffer
+from app.utils.sharding import each_shard, shard_names, use_tenant
+from app.utils.query_budget import query_budget
+from app.utils import question_order
+from app.utils.definition_cache import (
+    bump_content_version, current_definition, definition_cache, definition_for, with_definition
+)
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload, undefer
 from werkzeug.utils import secure_filename
 import os
+import json
 from datetime import datetime
 
 # Create Blueprint
@@ -18,6 +29,7 @@ def allowed_file(filename):
 # ==================== TENANT/ADMIN TEST MANAGEMENT ====================
 
 @test_bp.route('/tests', methods=['GET'])
+@query_budget(lambda: len(shard_names()))
 @token_required(user_types=['tenant', 'admin', 'user'])
 def get_tests():
     """Get all tests for tenant/admin/user"""
@@ -25,25 +37,31 @@ def get_tests():
         user_type = request.current_user.get('user_type')
         tenant_id = request.current_user.get('tenant_id')
         
+        # Question counts come with the tests, from one statement per shard
+        active_tests = Test.query.options(undefer(Test.questions_count)).filter_by(is_active=True)
+        
         if user_type == 'admin':
-            # Admin can see all tests
-            tests = Test.query.filter_by(is_active=True).all()
+            # Admin can see all tests, on every tenant shard
+            tests = []
+            for _ in each_shard():
+                tests.extend(test.to_dict() for test in active_tests.all())
         elif user_type == 'tenant' and tenant_id:
             # Tenant can see their tests
-            tests = Test.query.filter_by(tenant_id=tenant_id, is_active=True).all()
+            tests = [test.to_dict() for test in active_tests.filter_by(tenant_id=tenant_id).all()]
         elif user_type == 'user' and tenant_id:
             # User can see active tests from their tenant
-            tests = Test.query.filter_by(tenant_id=tenant_id, is_active=True).all()
+            tests = [test.to_dict() for test in active_tests.filter_by(tenant_id=tenant_id).all()]
         else:
             tests = []
         
         return jsonify({
-            'tests': [test.to_dict() for test in tests]
+            'tests': tests
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/tests', methods=['POST'])
+@query_budget(3)
 @token_required(user_types=['tenant', 'admin'])
 def create_test():
     """Create a new test"""
@@ -53,6 +71,7 @@ def create_test():
         
         if not tenant_id:
             return jsonify({'error': 'tenant_id is required'}), 400
+        use_tenant(tenant_id)
         
         if not data.get('title'):
             return jsonify({'error': 'title is required'}), 400
@@ -76,22 +95,30 @@ def create_test():
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/tests/<int:test_id>', methods=['GET'])
+@query_budget(3)
 @token_required(user_types=['tenant', 'admin', 'user'])
 def get_test(test_id):
-    """Get test with questions"""
+    """Get test with questions (cached, answers If-None-Match with 304)"""
     try:
-        test = Test.query.get(test_id)
-        if not test:
+        entry = current_definition(test_id)
+        if not entry:
             return jsonify({'error': 'Test not found'}), 404
         
-        test_dict = test.to_dict()
-        test_dict['questions'] = [q.to_dict() for q in test.questions]
-        
-        return jsonify({'test': test_dict}), 200
+        if request.if_none_match.contains(entry.etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(
+                b'{"test":' + entry.body + b'}',
+                mimetype='application/json'
+            )
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/tests/<int:test_id>', methods=['PUT'])
+@query_budget(5)
 @token_required(user_types=['tenant', 'admin'])
 def update_test(test_id):
     """Update test"""
@@ -108,7 +135,9 @@ def update_test(test_id):
         if 'is_active' in data:
             test.is_active = data['is_active']
         
+        bump_content_version(test_id)
         db.session.commit()
+        definition_cache.invalidate(test_id)
         
         return jsonify({
             'message': 'Test updated successfully',
@@ -119,6 +148,7 @@ def update_test(test_id):
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/tests/<int:test_id>', methods=['DELETE'])
+@query_budget(6)
 @token_required(user_types=['tenant', 'admin'])
 def delete_test(test_id):
     """Delete test"""
@@ -129,6 +159,7 @@ def delete_test(test_id):
         
         db.session.delete(test)
         db.session.commit()
+        definition_cache.invalidate(test_id)
         
         return jsonify({'message': 'Test deleted successfully'}), 200
     except Exception as e:
@@ -138,6 +169,7 @@ def delete_test(test_id):
 # ==================== QUESTION MANAGEMENT ====================
 
 @test_bp.route('/tests/<int:test_id>/questions', methods=['GET'])
+@query_budget(2)
 @token_required(user_types=['tenant', 'admin'])
 def get_questions(test_id):
     """Get all questions for a test"""
@@ -146,7 +178,7 @@ def get_questions(test_id):
         if not test:
             return jsonify({'error': 'Test not found'}), 404
         
-        questions = Question.query.filter_by(test_id=test_id).order_by(Question.priority_order).all()
+        questions = Question.query.filter_by(test_id=test_id).order_by(*QUESTION_ORDER).all()
         
         return jsonify({
             'questions': [q.to_dict() for q in questions]
@@ -155,6 +187,7 @@ def get_questions(test_id):
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/tests/<int:test_id>/questions', methods=['POST'])
+@query_budget(5)
 @token_required(user_types=['tenant', 'admin'])
 def create_question(test_id):
     """Create a new question"""
@@ -186,7 +219,9 @@ def create_question(test_id):
         )
         
         db.session.add(question)
+        bump_content_version(test_id)
         db.session.commit()
+        definition_cache.invalidate(test_id)
         
         return jsonify({
             'message': 'Question created successfully',
@@ -197,6 +232,7 @@ def create_question(test_id):
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/questions/<int:question_id>', methods=['PUT'])
+@query_budget(4)
 @token_required(user_types=['tenant', 'admin'])
 def update_question(question_id):
     """Update question"""
@@ -216,12 +252,16 @@ def update_question(question_id):
             question.options = data['options']
         if data.get('priority_order') is not None:
             question.priority_order = data['priority_order']
+            question.order_rank = ''
         if 'is_required' in data:
             question.is_required = data['is_required']
         if data.get('placeholder') is not None:
             question.placeholder = data['placeholder']
         
+        test_id = question.test_id
+        bump_content_version(test_id)
         db.session.commit()
+        definition_cache.invalidate(test_id)
         
         return jsonify({
             'message': 'Question updated successfully',
@@ -232,6 +272,7 @@ def update_question(question_id):
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/questions/<int:question_id>', methods=['DELETE'])
+@query_budget(3)
 @token_required(user_types=['tenant', 'admin'])
 def delete_question(question_id):
     """Delete question"""
@@ -240,8 +281,11 @@ def delete_question(question_id):
         if not question:
             return jsonify({'error': 'Question not found'}), 404
         
+        test_id = question.test_id
         db.session.delete(question)
+        bump_content_version(test_id)
         db.session.commit()
+        definition_cache.invalidate(test_id)
         
         return jsonify({'message': 'Question deleted successfully'}), 200
     except Exception as e:
@@ -249,31 +293,65 @@ def delete_question(question_id):
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/tests/<int:test_id>/questions/reorder', methods=['POST'])
+@query_budget(2)
 @token_required(user_types=['tenant', 'admin'])
 def reorder_questions(test_id):
-    """Update priority order of questions"""
+    """Update priority order of questions (one UPDATE for the whole list)"""
     try:
         data = request.get_json()
         question_orders = data.get('question_orders', [])  # [{question_id: priority_order}, ...]
         
-        for item in question_orders:
-            question_id = item.get('question_id')
-            priority_order = item.get('priority_order')
-            if question_id and priority_order is not None:
-                question = Question.query.get(question_id)
-                if question and question.test_id == test_id:
-                    question.priority_order = priority_order
+        priority_orders = {
+            item['question_id']: item['priority_order']
+            for item in question_orders
+            if item.get('question_id') and item.get('priority_order') is not None
+        }
+        question_order.set_priority_orders(test_id, priority_orders)
         
+        bump_content_version(test_id)
         db.session.commit()
+        definition_cache.invalidate(test_id)
         
         return jsonify({'message': 'Questions reordered successfully'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@test_bp.route('/questions/<int:question_id>/move', methods=['POST'])
+@query_budget(8)
+@token_required(user_types=['tenant', 'admin'])
+def move_question(question_id):
+    """Move a question right after another one (or to the top), updating only its row"""
+    try:
+        question = Question.query.get(question_id)
+        if not question:
+            return jsonify({'error': 'Question not found'}), 404
+        
+        data = request.get_json() or {}
+        after = None
+        if data.get('after_question_id') is not None:
+            after = Question.query.get(data['after_question_id'])
+            if not after or after.test_id != question.test_id or after.id == question.id:
+                return jsonify({'error': 'after_question_id must be another question of the same test'}), 400
+        
+        test_id = question.test_id
+        question_order.move_question(question, after)
+        bump_content_version(test_id)
+        db.session.commit()
+        definition_cache.invalidate(test_id)
+        
+        return jsonify({
+            'message': 'Question moved successfully',
+            'question': question.to_dict()
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 # ==================== USER TEST TAKING ====================
 
 @test_bp.route('/tests/<int:test_id>/start', methods=['POST'])
+@query_budget(5)
 @token_required(user_types=['user'])
 def start_test(test_id):
     """Start a test - creates a new test response"""
@@ -286,6 +364,7 @@ def start_test(test_id):
         
         # Check if user already has an incomplete response
         existing_response = TestResponse.query.filter_by(
+            tenant_id=test.tenant_id,
             test_id=test_id,
             user_id=user_id,
             is_completed=False
@@ -301,59 +380,135 @@ def start_test(test_id):
         response = TestResponse(
             test_id=test_id,
             user_id=user_id,
+            tenant_id=test.tenant_id,
             responses={},
             is_completed=False
         )
         
+        # Cached test with questions ordered by priority (taken before the commit expires the test)
+        definition = definition_for(test)
+        
         db.session.add(response)
         db.session.commit()
         
-        # Get test with questions ordered by priority
-        test_dict = test.to_dict()
-        test_dict['questions'] = [q.to_dict() for q in test.questions]
+        return current_app.response_class(
+            with_definition({'message': 'Test started', 'response': response.to_dict()}, definition),
+            status=201,
+            mimetype='application/json'
+        )
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def get_caller_response(response_id, *options):
+    """
+    Get a test response by ID within the caller's tenant
+    
+    With hash partitioning the tenant is part of the response's key, so the
+    lookup reads a single partition. Range partitions are keyed by
+    (id, created_at), so an ID lookup probes every month's partition.
+    
+    Args:
+        response_id: Test response ID
+        options: Loader options, e.g. to load the test along with it
+    """
+    from app.config import Config
+    tenant_id = request.current_user.get('tenant_id')
+    if Config.TEST_RESPONSE_PARTITION_STRATEGY == 'hash':
+        return TestResponse.query.options(*options).get((response_id, tenant_id))
+    return TestResponse.query.options(*options).filter_by(id=response_id, tenant_id=tenant_id).one_or_none()
+
+def merge_answers(response_id, answers):
+    """
+    Merge answers into the caller's open test response without loading it
+    
+    One UPDATE ... SET responses = responses || answers ... RETURNING, so
+    concurrent saves of different questions (e.g. from two tabs) all land.
+    
+    Args:
+        response_id: Test response ID
+        answers: dict of question ID to answer
+    
+    Returns:
+        New answers_version, or None if the caller has no open response with that ID
+    """
+    return db.session.execute(
+        update(TestResponse)
+        .where(
+            TestResponse.id == response_id,
+            TestResponse.tenant_id == request.current_user.get('tenant_id'),
+            TestResponse.user_id == request.current_user['user_id'],
+            TestResponse.is_completed.is_(False)
+        )
+        .values(
+            responses=jsonb_merge(TestResponse.responses, answers),
+            answers_version=TestResponse.answers_version + 1
+        )
+        .returning(TestResponse.answers_version),
+        execution_options={'synchronize_session': False}
+    ).scalar()
+
+def save_answers(response_id, answers):
+    """Save answers and build the route's reply: a compact ack, or why nothing was saved"""
+    answers = {str(question_id): answer for question_id, answer in answers.items()}
+    try:
+        # The request parser accepts NaN and Infinity, which the database rejects
+        json.dumps(answers, allow_nan=False)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Answers must be JSON values (NaN and Infinity are not allowed)'}), 400
+    
+    # Join the next group commit; anything it did not write is saved here to find out why
+    version = answer_buffer.save(
+        response_id, request.current_user.get('tenant_id'), request.current_user['user_id'], answers
+    )
+    if version is None:
+        version = merge_answers(response_id, answers)
+        if version is None:
+            db.session.rollback()
+            response = get_caller_response(response_id)
+            if not response:
+                return jsonify({'error': 'Test response not found'}), 404
+            if response.user_id != request.current_user['user_id']:
+                return jsonify({'error': 'Unauthorized'}), 403
+            return jsonify({'error': 'Test already completed'}), 400
+        
+        db.session.commit()
+    
+    return jsonify({
+        'response_id': response_id,
+        'answers_version': version
+    }), 200
+
+@test_bp.route('/responses/<int:response_id>/answers', methods=['PATCH'])
+@query_budget(2)
+@token_required(user_types=['user'])
+def submit_answers(response_id):
+    """Submit a batch of answers, merged into the response in one statement"""
+    try:
+        data = request.get_json()
+        answers = data.get('answers')
+        
+        if not isinstance(answers, dict) or not answers:
+            return jsonify({'error': 'answers must be an object of question_id to answer'}), 400
         
-        return jsonify({
-            'message': 'Test started',
-            'response': response.to_dict(),
-            'test': test_dict
-        }), 201
+        return save_answers(response_id, answers)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/responses/<int:response_id>/answers', methods=['POST'])
+@query_budget(2)
 @token_required(user_types=['user'])
 def submit_answer(response_id):
     """Submit answer to a question"""
     try:
-        response = TestResponse.query.get(response_id)
-        if not response:
-            return jsonify({'error': 'Test response not found'}), 404
-        
-        if response.user_id != request.current_user['user_id']:
-            return jsonify({'error': 'Unauthorized'}), 403
-        
-        if response.is_completed:
-            return jsonify({'error': 'Test already completed'}), 400
-        
         data = request.get_json()
         question_id = data.get('question_id')
-        answer = data.get('answer')
         
         if not question_id:
             return jsonify({'error': 'question_id is required'}), 400
         
-        # Update responses dictionary
-        responses = response.responses or {}
-        responses[str(question_id)] = answer
-        response.responses = responses
-        
-        db.session.commit()
-        
-        return jsonify({
-            'message': 'Answer submitted successfully',
-            'response': response.to_dict()
-        }), 200
+        return save_answers(response_id, {question_id: data.get('answer')})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -365,7 +520,7 @@ def upload_image(response_id):
     try:
         from app.config import Config
         
-        response = TestResponse.query.get(response_id)
+        response = get_caller_response(response_id)
         if not response:
             return jsonify({'error': 'Test response not found'}), 404
         
@@ -411,11 +566,12 @@ def upload_image(response_id):
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/responses/<int:response_id>/complete', methods=['POST'])
+@query_budget(3)
 @token_required(user_types=['user'])
 def complete_test(response_id):
     """Mark test as completed (without image upload)"""
     try:
-        response = TestResponse.query.get(response_id)
+        response = get_caller_response(response_id)
         if not response:
             return jsonify({'error': 'Test response not found'}), 404
         
@@ -460,12 +616,13 @@ def get_uploaded_image(filename):
         return jsonify({'error': str(e)}), 404
 
 @test_bp.route('/responses/<int:response_id>', methods=['GET'])
+@query_budget(3)
 @token_required(user_types=['user'])
 def get_test_response(response_id):
     """Get specific test response by ID"""
     try:
         user_id = request.current_user['user_id']
-        response = TestResponse.query.get(response_id)
+        response = get_caller_response(response_id, joinedload(TestResponse.test))
         
         if not response:
             return jsonify({'error': 'Test response not found'}), 404
@@ -473,26 +630,30 @@ def get_test_response(response_id):
         if response.user_id != user_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        # Get test details with questions
-        test = Test.query.get(response.test_id)
+        # Get test details with questions (cached; loaded only on a miss)
+        test = response.test
         response_dict = response.to_dict()
-        if test:
-            response_dict['test'] = test.to_dict()
-            response_dict['test']['questions'] = [q.to_dict() for q in test.questions]
+        if not test:
+            return jsonify({'response': response_dict}), 200
         
-        return jsonify({
-            'response': response_dict
-        }), 200
+        return current_app.response_class(
+            b'{"response":' + with_definition(response_dict, definition_for(test)) + b'}',
+            mimetype='application/json'
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @test_bp.route('/responses', methods=['GET'])
+@query_budget(1)
 @token_required(user_types=['user'])
 def get_user_responses():
     """Get all test responses for current user"""
     try:
         user_id = request.current_user['user_id']
-        responses = TestResponse.query.filter_by(user_id=user_id).all()
+        responses = TestResponse.query.filter_by(
+            tenant_id=request.current_user.get('tenant_id'),
+            user_id=user_id
+        ).all()
         
         return jsonify({
             'responses': [r.to_dict() for r in responses]
@@ -513,6 +674,7 @@ def initialize_default_test():
         
         if not tenant_id:
             return jsonify({'error': 'tenant_id is required'}), 400
+        use_tenant(tenant_id)
         
         # Check if test already exists
         existing_test = Test.query.filter_by(
@@ -3,12 +3,33 @@ from app.database import db
 from app.models.user import User
 from app.models.tenant import Tenant
 from app.utils.auth import authenticate_user, hash_password, verify_password
+from app.utils.password_hasher import PasswordHasherBusy, hasher_busy_response
+from app.utils.login_throttle import login_throttle, throttled_response
 from app.utils.jwt_manager import create_access_token, token_required
+from app.utils.jsonb import jsonb_merge
+from app.utils.rbac import map_user_role, build_rbac_claims
+from app.utils.sharding import find_user_tenant_id, sharding_enabled, use_tenant
+from app.utils.refresh_tokens import issue_refresh_token, revoke_user_refresh_tokens
 from app.utils.validators import validate_email_format, validate_password_strength, validate_phone_number
 
 # Create Blueprint
 user_bp = Blueprint('user', __name__, url_prefix='/api/user')
 
+def create_user_token(user):
+    """Create an access token carrying the user's RBAC role, tenant and permission mask"""
+    rbac_role = map_user_role(user.role)
+    claims = build_rbac_claims(rbac_role, user.tenant_id)
+    
+    return create_access_token(
+        user_id=user.id,
+        user_type='user',
+        email=user.email,
+        tenant_id=user.tenant_id,
+        role=rbac_role,
+        permissions=claims['permissions'],
+        matrix_version=claims['matrix_version']
+    )
+
 @user_bp.route('/login', methods=['POST'])
 def user_login():
     """User login endpoint"""
@@ -22,47 +43,45 @@ def user_login():
         email = data['email']
         password = data['password']
         tenant_id = data.get('tenant_id')  # Optional: can login via tenant slug or ID
+        scope = tenant_id or '*'
+        
+        # Reject over-limit attempts before any DB or bcrypt work
+        retry_after = login_throttle.check(scope, email, request.remote_addr)
+        if retry_after:
+            return throttled_response(retry_after)
         
         # Authenticate user
         user = authenticate_user(email, password, tenant_id)
         
         if not user:
+            login_throttle.record_failure(scope, email, request.remote_addr)
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        login_throttle.record_success(scope, email, request.remote_addr)
+        
         # Check if password reset is required
         if user.password_reset_required:
             return jsonify({
                 'message': 'Password reset required',
                 'password_reset_required': True,
                 'user_id': user.id,
+                'tenant_id': user.tenant_id,
                 'temp_login': True
             }), 200
         
-        # Map user role to RBAC role
-        role_mapping = {
-            'user': 'user',
-            'employee': 'employee',
-            'manager': 'manager',
-            'sales_rep': 'employee',
-            'tenant': 'tenant_admin'
-        }
-        rbac_role = role_mapping.get(user.role, 'user')
-        
         # Create JWT token
-        token = create_access_token(
-            user_id=user.id,
-            user_type='user',
-            email=user.email,
-            tenant_id=user.tenant_id,
-            role=rbac_role
-        )
+        token = create_user_token(user)
         
         return jsonify({
             'message': 'Login successful',
             'token': token,
-            'user': user.to_dict()
+            'user': user.to_dict(),
+            'refresh_token': issue_refresh_token(user.id, 'user', user.tenant_id)
         }), 200
     
+    except PasswordHasherBusy as e:
+        return hasher_busy_response(e)
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -70,12 +89,6 @@ def user_login():
 def user_login_by_slug(slug):
     """User login via tenant slug (SEO-friendly)"""
     try:
-        # Find tenant by slug
-        tenant = Tenant.query.filter_by(slug=slug, is_active=True).first()
-        
-        if not tenant:
-            return jsonify({'error': 'Tenant not found or inactive'}), 404
-        
         data = request.get_json()
         
         if not data or not data.get('email') or not data.get('password'):
@@ -84,47 +97,50 @@ def user_login_by_slug(slug):
         email = data['email']
         password = data['password']
         
+        # Reject over-limit attempts before any DB or bcrypt work
+        retry_after = login_throttle.check(slug, email, request.remote_addr)
+        if retry_after:
+            return throttled_response(retry_after)
+        
+        # Find tenant by slug
+        tenant = Tenant.query.filter_by(slug=slug, is_active=True).first()
+        
+        if not tenant:
+            return jsonify({'error': 'Tenant not found or inactive'}), 404
+        
         # Authenticate user for this specific tenant
         user = authenticate_user(email, password, tenant.id)
         
         if not user:
+            login_throttle.record_failure(slug, email, request.remote_addr)
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        login_throttle.record_success(slug, email, request.remote_addr)
+        
         # Check if password reset is required
         if user.password_reset_required:
             return jsonify({
                 'message': 'Password reset required',
                 'password_reset_required': True,
                 'user_id': user.id,
+                'tenant_id': user.tenant_id,
                 'temp_login': True
             }), 200
         
-        # Map user role to RBAC role
-        role_mapping = {
-            'user': 'user',
-            'employee': 'employee',
-            'manager': 'manager',
-            'sales_rep': 'employee',
-            'tenant': 'tenant_admin'
-        }
-        rbac_role = role_mapping.get(user.role, 'user')
-        
         # Create JWT token
-        token = create_access_token(
-            user_id=user.id,
-            user_type='user',
-            email=user.email,
-            tenant_id=user.tenant_id,
-            role=rbac_role
-        )
+        token = create_user_token(user)
         
         return jsonify({
             'message': 'Login successful',
             'token': token,
             'user': user.to_dict(),
-            'tenant': tenant.to_dict()
+            'tenant': tenant.to_dict(),
+            'refresh_token': issue_refresh_token(user.id, 'user', user.tenant_id)
         }), 200
     
+    except PasswordHasherBusy as e:
+        return hasher_busy_response(e)
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -137,6 +153,13 @@ def reset_password():
         if not data.get('user_id') or not data.get('temp_password') or not data.get('new_password'):
             return jsonify({'error': 'user_id, temp_password, and new_password are required'}), 400
         
+        # The user's shard: from their tenant, else by asking each shard
+        if sharding_enabled():
+            tenant_id = data.get('tenant_id') or find_user_tenant_id(data['user_id'])
+            if not tenant_id:
+                return jsonify({'error': 'User not found'}), 404
+            use_tenant(tenant_id)
+        
         user = User.query.get(data['user_id'])
         
         if not user:
@@ -158,31 +181,20 @@ def reset_password():
         
         db.session.commit()
         
-        # Map user role to RBAC role
-        role_mapping = {
-            'user': 'user',
-            'employee': 'employee',
-            'manager': 'manager',
-            'sales_rep': 'employee',
-            'tenant': 'tenant_admin'
-        }
-        rbac_role = role_mapping.get(user.role, 'user')
-        
         # Create JWT token for automatic login
-        token = create_access_token(
-            user_id=user.id,
-            user_type='user',
-            email=user.email,
-            tenant_id=user.tenant_id,
-            role=rbac_role
-        )
+        token = create_user_token(user)
         
         return jsonify({
             'message': 'Password reset successful',
             'token': token,
-            'user': user.to_dict()
+            'user': user.to_dict(),
+            'refresh_token': issue_refresh_token(user.id, 'user', user.tenant_id)
         }), 200
     
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -205,6 +217,7 @@ def user_register():
         
         if not tenant.is_active:
             return jsonify({'error': 'Tenant is not active'}), 400
+        use_tenant(tenant.id)
         
         # Validate required fields
         required_fields = ['name', 'email', 'password']
@@ -253,31 +266,20 @@ def user_register():
         db.session.add(user)
         db.session.commit()
         
-        # Map user role to RBAC role
-        role_mapping = {
-            'user': 'user',
-            'employee': 'employee',
-            'manager': 'manager',
-            'sales_rep': 'employee',
-            'tenant': 'tenant_admin'
-        }
-        rbac_role = role_mapping.get(user.role, 'user')
-        
         # Create JWT token for automatic login
-        token = create_access_token(
-            user_id=user.id,
-            user_type='user',
-            email=user.email,
-            tenant_id=user.tenant_id,
-            role=rbac_role
-        )
+        token = create_user_token(user)
         
         return jsonify({
             'message': 'Registration successful',
             'token': token,
-            'user': user.to_dict()
+            'user': user.to_dict(),
+            'refresh_token': issue_refresh_token(user.id, 'user', user.tenant_id)
         }), 201
     
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -322,9 +324,8 @@ def update_user_profile():
             user.phone = result
         
         if data.get('profile_data'):
-            current_profile = user.profile_data or {}
-            current_profile.update(data['profile_data'])
-            user.profile_data = current_profile
+            # Merge the given keys server-side
+            user.profile_data = jsonb_merge(User.profile_data, data['profile_data'])
         
         db.session.commit()
         
@@ -366,8 +367,15 @@ def change_password():
         user.password = hash_password(data['new_password'])
         db.session.commit()
         
+        # End other sessions
+        revoke_user_refresh_tokens(user.id, 'user')
+        
         return jsonify({'message': 'Password changed successfully'}), 200
     
+    except PasswordHasherBusy as e:
+        db.session.rollback()
+        return hasher_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
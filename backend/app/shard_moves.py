@@ -0,0 +1,274 @@
+"""
+Moving tenants between shards
+
+`flask move-tenant TENANT_ID SHARD` moves a tenant's users, tests,
+questions and test responses to another database while the app keeps
+serving it:
+
+    1. copy every row to the target in committed id batches
+    2. catch up on rows changed meanwhile (by updated_at) until the
+       remaining delta is small
+    3. freeze the tenant (shard map status 'moving'): reads still work,
+       writes answer 503 with Retry-After
+    4. copy the final delta, delete rows deleted on the source
+    5. point the shard map at the target, then delete the source rows
+
+The freeze lasts about two SHARD_MAP_TTL_SECONDS plus the final delta.
+A failed move before step 5 unfreezes the tenant and can be run again.
+
+Rows keep their ids, so ids must be unique across databases: run
+`flask init-shards` once after adding a shard, which interleaves the id
+sequences of all databases (PostgreSQL only).
+"""
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, select, text
+from app.config import Config
+from app.database import db
+from app.utils.sharding import (
+    ACTIVE,
+    DEFAULT_SHARD,
+    MOVING,
+    SHARDED_TABLES,
+    bind_key,
+    copy_tenant_row,
+    drop_tenant_row,
+    shard_map,
+    shard_names
+)
+
+# Parents first: the order rows are copied in (deleted in reverse)
+COPY_ORDER = ('users', 'tests', 'questions', 'test_responses')
+
+# Tables small enough to sync in full at the freeze, whatever their updated_at
+FULL_SYNC_TABLES = ('users', 'tests', 'questions')
+
+# Margin for transactions that stamped updated_at before a pass but committed after it
+CLOCK_MARGIN = timedelta(seconds=60)
+
+CATCH_UP_PASSES = 5
+
+def configure_id_sequences(echo=print):
+    """
+    Interleave the id sequences of the sharded tables across all databases
+
+    Shard i of shard_names() gets ids base+i, base+i+stride, ..., where
+    base is above every id handed out so far. Run again after adding a
+    shard (append new shards at the end of DATABASE_SHARD_URLS).
+    """
+    stride = Config.SHARD_ID_STRIDE
+    names = shard_names()
+    if len(names) > stride:
+        raise ValueError(f'{len(names)} databases do not fit SHARD_ID_STRIDE={stride}')
+
+    engines = {name: db.engines[bind_key(name)] for name in names}
+    for name, engine in list(engines.items()):
+        if engine.dialect.name != 'postgresql':
+            echo(f'skipped  {name}: id sequences need PostgreSQL')
+            del engines[name]
+
+    for table in SHARDED_TABLES:
+        sequences, high = {}, 0
+        for name, engine in engines.items():
+            with engine.connect() as conn:
+                sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': table}).scalar()
+                max_id = conn.execute(text(f'SELECT coalesce(max(id), 0) FROM {table}')).scalar()
+                last_value = conn.execute(text(f'SELECT last_value FROM {sequence}')).scalar()
+            sequences[name] = sequence
+            high = max(high, max_id, last_value)
+
+        base = (high // stride + 1) * stride
+        for name, engine in engines.items():
+            offset = names.index(name)
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f'ALTER SEQUENCE {sequences[name]} INCREMENT BY {stride} RESTART WITH {base + offset}'
+                ))
+            echo(f'{table} ({name}): ids {base + offset} + n*{stride}')
+
+def _tenant_filter(table, tenant_id):
+    """Where clause selecting a tenant's rows of a sharded table"""
+    if 'tenant_id' in table.c:
+        return table.c.tenant_id == tenant_id
+
+    tests = db.metadata.tables['tests']
+    return table.c.test_id.in_(select(tests.c.id).where(tests.c.tenant_id == tenant_id))
+
+def _read_batches(engine, table, where, batch_size):
+    """Yield a table's matching rows in keyset batches of dicts"""
+    last_id = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(table).where(where, table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            ).mappings().all()
+        if not rows:
+            return
+        yield [dict(row) for row in rows]
+        last_id = rows[-1]['id']
+
+def _upsert(conn, table, rows, tenant_id):
+    """Insert or overwrite rows by id, refusing ids that belong to another tenant"""
+    ids = [row['id'] for row in rows]
+    existing = set(conn.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars())
+    if existing:
+        owned = set(conn.execute(
+            select(table.c.id).where(table.c.id.in_(existing), _tenant_filter(table, tenant_id))
+        ).scalars())
+        if existing - owned:
+            raise RuntimeError(
+                f'{table.name} ids {sorted(existing - owned)[:5]} already belong to another tenant '
+                'on the target; run `flask init-shards` before moving tenants'
+            )
+
+    new_rows = [row for row in rows if row['id'] not in existing]
+    if new_rows:
+        conn.execute(table.insert(), new_rows)
+
+    columns = [column.name for column in table.c if column.name != 'id']
+    changed = [{f'b_{key}': value for key, value in row.items()} for row in rows if row['id'] in existing]
+    if changed:
+        conn.execute(
+            table.update()
+            .where(table.c.id == bindparam('b_id'))
+            .values({name: bindparam(f'b_{name}') for name in columns}),
+            changed
+        )
+
+def _sync(source, target, tenant_id, batch_size, since=None, tables=COPY_ORDER):
+    """
+    Copy a tenant's rows from source to target
+
+    Args:
+        since: Only copy rows with updated_at at or after this (None = all)
+
+    Returns:
+        Number of rows copied
+    """
+    copied = 0
+    for name in tables:
+        table = db.metadata.tables[name]
+        where = _tenant_filter(table, tenant_id)
+        if since is not None:
+            where = where & (table.c.updated_at >= since)
+
+        for rows in _read_batches(source, table, where, batch_size):
+            with target.begin() as conn:
+                _upsert(conn, table, rows, tenant_id)
+            copied += len(rows)
+    return copied
+
+def _reconcile_deletes(source, target, tenant_id, batch_size):
+    """Delete rows from target that no longer exist on source"""
+    deleted = 0
+    for name in reversed(COPY_ORDER):
+        table = db.metadata.tables[name]
+        for rows in _read_batches(target, table, _tenant_filter(table, tenant_id), batch_size):
+            ids = [row['id'] for row in rows]
+            with source.connect() as conn:
+                kept = set(conn.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars())
+            gone = [row_id for row_id in ids if row_id not in kept]
+            if gone:
+                with target.begin() as conn:
+                    conn.execute(table.delete().where(table.c.id.in_(gone)))
+                deleted += len(gone)
+    return deleted
+
+def _delete_tenant_rows(engine, tenant_id, batch_size):
+    """Delete a tenant's rows from a database in batches, children first"""
+    for name in reversed(COPY_ORDER):
+        table = db.metadata.tables[name]
+        while True:
+            with engine.begin() as conn:
+                ids = conn.execute(
+                    select(table.c.id).where(_tenant_filter(table, tenant_id)).limit(batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                conn.execute(table.delete().where(table.c.id.in_(ids)))
+
+def _set_shard(tenant_id, shard, status):
+    """Write a tenant's shard map entry (no entry = active on the main database)"""
+    tenant_shards = db.metadata.tables['tenant_shards']
+    with db.engine.begin() as conn:
+        conn.execute(tenant_shards.delete().where(tenant_shards.c.tenant_id == tenant_id))
+        if shard != DEFAULT_SHARD or status != ACTIVE:
+            conn.execute(tenant_shards.insert().values(
+                tenant_id=tenant_id, shard=shard, status=status, updated_at=datetime.utcnow()
+            ))
+    shard_map.invalidate(tenant_id)
+
+def _wait_for_workers():
+    """Wait until every worker's cached shard map entry has expired"""
+    time.sleep(Config.SHARD_MAP_TTL_SECONDS + 1)
+
+def move_tenant(tenant_id, target, batch_size=1000, echo=print):
+    """
+    Move a tenant's data to another shard online
+
+    Args:
+        tenant_id: Tenant to move
+        target: Shard name from DATABASE_SHARD_URLS, or 'default'
+        batch_size: Rows per copied batch
+
+    Returns:
+        Number of rows copied
+    """
+    tenants = db.metadata.tables['tenants']
+    with db.engine.connect() as conn:
+        if conn.execute(select(tenants.c.id).where(tenants.c.id == tenant_id)).first() is None:
+            raise ValueError(f'Tenant {tenant_id} not found')
+
+    shard_map.invalidate(tenant_id)
+    source, status = shard_map.lookup(tenant_id)
+    if status == MOVING:
+        raise RuntimeError(f'Tenant {tenant_id} is already being moved')
+    if source == target:
+        raise ValueError(f'Tenant {tenant_id} is already on {target}')
+
+    source_engine = db.engines[bind_key(source)]
+    target_engine = db.engines[bind_key(target)]
+    if target != DEFAULT_SHARD:
+        copy_tenant_row(tenant_id, target)
+
+    # Bulk copy, then catch up while the tenant keeps writing
+    since = datetime.utcnow()
+    copied = _sync(source_engine, target_engine, tenant_id, batch_size)
+    echo(f'copied   {copied} rows from {source} to {target}')
+
+    previous = None
+    for attempt in range(CATCH_UP_PASSES):
+        started = datetime.utcnow()
+        changed = _sync(source_engine, target_engine, tenant_id, batch_size, since=since - CLOCK_MARGIN)
+        since = started
+        copied += changed
+        echo(f'caught up {changed} changed rows')
+        # Done once the delta is small or stops shrinking (CLOCK_MARGIN keeps recent rows in it)
+        if changed < batch_size or (previous is not None and changed >= previous):
+            break
+        previous = changed
+
+    # Freeze writes, let every worker notice, then copy what is left
+    _set_shard(tenant_id, source, MOVING)
+    echo(f'frozen   tenant {tenant_id}')
+    try:
+        _wait_for_workers()
+        copied += _sync(source_engine, target_engine, tenant_id, batch_size, tables=FULL_SYNC_TABLES)
+        copied += _sync(source_engine, target_engine, tenant_id, batch_size,
+                        since=since - CLOCK_MARGIN, tables=('test_responses',))
+        deleted = _reconcile_deletes(source_engine, target_engine, tenant_id, batch_size)
+        echo(f'synced   final delta ({deleted} deleted rows)')
+
+        _set_shard(tenant_id, target, ACTIVE)
+    except Exception:
+        _set_shard(tenant_id, source, ACTIVE)
+        echo(f'unfrozen tenant {tenant_id} on {source}')
+        raise
+    echo(f'moved    tenant {tenant_id} to {target}')
+
+    # Workers still reading the source must have switched before its rows go
+    _wait_for_workers()
+    _delete_tenant_rows(source_engine, tenant_id, batch_size)
+    drop_tenant_row(tenant_id, source)
+    echo(f'deleted  tenant {tenant_id} rows from {source}')
+    return copied
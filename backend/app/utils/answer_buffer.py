@@ -0,0 +1,196 @@
+"""
+Group commit for answer saves
+
+TestTaking saves each answer as the user types, so many responses get
+single-answer saves at once. Instead of one transaction per save, a save
+joins the next group commit: a background thread waits ANSWER_FLUSH_MS for
+more saves to arrive, then writes everything pending with one
+UPDATE ... FROM (VALUES ...) per shard, in one transaction. Saves to the
+same response are merged, latest answer per question winning.
+
+A save returns only once its group has committed (or failed), so an
+answer is never acknowledged before it is in the database, and nothing is
+held in memory that another worker could miss. The UPDATE only matches the
+owner's open response; saves it does not match (unknown response, wrong
+owner, completed test) or whose tenant is being moved are handed back to
+the caller, which retries them synchronously to report why. So are all the
+saves of a group whose write failed: each is retried on its own, so one bad
+save cannot fail everyone who shared its commit.
+
+ANSWER_FLUSH_MS=0 restores the synchronous write.
+"""
+import os
+import time
+import atexit
+import threading
+from concurrent.futures import Future
+from sqlalchemy import Integer, column, update, values
+from app.config import Config
+from app.database import db
+from app.models.test import TestResponse
+from app.models.types import JSONDocument
+from app.utils.jsonb import jsonb_merge
+from app.utils.metrics import metrics
+from app.utils.sharding import DEFAULT_SHARD, MOVING, bind_key, shard_map, sharding_enabled
+
+# Seconds a save waits for its group commit before giving up (the save may still land)
+SAVE_TIMEOUT = 10
+
+class AnswerBuffer:
+    """
+    Merge concurrent answer saves and group-commit them
+
+    Args:
+        flush_interval: Seconds the flusher waits for more saves before each commit
+        batch_size: Maximum responses per UPDATE statement
+    """
+
+    def __init__(self, flush_interval, batch_size=500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._thread_pid = None
+
+    @property
+    def enabled(self):
+        return self.flush_interval > 0
+
+    def init_app(self, app):
+        """Bind the buffer to an app and flush pending answers at exit"""
+        self.app = app
+        atexit.register(self.flush)
+        metrics.register_gauge('answers.pending', lambda: len(self._pending))
+
+    def _ensure_flusher(self):
+        """Start the flusher thread lazily, and again in every forked child"""
+        if self._thread_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+
+            thread = threading.Thread(target=self._run, name='answer-flusher', daemon=True)
+            thread.start()
+            self._thread_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._pending:
+                    self._wakeup.wait()
+
+            # Let concurrent saves join this commit
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('answer flush failed')
+
+    def save(self, response_id, tenant_id, user_id, answers):
+        """
+        Save answers to the caller's open response in the next group commit
+
+        Blocks until that commit is done.
+
+        Args:
+            response_id: Test response ID
+            tenant_id: Caller's tenant
+            user_id: Caller, who must own the response
+            answers: dict of question ID (string) to answer
+
+        Returns:
+            New answers_version, or None if nothing was written (including
+            when the group's write failed) and the caller must save
+            synchronously
+
+        Raises:
+            TimeoutError
+        """
+        if not self.enabled or self.app is None:
+            return None
+
+        self._ensure_flusher()
+
+        with self._wakeup:
+            entry = self._pending.get((response_id, tenant_id, user_id))
+            if entry is None:
+                entry = self._pending[(response_id, tenant_id, user_id)] = ({}, Future())
+            entry[0].update(answers)
+            self._wakeup.notify()
+
+        return entry[1].result(timeout=SAVE_TIMEOUT)
+
+    def flush(self):
+        """Write all pending saves to the database in one transaction and release their callers"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            if not pending:
+                return 0
+
+            try:
+                versions = self._flush(pending)
+            except Exception:
+                # Hand every save back to be retried alone; answers merge, so a retry is harmless
+                self.app.logger.exception('answer group commit of %d response(s) failed', len(pending))
+                metrics.incr('answers.failed_flushes')
+                versions = {}
+
+            for key, (_, done) in pending.items():
+                done.set_result(versions.get(key))
+            return len(versions)
+
+    def _flush(self, pending):
+        """Group-commit a swapped-out batch of saves; returns (response, tenant, user) -> answers_version of those written"""
+        by_shard = {}
+        with self.app.app_context():
+            for (response_id, tenant_id, user_id), (answers, _) in pending.items():
+                shard, status = shard_map.lookup(tenant_id) if sharding_enabled() else (DEFAULT_SHARD, None)
+                # Writes to a tenant being moved are refused; the synchronous retry reports it
+                if status != MOVING:
+                    by_shard.setdefault(shard, []).append((response_id, tenant_id, user_id, answers))
+
+            versions = {}
+            for shard, rows in by_shard.items():
+                for start in range(0, len(rows), self.batch_size):
+                    versions.update(self._write_batch(rows[start:start + self.batch_size], db.engines[bind_key(shard)]))
+            db.session.commit()
+
+        metrics.incr('answers.flushed_responses', len(versions))
+        metrics.incr('answers.unmatched_responses', len(pending) - len(versions))
+        metrics.incr('answers.flushes')
+        return versions
+
+    def _write_batch(self, rows, engine):
+        """Merge answers into a batch of responses on a shard; returns the new answers_version of those matched"""
+        patches = values(
+            column('id', Integer), column('tenant_id', Integer), column('user_id', Integer),
+            column('answers', JSONDocument),
+            name='v'
+        ).data(rows).cte('v')
+
+        result = db.session.execute(
+            update(TestResponse)
+            .where(
+                TestResponse.id == patches.c.id,
+                TestResponse.tenant_id == patches.c.tenant_id,
+                TestResponse.user_id == patches.c.user_id,
+                TestResponse.is_completed.is_(False)
+            )
+            .values(
+                responses=jsonb_merge(TestResponse.responses, patches.c.answers),
+                answers_version=TestResponse.answers_version + 1
+            )
+            .returning(TestResponse.id, TestResponse.tenant_id, TestResponse.user_id, TestResponse.answers_version),
+            bind_arguments={'bind': engine},
+            execution_options={'synchronize_session': False}
+        )
+        return {(id, tenant_id, user_id): version for id, tenant_id, user_id, version in result}
+
+answer_buffer = AnswerBuffer(flush_interval=Config.ANSWER_FLUSH_MS / 1000)
@@ -1,24 +1,46 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
+from flask import current_app
+from sqlalchemy.orm.attributes import set_committed_value
+from app.config import Config
+from app.database import db
 from app.models.admin import Admin
 from app.models.tenant import Tenant
 from app.models.user import User
+from app.utils.password_hasher import password_hasher, PasswordHasherBusy
+from app.utils.last_login_buffer import last_login_buffer
+from app.utils.sharding import directory_tenant_ids, sharding_enabled, use_tenant
+from app.utils.sqlite import end_read_transaction
+
+# Background rehash executor (recreated lazily after fork)
+_rehash_executor = None
+_rehash_pid = None
+_rehash_lock = threading.Lock()
 
 def hash_password(password):
     """
-    Hash a password using bcrypt
+    Hash a password using bcrypt on the password hashing pool
     
     Args:
         password: Plain text password
     
     Returns:
         Hashed password string
+    
+    Raises:
+        PasswordHasherBusy: If the hashing queue is full
     """
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    # Don't keep an SQLite read snapshot open across bcrypt (see app/utils/sqlite.py)
+    end_read_transaction(db.session())
+    salt = bcrypt.gensalt(rounds=Config.BCRYPT_ROUNDS)
+    hashed = password_hasher.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
 def verify_password(plain_password, hashed_password):
     """
-    Verify a password against its hash
+    Verify a password against its hash on the password hashing pool
     
     Args:
         plain_password: Plain text password to verify
@@ -26,15 +48,92 @@ def verify_password(plain_password, hashed_password):
     
     Returns:
         True if password matches, False otherwise
+    
+    Raises:
+        PasswordHasherBusy: If the hashing queue is full
     """
+    end_read_transaction(db.session())
     try:
-        return bcrypt.checkpw(
+        return password_hasher.checkpw(
             plain_password.encode('utf-8'),
             hashed_password.encode('utf-8')
         )
+    except PasswordHasherBusy:
+        raise
     except Exception:
         return False
 
+def get_hash_rounds(hashed_password):
+    """
+    Read the bcrypt cost factor from a stored hash
+    
+    Args:
+        hashed_password: Hash in modular crypt format, e.g. $2b$12$...
+    
+    Returns:
+        Cost factor as int, or None if the hash is not bcrypt
+    """
+    try:
+        return int(hashed_password.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def needs_rehash(hashed_password):
+    """Check if a stored hash uses a different cost than the current policy"""
+    rounds = get_hash_rounds(hashed_password)
+    return rounds is not None and rounds != Config.BCRYPT_ROUNDS
+
+def _get_rehash_executor():
+    """Get the background rehash executor for the current process"""
+    global _rehash_executor, _rehash_pid
+    
+    with _rehash_lock:
+        if _rehash_pid != os.getpid():
+            _rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rehash')
+            _rehash_pid = os.getpid()
+        return _rehash_executor
+
+def _rehash(app, model, column, record_id, plain_password, old_hash, tenant_id=None):
+    """Compute a policy-cost hash and store it if the old hash is unchanged"""
+    try:
+        new_hash = hash_password(plain_password)
+    except PasswordHasherBusy:
+        return  # Try again on the next login
+    
+    with app.app_context():
+        if tenant_id is not None:
+            use_tenant(tenant_id)
+        try:
+            db.session.query(model).filter(
+                model.id == record_id,
+                column == old_hash
+            ).update({column: new_hash}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Password rehash failed for %s %s', model.__name__, record_id)
+
+def schedule_rehash(model, column, record_id, plain_password, old_hash, tenant_id=None):
+    """
+    Rehash a password in the background if its cost differs from the policy
+    
+    The update is conditional on the stored hash still being old_hash, so a
+    password change that lands first is never overwritten.
+    
+    Args:
+        model: Model class holding the password
+        column: Password column on the model
+        record_id: Primary key of the record
+        plain_password: Verified plain text password
+        old_hash: Hash the password was verified against
+        tenant_id: Tenant of the record, for models stored on tenant shards
+    """
+    if not needs_rehash(old_hash):
+        return
+    
+    app = current_app._get_current_object()
+    _get_rehash_executor().submit(_rehash, app, model, column, record_id, plain_password, old_hash, tenant_id)
+
 def authenticate_admin(email, password):
     """
     Authenticate admin user
@@ -49,6 +148,7 @@ def authenticate_admin(email, password):
     admin = Admin.query.filter_by(email=email, is_active=True).first()
     
     if admin and verify_password(password, admin.password):
+        schedule_rehash(Admin, Admin.password, admin.id, password, admin.password)
         return admin
     
     return None
@@ -67,6 +167,7 @@ def authenticate_tenant(email, password):
     tenant = Tenant.query.filter_by(admin_email=email, is_active=True).first()
     
     if tenant and verify_password(password, tenant.admin_password):
+        schedule_rehash(Tenant, Tenant.admin_password, tenant.id, password, tenant.admin_password)
         return tenant
     
     return None
@@ -86,16 +187,32 @@ def authenticate_user(email, password, tenant_id=None):
     query = User.query.filter_by(email=email, is_active=True)
     
     if tenant_id:
-        query = query.filter_by(tenant_id=tenant_id)
-    
-    user = query.first()
+        use_tenant(tenant_id)
+        user = query.filter_by(tenant_id=tenant_id).first()
+    elif sharding_enabled():
+        # Users live on their tenant's shard: try the tenants the directory lists for this email
+        user = None
+        for candidate_tenant_id in directory_tenant_ids(email):
+            use_tenant(candidate_tenant_id)
+            user = query.filter_by(tenant_id=candidate_tenant_id).first()
+            if user:
+                break
+    else:
+        user = query.first()
     
     if user and verify_password(password, user.password):
+        schedule_rehash(User, User.password, user.id, password, user.password, user.tenant_id)
+        
         # Update last login
         from datetime import datetime
-        user.last_login = datetime.utcnow()
-        from app.database import db
-        db.session.commit()
+        now = datetime.utcnow()
+        if last_login_buffer.enabled:
+            # Buffered for a batched write; keep the loaded object in sync without dirtying it
+            last_login_buffer.record(user.id, now, user.tenant_id)
+            set_committed_value(user, 'last_login', now)
+        else:
+            user.last_login = now
+            db.session.commit()
         return user
     
     return None
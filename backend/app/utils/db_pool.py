@@ -0,0 +1,65 @@
+"""
+Connection pool instrumentation
+
+Engines use InstrumentedQueuePool, which times every checkout (including
+time spent waiting for a free connection), and pool events count checkouts,
+new connections and invalidations. Gauges report connections in use and
+overflow connections, all surfaced on /api/metrics.
+"""
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+from app.utils.metrics import metrics
+from app.utils.deadline import mark_timed_out
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits"""
+
+    metrics_name = 'db'
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.incr(f'{self.metrics_name}.pool.timeouts')
+            mark_timed_out('pool_timeout')
+            raise
+        finally:
+            metrics.observe(f'{self.metrics_name}.pool.checkout_wait_ms', (time.perf_counter() - start) * 1000)
+
+    def recreate(self):
+        # dispose() (e.g. after fork) swaps in a recreated pool; keep its metric name
+        pool = super().recreate()
+        pool.metrics_name = self.metrics_name
+        return pool
+
+def instrument_engine(engine, name='db'):
+    """
+    Count pool events and register pool gauges for an engine
+
+    Args:
+        engine: SQLAlchemy engine
+        name: Metric name prefix (one per bind)
+    """
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.incr(f'{name}.pool.checkouts')
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        metrics.incr(f'{name}.pool.connects')
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.incr(f'{name}.pool.invalidations')
+
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.metrics_name = name
+
+    # Read engine.pool on every snapshot: dispose() swaps in a new pool
+    if isinstance(engine.pool, QueuePool):
+        metrics.register_gauge(f'{name}.pool.size', lambda: engine.pool.size())
+        metrics.register_gauge(f'{name}.pool.checked_out', lambda: engine.pool.checkedout())
+        metrics.register_gauge(f'{name}.pool.checked_in', lambda: engine.pool.checkedin())
+        metrics.register_gauge(f'{name}.pool.overflow', lambda: max(engine.pool.overflow(), 0))
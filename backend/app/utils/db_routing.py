@@ -0,0 +1,170 @@
+"""
+Read-replica routing for db.session
+
+With DATABASE_REPLICA_URLS set, each replica becomes a bind whose
+connections default to read-only transactions. Safe requests (GET/HEAD)
+read from one replica chosen per request; everything else, and any request
+without a request context (CLI, background flushers), uses the primary.
+
+Statements on tenant data are first routed to the tenant's shard, if it
+is not the main database (see app/utils/sharding.py); shards have no
+replicas.
+
+Read-your-writes: when a request flushes changes for an authenticated
+caller, that caller is pinned to the primary for READ_YOUR_WRITES_SECONDS,
+so their next reads do not hit a lagging replica. Pins live in Redis when
+REDIS_URL is set, otherwise in the worker's memory.
+"""
+import time
+import random
+import threading
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from app.config import Config
+from app.utils.metrics import metrics
+from app.utils.redis_client import get_redis
+from app.utils.sharding import shard_engine
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+READ_METHODS = ('GET', 'HEAD')
+
+def replica_binds(urls):
+    """
+    Build SQLALCHEMY_BINDS entries for replica URLs
+
+    Replica connections replace the primary's connect_args and start every
+    transaction read-only.
+    """
+    return {
+        f'{REPLICA_BIND_PREFIX}{index}': {
+            'url': url,
+            'connect_args': {'options': '-c default_transaction_read_only=on'}
+        }
+        for index, url in enumerate(urls)
+    }
+
+class PrimaryPins:
+    """
+    Callers pinned to the primary after a write
+
+    Args:
+        seconds: How long a caller stays pinned after their last write
+    """
+
+    prefix = 'primary-pin:'
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def pin(self, key):
+        """Pin a caller to the primary"""
+        if self.seconds <= 0:
+            return
+
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(self.prefix + key, 1, px=int(self.seconds * 1000))
+                return
+            except Exception:
+                pass
+
+        now = time.monotonic()
+        with self._lock:
+            self._pins[key] = now + self.seconds
+            if len(self._pins) > 10000:
+                self._pins = {k: until for k, until in self._pins.items() if until > now}
+
+    def is_pinned(self, key):
+        """Check if a caller must read from the primary"""
+        if self.seconds <= 0:
+            return False
+
+        client = get_redis()
+        if client is not None:
+            try:
+                return bool(client.exists(self.prefix + key))
+            except Exception:
+                # Fail safe: without the shared store, assume a recent write
+                return True
+
+        until = self._pins.get(key)
+        return until is not None and until > time.monotonic()
+
+primary_pins = PrimaryPins(seconds=Config.READ_YOUR_WRITES_SECONDS)
+
+def _caller_key():
+    """Get the pin key of the authenticated caller, if any"""
+    payload = getattr(request, 'current_user', None)
+    if not payload or not payload.get('user_id'):
+        return None
+    return f"{payload.get('user_type')}:{payload['user_id']}"
+
+def _request_replica(engines):
+    """
+    Get the replica engine for the current request, or None for the primary
+
+    Decided on the first query of the request (after token_required has
+    identified the caller) and kept for the rest of it.
+    """
+    if not has_request_context():
+        return None
+
+    if 'db_replica' not in g:
+        replicas = [engine for key, engine in engines.items()
+                    if key is not None and key.startswith(REPLICA_BIND_PREFIX)]
+        replica = None
+
+        if replicas and request.method in READ_METHODS:
+            key = _caller_key()
+            if key is not None and primary_pins.is_pinned(key):
+                metrics.incr('db.routing.pinned_reads')
+            else:
+                replica = random.choice(replicas)
+                metrics.incr('db.routing.replica_reads')
+
+        g.db_replica = replica
+
+    return g.db_replica
+
+class RoutingSession(Session):
+    """Session that sends tenant data to its shard and reads of safe requests to a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            writing = self._flushing or getattr(clause, 'is_dml', False)
+            shard = shard_engine(self._db.engines, mapper, writing)
+            if shard is not None:
+                return shard
+
+            if not writing:
+                replica = _request_replica(self._db.engines)
+                if replica is not None:
+                    return replica
+            elif has_request_context():
+                # Core INSERT/UPDATE/DELETE skip the flush: treat them like one
+                g.db_wrote = True
+                g.db_replica = None
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    """Send the rest of the request to the primary and remember that it wrote"""
+    if has_request_context():
+        g.db_wrote = True
+        g.db_replica = None
+
+def init_app(app):
+    """Pin callers that wrote during a request to the primary"""
+
+    @app.after_request
+    def pin_writers(response):
+        if g.get('db_wrote') and response.status_code < 400:
+            key = _caller_key()
+            if key is not None:
+                primary_pins.pin(key)
+        return response
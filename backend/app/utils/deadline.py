@@ -0,0 +1,123 @@
+"""
+Per-request latency budgets
+
+Every request gets a deadline: DEFAULT_LATENCY_BUDGET_MS from its start, or
+the budget a route declares with @latency_budget. Each DB transaction the
+request opens runs with SET LOCAL statement_timeout set to the time left,
+so one slow query cannot hold a connection past the budget, and long
+operations can check remaining_ms() or check_deadline() between steps.
+
+Requests that hit a statement timeout, a pool checkout timeout or an
+expired deadline answer 503 (counted in /api/metrics) instead of the
+routes' generic 500.
+"""
+import time
+from functools import wraps
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.config import Config
+from app.utils.metrics import metrics
+
+# Postgres SQLSTATE for query_canceled (statement_timeout)
+QUERY_CANCELED = '57014'
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has used up its latency budget"""
+
+    def __init__(self, message='Request deadline exceeded'):
+        super().__init__(message)
+
+def set_deadline(budget_ms):
+    """Set the current request's deadline to budget_ms from now (0 disables it)"""
+    g.deadline = time.monotonic() + budget_ms / 1000 if budget_ms > 0 else None
+
+def remaining_ms():
+    """
+    Get the time left in the current request's budget
+
+    Returns:
+        Milliseconds left (may be negative), or None without a deadline
+    """
+    if not has_request_context() or g.get('deadline') is None:
+        return None
+    return (g.deadline - time.monotonic()) * 1000
+
+def mark_timed_out(reason):
+    """Flag the current request so its error response becomes a 503"""
+    if has_request_context():
+        g.timed_out = reason
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current request's budget is used up"""
+    left = remaining_ms()
+    if left is not None and left <= 0:
+        mark_timed_out('deadline')
+        raise DeadlineExceeded()
+
+def latency_budget(budget_ms):
+    """
+    Decorator to declare a route's latency budget (replaces the default)
+
+    Place it directly under @route so it also covers the auth decorators.
+
+    Usage:
+        @latency_budget(60000)
+        def export_report():
+            pass
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            set_deadline(budget_ms)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+@event.listens_for(Session, 'after_begin')
+def _apply_statement_timeout(session, transaction, conn):
+    """Limit every statement of the transaction to the request's remaining budget"""
+    if conn.dialect.name != 'postgresql':
+        return
+
+    left = remaining_ms()
+    if left is None:
+        return
+
+    if left <= 0:
+        mark_timed_out('deadline')
+        raise DeadlineExceeded()
+
+    conn.exec_driver_sql(f'SET LOCAL statement_timeout = {max(int(left), 1)}')
+
+@event.listens_for(Engine, 'handle_error')
+def _detect_statement_timeout(context):
+    if getattr(context.original_exception, 'pgcode', None) == QUERY_CANCELED:
+        mark_timed_out('statement_timeout')
+
+def init_app(app):
+    """Start each request's default deadline and turn timeouts into 503s"""
+
+    @app.before_request
+    def start_deadline():
+        set_deadline(Config.DEFAULT_LATENCY_BUDGET_MS)
+
+    @app.errorhandler(DeadlineExceeded)
+    def deadline_exceeded(error):
+        return jsonify({'error': str(error)}), 503
+
+    @app.after_request
+    def convert_timeouts(response):
+        reason = g.get('timed_out')
+        if reason is None or response.status_code < 500:
+            return response
+
+        metrics.incr('request.timeouts')
+        metrics.incr(f'request.timeouts.{reason}')
+        metrics.incr(f'request.timeouts.endpoint.{request.endpoint}')
+
+        timeout_response = jsonify({'error': 'Request took too long, please retry shortly'})
+        timeout_response.status_code = 503
+        timeout_response.headers['Retry-After'] = '1'
+        return timeout_response
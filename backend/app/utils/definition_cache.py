@@ -0,0 +1,177 @@
+"""
+Cached, pre-serialized test definitions
+
+A test definition (the test with its ordered questions) is the same JSON
+for every user taking the test, so each worker keeps its serialized bytes,
+keyed by (tenant, test_id) and stamped with the test's content_version.
+
+Every change to a test or its questions bumps tests.content_version in
+the same transaction (bump_content_version) and drops the worker's entry
+(invalidate). Other workers trust an entry for
+TEST_DEFINITION_CACHE_SECONDS after they last checked it, then re-read
+the version alone and keep the bytes if it has not moved, so a change is
+served everywhere within that time.
+
+Entries carry a strong ETag (a hash of the bytes): clients revalidating
+within the trust window get 304 without a database round trip.
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy.orm import selectinload
+from app.config import Config
+from app.database import db
+from app.models.test import Test
+from app.utils.metrics import metrics
+from app.utils.sharding import current_tenant_id
+
+class CachedDefinition:
+    """
+    Serialized test definition
+
+    Args:
+        version: content_version it was serialized at
+        body: UTF-8 JSON bytes of the test and its questions
+    """
+
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.checked_at = time.monotonic()
+
+class DefinitionCache:
+    """
+    Per-process LRU cache of serialized test definitions
+
+    Args:
+        ttl: Seconds an entry is served without re-reading its version
+        max_entries: Entries kept before the least recently used is dropped
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get an entry, however old"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry):
+        """Check if an entry was checked against the database recently enough to serve as is"""
+        return time.monotonic() - entry.checked_at < self.ttl
+
+    def put(self, key, version, body):
+        """Store a serialized definition and return its entry"""
+        entry = CachedDefinition(version, body)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, test_id):
+        """Drop every entry of a test"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == test_id]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+definition_cache = DefinitionCache(
+    ttl=Config.TEST_DEFINITION_CACHE_SECONDS,
+    max_entries=Config.TEST_DEFINITION_CACHE_SIZE
+)
+
+def _key(test_id):
+    return (current_tenant_id(), test_id)
+
+def serialize_definition(test):
+    """Serialize a test and its ordered questions to JSON bytes"""
+    # Questions first, so to_dict counts them instead of querying the count
+    questions = [question.to_dict() for question in test.questions]
+    definition = test.to_dict()
+    definition['questions'] = questions
+    return current_app.json.dumps(definition).encode('utf-8')
+
+def definition_for(test):
+    """
+    Get the cached definition of a loaded test, serializing it on a miss
+
+    The questions are only loaded when the cached bytes are missing or
+    older than the test's content_version.
+    """
+    key = _key(test.id)
+    entry = definition_cache.get(key)
+    if entry is not None and entry.version == test.content_version:
+        metrics.incr('test_definitions.hits')
+        entry.checked_at = time.monotonic()
+        return entry
+
+    metrics.incr('test_definitions.misses')
+    return definition_cache.put(key, test.content_version, serialize_definition(test))
+
+def current_definition(test_id):
+    """
+    Get the definition of a test by ID, touching the database only when needed
+
+    Returns:
+        CachedDefinition, or None if the test does not exist
+    """
+    key = _key(test_id)
+    entry = definition_cache.get(key)
+    if entry is not None and definition_cache.is_fresh(entry):
+        metrics.incr('test_definitions.hits')
+        return entry
+
+    if entry is not None:
+        # Revalidate: one indexed read of the version instead of the whole test
+        version = db.session.query(Test.content_version).filter_by(id=test_id).scalar()
+        if version is None:
+            definition_cache.invalidate(test_id)
+            return None
+        if version == entry.version:
+            metrics.incr('test_definitions.revalidations')
+            entry.checked_at = time.monotonic()
+            return entry
+
+    test = Test.query.options(selectinload(Test.questions)).get(test_id)
+    if test is None:
+        return None
+
+    metrics.incr('test_definitions.misses')
+    return definition_cache.put(key, test.content_version, serialize_definition(test))
+
+def bump_content_version(test_id):
+    """
+    Increment a test's content_version in the current transaction
+
+    Call this alongside any change to the test or its questions, then
+    invalidate() the cache after committing.
+    """
+    Test.query.filter_by(id=test_id).update(
+        {Test.content_version: Test.content_version + 1},
+        synchronize_session=False
+    )
+
+def with_definition(payload, entry):
+    """
+    Serialize a dict to JSON bytes with a cached definition as its 'test' member
+
+    The definition bytes are spliced in as they are rather than parsed and
+    encoded again.
+    """
+    head = current_app.json.dumps(payload).encode('utf-8')
+    return head[:-1] + (b',' if payload else b'') + b'"test":' + entry.body + b'}'
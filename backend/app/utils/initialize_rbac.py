@@ -2,65 +2,205 @@
 Utility to initialize default RBAC access matrix
 Run this on app startup or via API endpoint
 """
+from datetime import datetime
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.database import db
 from app.models.access_matrix import AccessMatrix
-from app.utils.rbac import get_default_permissions
+from app.models.tenant import Tenant
+from app.utils.rbac import get_default_permissions, bump_matrix_version
 
-def initialize_default_access_matrix(tenant_id=None):
+def _default_rows(tenant_ids, now):
+    """Build default access matrix rows for each tenant ID (None for global)"""
+    default_perms = get_default_permissions()
+    
+    rows = []
+    for tenant_id in tenant_ids:
+        for role, permissions in default_perms.items():
+            # Skip super_admin for tenants (super_admin is global only)
+            if role == 'super_admin' and tenant_id is not None:
+                continue
+            
+            rows.append({
+                'tenant_id': tenant_id,
+                'role': role,
+                'permissions': permissions,
+                'description': f'Default permissions for {role}',
+                'is_active': True,
+                'created_at': now,
+                'updated_at': now
+            })
+    return rows
+
+def _existing_keys(rows):
+    """Get the (tenant_id, role) pairs among rows that are already stored"""
+    tenant_ids = {row['tenant_id'] for row in rows}
+    query = db.session.query(AccessMatrix.tenant_id, AccessMatrix.role)
+    
+    if None in tenant_ids:
+        query = query.filter(AccessMatrix.tenant_id.is_(None))
+    else:
+        query = query.filter(AccessMatrix.tenant_id.in_(tenant_ids))
+    
+    return {tuple(row) for row in query.all()}
+
+def _upsert(rows, global_rows):
     """
-    Initialize default access matrix for all roles
+    Run one INSERT ... ON CONFLICT DO UPDATE for a set of rows
+    
+    Global rows (tenant_id NULL) never conflict on unique_tenant_role, since
+    NULLs are distinct, so they target the partial unique_global_role index.
+    
+    Returns:
+        list of (tenant_id, role, inserted) tuples
+    """
+    postgresql = db.engine.dialect.name == 'postgresql'
+    insert = postgresql_insert if postgresql else sqlite_insert
+    stmt = insert(AccessMatrix).values(rows)
+    
+    if global_rows:
+        conflict = {'index_elements': ['role'], 'index_where': AccessMatrix.tenant_id.is_(None)}
+    else:
+        conflict = {'index_elements': ['tenant_id', 'role']}
+    
+    stmt = stmt.on_conflict_do_update(
+        set_={
+            'permissions': stmt.excluded.permissions,
+            'is_active': True,
+            'updated_at': stmt.excluded.updated_at
+        },
+        **conflict
+    )
+    
+    if postgresql:
+        # xmax is 0 only for rows inserted by this statement
+        return db.session.execute(stmt.returning(
+            AccessMatrix.tenant_id,
+            AccessMatrix.role,
+            literal_column('xmax = 0').label('inserted')
+        )).all()
+    
+    # SQLite has no xmax: look the keys up first (its write lock keeps them current)
+    existing = _existing_keys(rows)
+    db.session.execute(stmt)
+    return [(row['tenant_id'], row['role'], (row['tenant_id'], row['role']) not in existing) for row in rows]
+
+def upsert_default_access_matrices(tenant_ids):
+    """
+    Write the default matrix for every role of one or many tenants
+    
+    Issues one upsert statement for the tenant rows (plus one for the global
+    rows if None is among tenant_ids). Does not commit.
     
     Args:
-        tenant_id: Optional tenant ID. If None, creates global permissions.
+        tenant_ids: Iterable of tenant IDs, None for the global matrix
     
     Returns:
-        dict with created and updated role counts
+        dict with lists of created and updated (tenant_id, role) pairs
     """
-    default_perms = get_default_permissions()
+    tenant_ids = list(dict.fromkeys(tenant_ids))
+    now = datetime.utcnow()
     
     created = []
     updated = []
     
-    for role, permissions in default_perms.items():
-        # Skip super_admin if tenant_id is provided (super_admin is global only)
-        if role == 'super_admin' and tenant_id is not None:
+    for global_rows, ids in ((True, [t for t in tenant_ids if t is None]),
+                             (False, [t for t in tenant_ids if t is not None])):
+        if not ids:
             continue
         
-        # Check if matrix already exists
-        existing = None
-        if tenant_id:
-            existing = AccessMatrix.query.filter_by(
-                tenant_id=tenant_id,
-                role=role
-            ).first()
-        else:
-            existing = AccessMatrix.query.filter_by(
-                tenant_id=None,
-                role=role
-            ).first()
-        
-        if existing:
-            # Update existing
-            existing.permissions = permissions
-            existing.is_active = True
-            updated.append(role)
-        else:
-            # Create new
-            matrix = AccessMatrix(
-                tenant_id=tenant_id if tenant_id else None,
-                role=role,
-                permissions=permissions,
-                description=f'Default permissions for {role}',
-                is_active=True
-            )
-            db.session.add(matrix)
-            created.append(role)
+        for tenant_id, role, inserted in _upsert(_default_rows(ids, now), global_rows):
+            (created if inserted else updated).append((tenant_id, role))
+    
+    if created or updated:
+        bump_matrix_version()
+    
+    return {
+        'created': created,
+        'updated': updated
+    }
+
+def initialize_default_access_matrix(tenant_id=None):
+    """
+    Initialize default access matrix for all roles
+    
+    Args:
+        tenant_id: Optional tenant ID. If None, creates global permissions.
     
+    Returns:
+        dict with created and updated role counts
+    """
+    result = upsert_default_access_matrices([tenant_id])
     db.session.commit()
     
+    created = [role for _, role in result['created']]
+    updated = [role for _, role in result['updated']]
+    
     return {
         'created': created,
         'updated': updated,
         'total': len(created) + len(updated)
     }
 
+def _iter_tenant_id_batches(tenant_ids, batch_size):
+    """Yield lists of tenant IDs; None means every tenant, paged by ID"""
+    if tenant_ids is not None:
+        tenant_ids = list(tenant_ids)
+        for start in range(0, len(tenant_ids), batch_size):
+            yield tenant_ids[start:start + batch_size]
+        return
+    
+    last_id = 0
+    while True:
+        batch = [row[0] for row in db.session.query(Tenant.id).filter(
+            Tenant.id > last_id
+        ).order_by(Tenant.id).limit(batch_size).all()]
+        
+        if not batch:
+            return
+        
+        yield batch
+        last_id = batch[-1]
+
+def unknown_tenant_ids(tenant_ids, chunk_size=5000):
+    """Get the IDs among tenant_ids that have no tenant, in input order"""
+    tenant_ids = list(tenant_ids)
+    known = set()
+    for start in range(0, len(tenant_ids), chunk_size):
+        known.update(row[0] for row in db.session.query(Tenant.id).filter(
+            Tenant.id.in_(tenant_ids[start:start + chunk_size])
+        ))
+    return [tenant_id for tenant_id in dict.fromkeys(tenant_ids) if tenant_id not in known]
+
+def bulk_initialize_default_access_matrix(tenant_ids=None, batch_size=500, on_batch=None):
+    """
+    Initialize the default access matrix for many tenants in batched transactions
+    
+    Args:
+        tenant_ids: Tenant IDs to initialize, or None for every tenant
+        batch_size: Tenants written (and committed) per transaction
+        on_batch: Optional callback(batch_number, tenants, created, updated)
+    
+    Returns:
+        dict with tenant, created, updated and batch counts
+    """
+    totals = {'tenants': 0, 'created': 0, 'updated': 0, 'batches': 0}
+    
+    for batch in _iter_tenant_id_batches(tenant_ids, batch_size):
+        try:
+            result = upsert_default_access_matrices(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        totals['tenants'] += len(batch)
+        totals['created'] += len(result['created'])
+        totals['updated'] += len(result['updated'])
+        totals['batches'] += 1
+        
+        if on_batch:
+            on_batch(totals['batches'], len(batch), len(result['created']), len(result['updated']))
+    
+    return totals
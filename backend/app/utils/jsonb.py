@@ -0,0 +1,114 @@
+"""
+Server-side partial updates for JSON document columns
+
+Assigning these expressions to a model attribute makes the flush issue
+UPDATE ... SET col = <expression>, so one key changes without the
+application reading, rewriting and resending the whole document, and
+concurrent updates to different keys do not overwrite each other.
+
+PostgreSQL gets the JSONB operators (||, jsonb_set); SQLite gets the
+equivalent json_set() of the JSON1 functions.
+"""
+from sqlalchemy import JSON, case, exists, func, literal, cast, select, union_all, Text
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from app.models.types import JSONDocument
+
+class _by_dialect(FunctionElement):
+    """Renders its first expression on PostgreSQL and its second elsewhere"""
+
+    name = 'by_dialect'
+    type = JSONDocument
+    inherit_cache = True
+
+@compiles(_by_dialect)
+def _compile_portable(element, compiler, **kw):
+    return compiler.process(element.clauses.clauses[1], **kw)
+
+@compiles(_by_dialect, 'postgresql')
+def _compile_postgresql(element, compiler, **kw):
+    return compiler.process(element.clauses.clauses[0], **kw)
+
+def _document(column):
+    """The column's value, or an empty object if it is NULL"""
+    return func.coalesce(column, cast('{}', JSONB))
+
+def _json_set(column, items):
+    """json_set() of top-level keys, for databases with the JSON1 functions"""
+    arguments = []
+    for key, value in items:
+        path = '$."{}"'.format(str(key).replace('"', '\\"'))
+        arguments += [path, func.json(literal(value, type_=JSON))]
+    return func.json_set(func.coalesce(column, '{}'), *arguments, type_=JSONDocument)
+
+def _json_each(document):
+    """(key, JSON text of the value) of each top-level key, from json_each()"""
+    each = func.json_each(document).table_valued('key', 'value', 'type')
+    # json_each() gives booleans as 1/0; everything else round-trips through json_quote()
+    text = case((each.c.type.in_(['true', 'false']), each.c.type), else_=func.json_quote(each.c.value))
+    return each, select(each.c.key, text.label('value'))
+
+def _json_merge(column, patch):
+    """
+    Merge of two JSON objects for databases with the JSON1 functions
+
+    json_patch() matches PostgreSQL's || unless a patch value is null (it
+    deletes the key) or an object (it merges into the old one instead of
+    replacing it). Such patches rebuild the object from the column's keys
+    missing in the patch plus all of the patch's keys instead.
+    """
+    document = func.coalesce(column, '{}')
+    kept, kept_items = _json_each(document)
+    patched, patched_items = _json_each(patch)
+    items = union_all(
+        kept_items.where(kept.c.key.not_in(select(patched.c.key).scalar_subquery())),
+        patched_items
+    ).subquery()
+    rebuilt = select(func.json_group_object(items.c.key, func.json(items.c.value))).scalar_subquery()
+
+    special = func.json_each(patch).table_valued('type')
+    return case(
+        (~exists().where(special.c.type.in_(['null', 'object'])), func.json_patch(document, patch)),
+        else_=rebuilt
+    )
+
+def jsonb_merge(column, patch):
+    """
+    Merge top-level keys into a JSON object (col || patch)
+
+    Args:
+        column: Model column, e.g. User.profile_data
+        patch: dict of keys to add or replace, or a JSON object expression
+            (e.g. a column of a VALUES list)
+    """
+    if not isinstance(patch, dict):
+        return _by_dialect(
+            _document(column).op('||', return_type=JSONB)(patch),
+            _json_merge(column, patch)
+        )
+
+    return _by_dialect(
+        _document(column).op('||', return_type=JSONB)(literal(patch, type_=JSONB)),
+        _json_set(column, patch.items()) if patch else func.coalesce(column, '{}')
+    )
+
+def jsonb_set_key(column, key, value):
+    """
+    Set a single top-level key of a JSON object (jsonb_set)
+
+    Args:
+        column: Model column, e.g. TestResponse.responses
+        key: Key to set
+        value: JSON-serializable value
+    """
+    return _by_dialect(
+        func.jsonb_set(
+            _document(column),
+            literal([str(key)], type_=ARRAY(Text)),
+            literal(value, type_=JSONB),
+            True,
+            type_=JSONB
+        ),
+        _json_set(column, [(key, value)])
+    )
@@ -1,10 +1,13 @@
 import jwt
+import uuid
 from datetime import datetime, timedelta
 from app.config import Config
 from functools import wraps
 from flask import request, jsonify
+from app.utils.token_revocation import revocation_filter
 
-def create_access_token(user_id, user_type, email, tenant_id=None, role=None):
+def create_access_token(user_id, user_type, email, tenant_id=None, role=None,
+                        permissions=None, matrix_version=None):
     """
     Create JWT access token
     
@@ -14,6 +17,8 @@ def create_access_token(user_id, user_type, email, tenant_id=None, role=None):
         email: User's email
         tenant_id: Optional tenant ID (for users and tenants)
         role: Optional user role (for RBAC)
+        permissions: Optional effective permission bitmask (see rbac.PERMISSION_BITS)
+        matrix_version: Access matrix version the permission mask was computed at
     
     Returns:
         JWT token string
@@ -23,7 +28,8 @@ def create_access_token(user_id, user_type, email, tenant_id=None, role=None):
         'user_type': user_type,
         'email': email,
         'exp': datetime.utcnow() + timedelta(minutes=Config.JWT_ACCESS_TOKEN_EXPIRE_MINUTES),
-        'iat': datetime.utcnow()
+        'iat': datetime.utcnow(),
+        'jti': uuid.uuid4().hex
     }
     
     if tenant_id:
@@ -32,6 +38,10 @@ def create_access_token(user_id, user_type, email, tenant_id=None, role=None):
     if role:
         payload['role'] = role
     
+    if permissions is not None:
+        payload['perms'] = permissions
+        payload['mv'] = matrix_version
+    
     token = jwt.encode(
         payload,
         Config.JWT_SECRET_KEY,
@@ -48,7 +58,7 @@ def decode_access_token(token):
         token: JWT token string
     
     Returns:
-        Decoded payload if valid, None otherwise
+        Decoded payload if valid and not revoked, None otherwise
     """
     try:
         payload = jwt.decode(
@@ -56,12 +66,23 @@ def decode_access_token(token):
             Config.JWT_SECRET_KEY,
             algorithms=[Config.JWT_ALGORITHM]
         )
+        if revocation_filter.is_revoked(payload.get('jti')):
+            return None  # Token revoked
         return payload
     except jwt.ExpiredSignatureError:
         return None  # Token expired
     except jwt.InvalidTokenError:
         return None  # Invalid token
 
+def revoke_access_token(payload):
+    """
+    Revoke a decoded access token before it expires
+    
+    Args:
+        payload: Decoded token payload (must carry jti and exp)
+    """
+    revocation_filter.revoke(payload.get('jti'), datetime.utcfromtimestamp(payload['exp']))
+
 def token_required(user_types=None):
     """
     Decorator to protect routes with JWT authentication
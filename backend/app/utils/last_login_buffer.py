@@ -0,0 +1,127 @@
+"""
+Write-behind buffer for users.last_login
+
+Successful logins record their timestamp in memory instead of committing an
+UPDATE on the login path. A background thread flushes the coalesced
+timestamps every LAST_LOGIN_FLUSH_SECONDS in one batched
+UPDATE ... FROM (VALUES ...) statement per tenant shard, and pending
+entries are flushed on shutdown. LAST_LOGIN_FLUSH_SECONDS=0 restores the synchronous write.
+"""
+import os
+import atexit
+import threading
+from sqlalchemy import DateTime, bindparam, text
+from app.config import Config
+from app.database import db
+from app.utils.metrics import metrics
+from app.utils.sharding import shard_engine_for_tenant
+
+class LastLoginBuffer:
+    """
+    Coalesce last_login updates per user and flush them in batches
+
+    Args:
+        flush_interval: Seconds between flushes (upper bound on staleness)
+        batch_size: Maximum rows per UPDATE statement
+    """
+
+    def __init__(self, flush_interval, batch_size=1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread_pid = None
+
+    @property
+    def enabled(self):
+        return self.flush_interval > 0
+
+    def init_app(self, app):
+        """Bind the buffer to an app and flush pending updates at exit"""
+        self.app = app
+        atexit.register(self.flush)
+        metrics.register_gauge('last_login.pending', lambda: len(self._pending))
+
+    def _ensure_flusher(self):
+        """Start the flusher thread lazily, and again in every forked child"""
+        if self._thread_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+
+            thread = threading.Thread(target=self._run, name='last-login-flusher', daemon=True)
+            thread.start()
+            self._thread_pid = os.getpid()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('last_login flush failed')
+
+    def record(self, user_id, when, tenant_id=None):
+        """Queue a last_login timestamp for a user (latest one wins)"""
+        self._ensure_flusher()
+
+        with self._lock:
+            current = self._pending.get(user_id)
+            if current is None or when > current[0]:
+                self._pending[user_id] = (when, tenant_id)
+
+    def flush(self):
+        """Write all pending timestamps to the database"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            if not pending or self.app is None:
+                return 0
+
+            items = list(pending.items())
+
+            try:
+                with self.app.app_context():
+                    by_engine = {}
+                    for user_id, (when, tenant_id) in items:
+                        by_engine.setdefault(shard_engine_for_tenant(tenant_id), []).append((user_id, when))
+
+                    for engine, rows in by_engine.items():
+                        for start in range(0, len(rows), self.batch_size):
+                            self._write_batch(rows[start:start + self.batch_size], engine)
+                    db.session.commit()
+            except Exception:
+                # Put the batch back unless a newer login superseded it
+                with self._lock:
+                    for user_id, entry in items:
+                        current = self._pending.get(user_id)
+                        if current is None or entry[0] > current[0]:
+                            self._pending[user_id] = entry
+                raise
+
+            metrics.incr('last_login.flushed_rows', len(items))
+            metrics.incr('last_login.flushes')
+            return len(items)
+
+    def _write_batch(self, items, engine):
+        """Issue one UPDATE ... FROM (VALUES ...) on a shard for a batch of (user_id, timestamp)"""
+        # PostgreSQL types VALUES columns from their first row, so the timestamps need a cast
+        timestamp = 'CAST(:ts_{} AS TIMESTAMP)' if engine.dialect.name == 'postgresql' else ':ts_{}'
+        values = []
+        params = []
+        for index, (user_id, when) in enumerate(items):
+            values.append(f'(:id_{index}, {timestamp.format(index)})')
+            params += [bindparam(f'id_{index}', user_id), bindparam(f'ts_{index}', when, type_=DateTime)]
+
+        db.session.execute(text(
+            f'WITH v (id, last_login) AS (VALUES {", ".join(values)}) '
+            'UPDATE users SET last_login = v.last_login FROM v '
+            'WHERE users.id = v.id'
+        ).bindparams(*params), bind_arguments={'bind': engine})
+
+last_login_buffer = LastLoginBuffer(flush_interval=Config.LAST_LOGIN_FLUSH_SECONDS)
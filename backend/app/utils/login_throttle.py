@@ -0,0 +1,193 @@
+"""
+Sliding-window tracker for failed logins
+
+Failures are counted per (tenant, email) and per client IP. Attempts over
+either limit are rejected with 429 before the route does any DB or bcrypt
+work, so credential-stuffing bursts cost a dictionary lookup instead of a
+full login. With REDIS_URL set the windows are shared by all workers.
+"""
+import time
+import threading
+from collections import deque
+from flask import current_app, jsonify
+from app.config import Config
+from app.utils.metrics import metrics
+from app.utils.redis_client import get_redis
+
+class MemoryWindowStore:
+    """Per-process sliding windows of failure timestamps"""
+
+    # Expired keys are swept after this many recorded failures
+    sweep_every = 1000
+
+    def __init__(self):
+        self._events = {}
+        self._lock = threading.Lock()
+        self._adds = 0
+
+    def _prune(self, key, cutoff):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= cutoff:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def count(self, key, window, now):
+        """Get (failures in window, timestamp of oldest failure)"""
+        with self._lock:
+            events = self._prune(key, now - window)
+            if not events:
+                return 0, None
+            return len(events), events[0]
+
+    def add(self, key, window, now):
+        """Record a failure"""
+        with self._lock:
+            self._prune(key, now - window)
+            self._events.setdefault(key, deque()).append(now)
+
+            self._adds += 1
+            if self._adds % self.sweep_every == 0:
+                for stale_key in list(self._events):
+                    self._prune(stale_key, now - window)
+
+    def clear(self, key):
+        """Forget all failures for a key"""
+        with self._lock:
+            self._events.pop(key, None)
+
+    def size(self):
+        """Number of keys currently tracked"""
+        return len(self._events)
+
+class RedisWindowStore:
+    """Sliding windows kept in Redis sorted sets, shared across workers"""
+
+    prefix = 'login-failures:'
+
+    def __init__(self, client):
+        self.client = client
+
+    def count(self, key, window, now):
+        """Get (failures in window, timestamp of oldest failure)"""
+        name = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(name, 0, now - window)
+        pipe.zrange(name, 0, 0, withscores=True)
+        pipe.zcard(name)
+        _, oldest, total = pipe.execute()
+        return total, (oldest[0][1] if oldest else None)
+
+    def add(self, key, window, now):
+        """Record a failure"""
+        name = self.prefix + key
+        pipe = self.client.pipeline()
+        pipe.zadd(name, {f'{now:.6f}': now})
+        pipe.expire(name, int(window) + 1)
+        pipe.execute()
+
+    def clear(self, key):
+        """Forget all failures for a key"""
+        self.client.delete(self.prefix + key)
+
+class LoginThrottle:
+    """
+    Reject logins for accounts or IPs with too many recent failures
+
+    Args:
+        window: Sliding window length in seconds
+        account_limit: Failures allowed per (tenant, email) within the window
+        ip_limit: Failures allowed per client IP within the window
+    """
+
+    def __init__(self, window, account_limit, ip_limit):
+        self.window = window
+        self.account_limit = account_limit
+        self.ip_limit = ip_limit
+        self._memory_store = MemoryWindowStore()
+
+    def tracked_keys(self):
+        """Number of keys in the per-process store"""
+        return self._memory_store.size()
+
+    def _store(self):
+        client = get_redis()
+        return RedisWindowStore(client) if client is not None else self._memory_store
+
+    def _keys(self, scope, email, ip):
+        email = (email or '').strip().lower()
+        return [
+            (f'acct:{scope}:{email}', self.account_limit),
+            (f'ip:{ip}', self.ip_limit)
+        ]
+
+    def check(self, scope, email, ip):
+        """
+        Check whether a login attempt may proceed
+
+        Args:
+            scope: Login scope, e.g. a tenant ID or slug, 'tenant' or 'admin'
+            email: Email the attempt is for
+            ip: Client IP address
+
+        Returns:
+            0 if allowed, otherwise seconds until the attempt would be allowed
+        """
+        metrics.incr('login.attempts')
+        now = time.time()
+        store = self._store()
+        retry_after = 0
+
+        try:
+            for key, limit in self._keys(scope, email, ip):
+                count, oldest = store.count(key, self.window, now)
+                if count >= limit:
+                    retry_after = max(retry_after, int(oldest + self.window - now) + 1)
+        except Exception:
+            # Fail open if the shared store is unavailable
+            current_app.logger.exception('Login throttle check failed')
+            return 0
+
+        if retry_after:
+            metrics.incr('login.throttled')
+        return retry_after
+
+    def record_failure(self, scope, email, ip):
+        """Record a failed login for the account and the IP"""
+        metrics.incr('login.failures')
+        now = time.time()
+        store = self._store()
+
+        try:
+            for key, _ in self._keys(scope, email, ip):
+                store.add(key, self.window, now)
+        except Exception:
+            current_app.logger.exception('Login throttle update failed')
+
+    def record_success(self, scope, email, ip):
+        """Reset the account window after a successful login"""
+        metrics.incr('login.success')
+        account_key = self._keys(scope, email, ip)[0][0]
+
+        try:
+            self._store().clear(account_key)
+        except Exception:
+            current_app.logger.exception('Login throttle update failed')
+
+login_throttle = LoginThrottle(
+    window=Config.LOGIN_THROTTLE_WINDOW_SECONDS,
+    account_limit=Config.LOGIN_MAX_FAILURES_PER_ACCOUNT,
+    ip_limit=Config.LOGIN_MAX_FAILURES_PER_IP
+)
+
+metrics.register_gauge('login.throttle_tracked_keys', login_throttle.tracked_keys)
+
+def throttled_response(retry_after):
+    """Build the 429 response for a throttled login"""
+    response = jsonify({'error': 'Too many failed login attempts, please retry later'})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
@@ -0,0 +1,54 @@
+"""
+In-process metrics registry
+
+Counters and timings are kept per worker process and exposed as JSON on
+/api/metrics. Gauges are callables evaluated when a snapshot is taken.
+"""
+import threading
+
+class MetricsRegistry:
+    """Thread-safe counters, timings and gauges"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timings = {}
+        self._gauges = {}
+    
+    def incr(self, name, value=1):
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+    
+    def observe(self, name, value):
+        """Record a timing or size sample"""
+        with self._lock:
+            stats = self._timings.get(name)
+            if stats is None:
+                stats = self._timings[name] = {'count': 0, 'sum': 0.0, 'max': 0.0}
+            stats['count'] += 1
+            stats['sum'] += value
+            stats['max'] = max(stats['max'], value)
+    
+    def register_gauge(self, name, fn):
+        """Register a callable whose value is read at snapshot time"""
+        with self._lock:
+            self._gauges[name] = fn
+    
+    def snapshot(self):
+        """Get a copy of all current metric values"""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: dict(stats) for name, stats in self._timings.items()}
+            gauges = dict(self._gauges)
+        
+        gauge_values = {}
+        for name, fn in gauges.items():
+            try:
+                gauge_values[name] = fn()
+            except Exception:
+                gauge_values[name] = None
+        
+        return {'counters': counters, 'timings': timings, 'gauges': gauge_values}
+
+metrics = MetricsRegistry()
@@ -0,0 +1,154 @@
+"""
+Dedicated worker pool for bcrypt hashing and verification
+
+bcrypt is deliberately slow (100-300 ms of CPU per call), so running it on
+the request thread stalls every other request handled by that worker.
+Hashing is pushed to a process pool sized to the number of cores, in front
+of which sits a bounded queue: when the queue is full the caller gets
+PasswordHasherBusy and the route answers 503 with a Retry-After header.
+
+Under gunicorn every worker has its own pool, so the master also creates a
+semaphore shared by all workers (share_host_limit) that caps the bcrypt
+calls running on the host at once, however many workers there are.
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from flask import jsonify
+from app.config import Config
+
+# Seconds a call waits for a host-wide slot before the caller gets PasswordHasherBusy
+HOST_SLOT_TIMEOUT = 5
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__('Password hashing queue is full')
+        self.retry_after = retry_after
+
+def _hashpw(password, salt):
+    """Worker entry point: hash a password (bytes in, bytes out)"""
+    return bcrypt.hashpw(password, salt)
+
+def _checkpw(password, hashed):
+    """Worker entry point: verify a password against a hash"""
+    return bcrypt.checkpw(password, hashed)
+
+class PasswordHasher:
+    """
+    Bounded front-end for a bcrypt process pool
+
+    Args:
+        workers: Number of worker processes (0 runs bcrypt inline)
+        queue_size: Number of calls allowed to wait behind busy workers
+        retry_after: Seconds advertised to clients when the queue is full
+    """
+
+    def __init__(self, workers, queue_size, retry_after):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor = None
+        self._slots = None
+        self._host_slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def share_host_limit(self, limit):
+        """
+        Cap concurrent bcrypt calls across this process and every process forked from it
+
+        Call in the master before the workers are forked.
+        """
+        self._host_slots = multiprocessing.get_context('fork').BoundedSemaphore(limit) if limit > 0 else None
+
+    def _ensure_started(self):
+        """Create the pool lazily, and again in every forked child"""
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            # A pool inherited across fork() is unusable in the child. Workers come from a
+            # forkserver: forking this process directly, once it runs threads, could copy a
+            # lock some other thread holds into the child and deadlock it
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+            self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+            self._pid = os.getpid()
+
+    def _acquire_host_slot(self):
+        if self._host_slots is not None and not self._host_slots.acquire(timeout=HOST_SLOT_TIMEOUT):
+            raise PasswordHasherBusy(self.retry_after)
+
+    def _release_host_slot(self):
+        if self._host_slots is not None:
+            self._host_slots.release()
+
+    def _run(self, fn, *args):
+        """Run fn in the pool, or raise PasswordHasherBusy if the queue is full"""
+        if self.workers <= 0:
+            self._acquire_host_slot()
+            try:
+                return fn(*args)
+            finally:
+                self._release_host_slot()
+
+        self._ensure_started()
+
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy(self.retry_after)
+
+        try:
+            self._acquire_host_slot()
+        except PasswordHasherBusy:
+            self._slots.release()
+            raise
+
+        def release(_):
+            self._release_host_slot()
+            self._slots.release()
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            release(None)
+            raise
+
+        future.add_done_callback(release)
+        return future.result()
+
+    def hashpw(self, password, salt):
+        """Hash password bytes with the given salt"""
+        return self._run(_hashpw, password, salt)
+
+    def checkpw(self, password, hashed):
+        """Check password bytes against a stored hash"""
+        return self._run(_checkpw, password, hashed)
+
+    def shutdown(self):
+        """Stop the worker processes owned by this process"""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+password_hasher = PasswordHasher(
+    workers=Config.PASSWORD_HASH_WORKERS,
+    queue_size=Config.PASSWORD_HASH_QUEUE_SIZE,
+    retry_after=Config.PASSWORD_HASH_RETRY_AFTER
+)
+
+def hasher_busy_response(error):
+    """Build the 503 response for a full hashing queue"""
+    response = jsonify({'error': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
@@ -0,0 +1,113 @@
+"""
+Compiled access matrix permissions
+
+Resource names are dot-separated paths, e.g. 'tests' or 'tests.responses'.
+A matrix key matches:
+    'tests.responses'  - exactly that resource
+    'reports.*'        - every descendant of reports (reports.daily, ...)
+    '*'                - every resource
+Actions may be listed individually or as '*' / 'all' for every action.
+Grants are additive: a resource is allowed an action if any matching key
+grants it.
+
+Each matrix is compiled once into a prefix trie over the path segments.
+Resolving a resource walks the trie once and the resulting action set is
+memoized, so repeated checks are a single dict lookup however many
+fine-grained resources a tenant defines.
+"""
+
+WILDCARD = '*'
+ALL_ACTIONS = frozenset([WILDCARD])
+
+# Upper bound on memoized resource names per compiled matrix; resource names
+# can come from request bodies, so the memo must not grow without limit
+MEMO_LIMIT = 4096
+
+def _normalize_actions(actions):
+    """Turn a stored action list into a set, folding 'all' into '*'"""
+    normalized = set()
+    for action in actions or []:
+        normalized.add(WILDCARD if action in ('all', WILDCARD) else action)
+    return ALL_ACTIONS if WILDCARD in normalized else frozenset(normalized)
+
+class _TrieNode:
+    __slots__ = ('children', 'actions', 'subtree_actions')
+
+    def __init__(self):
+        self.children = {}
+        self.actions = frozenset()          # Granted on this exact resource
+        self.subtree_actions = frozenset()  # Granted on every descendant ('x.*')
+
+class CompiledPermissions:
+    """
+    Permissions of one access matrix compiled into a prefix trie
+
+    Args:
+        permissions: Stored matrix permissions, {resource: [actions]}
+    """
+
+    __slots__ = ('entries', '_root', '_memo')
+
+    def __init__(self, permissions):
+        self.entries = {}
+        self._root = _TrieNode()
+        self._memo = {}
+
+        for pattern, actions in (permissions or {}).items():
+            actions = _normalize_actions(actions)
+            if not actions:
+                continue
+
+            self.entries[pattern] = self.entries.get(pattern, frozenset()) | actions
+
+            segments = pattern.split('.')
+            subtree = segments[-1] == WILDCARD
+            if subtree:
+                segments = segments[:-1]
+
+            node = self._root
+            for segment in segments:
+                node = node.children.setdefault(segment, _TrieNode())
+
+            if subtree:
+                node.subtree_actions = node.subtree_actions | actions
+            else:
+                node.actions = node.actions | actions
+
+    def resolve(self, resource):
+        """
+        Get the actions granted on a resource
+
+        Returns:
+            frozenset of actions, ALL_ACTIONS if every action is granted
+        """
+        actions = self._memo.get(resource)
+        if actions is not None:
+            return actions
+
+        granted = set()
+        node = self._root
+        for segment in resource.split('.'):
+            granted |= node.subtree_actions
+            node = node.children.get(segment)
+            if node is None:
+                break
+        else:
+            granted |= node.actions
+
+        actions = ALL_ACTIONS if WILDCARD in granted else frozenset(granted)
+        if len(self._memo) < MEMO_LIMIT:
+            self._memo[resource] = actions
+        return actions
+
+    def allows(self, resource, action):
+        """Check if the matrix grants an action on a resource"""
+        actions = self.resolve(resource)
+        return action in actions or WILDCARD in actions
+
+    def to_map(self):
+        """Get the granted patterns as {resource: [actions]}, with 'all' for every action"""
+        return {
+            pattern: ['all'] if WILDCARD in actions else sorted(actions)
+            for pattern, actions in self.entries.items()
+        }
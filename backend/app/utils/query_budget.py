@@ -0,0 +1,88 @@
+"""
+Per-request SQL statement budgets
+
+Every statement a request sends to a database is counted (transaction
+bookkeeping such as BEGIN and SET LOCAL aside). Routes declare how many
+statements they may issue with @query_budget, which pins their query
+shape: a request that goes over is an N+1 regression.
+
+With TESTING on, going over raises QueryBudgetExceeded, so any test client
+call to the route fails. Everywhere else, including DEBUG (which the Docker
+setup turns on), the request is served as usual, logged, and counted in
+/api/metrics: the check runs after the route, whose writes may already be
+committed.
+"""
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.utils.metrics import metrics
+
+# Statements that manage the transaction rather than query data
+BOOKKEEPING = ('BEGIN', 'SET ', 'RESET ', 'SAVEPOINT', 'RELEASE', 'ROLLBACK TO')
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in testing when a route issues more statements than its budget"""
+
+    def __init__(self, endpoint, count, budget):
+        super().__init__(f'{endpoint} issued {count} SQL statements, budget is {budget}')
+
+def statement_count():
+    """Get the number of statements the current request has issued so far"""
+    return g.get('db_statements', 0) if has_request_context() else 0
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or statement.lstrip().upper().startswith(BOOKKEEPING):
+        return
+    # Infrastructure lookups (e.g. the shard map) opt out with execution_options(query_budget=False)
+    if context is not None and context.execution_options.get('query_budget', True) is False:
+        return
+    g.db_statements = g.get('db_statements', 0) + 1
+
+def query_budget(max_statements):
+    """
+    Decorator to cap the SQL statements a route may issue
+
+    Place it directly under @route so it also covers the auth decorators.
+    Lazy loads count, so a budget that does not grow with the result size
+    rules out N+1 queries.
+
+    Args:
+        max_statements: Statement limit, or a callable returning it (e.g.
+            one per shard for routes that ask every shard)
+
+    Usage:
+        @query_budget(2)
+        def get_test(test_id):
+            pass
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            start = statement_count()
+            result = f(*args, **kwargs)
+
+            count = statement_count() - start
+            budget = max_statements() if callable(max_statements) else max_statements
+            if count > budget:
+                metrics.incr('db.query_budget.exceeded')
+                metrics.incr(f'db.query_budget.exceeded.{request.endpoint}')
+                if current_app.testing:
+                    raise QueryBudgetExceeded(request.endpoint, count, budget)
+                current_app.logger.warning(
+                    '%s issued %d SQL statements, budget is %d', request.endpoint, count, budget
+                )
+            return result
+        # Lets tests find every budgeted route
+        decorated_function.query_budget = max_statements
+        return decorated_function
+    return decorator
+
+def init_app(app):
+    """Record how many statements each request issues"""
+
+    @app.after_request
+    def observe_statements(response):
+        metrics.observe('http.db_statements', statement_count())
+        return response
@@ -0,0 +1,136 @@
+"""
+Question ordering
+
+Questions are shown by (priority_order, order_rank, id). priority_order is
+the integer clients set; order_rank is a base-36 fractional key that places
+a question between two neighbours without renumbering anything, so moving
+one question updates that question's row only:
+
+    after (3, '')  before (4, '')   ->  (3, 'i')
+    after (3, 'i') before (4, '')   ->  (3, 'r')
+    after (3, '')  before (3, 'i')  ->  (3, '9')
+
+Ranks only use digits and lowercase letters, which database collations
+sort in ASCII order, and never end in '0', so there is always room between two of
+them. Only exact ties (equal priority_order and rank) or ranks grown past
+the column size need the test renumbered, which set_priority_orders does in
+one statement.
+"""
+import sqlalchemy as sa
+from sqlalchemy.orm.attributes import set_committed_value
+from app.database import db
+from app.models.test import QUESTION_ORDER, Question
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+# Size of questions.order_rank
+MAX_RANK_LENGTH = 64
+
+def rank_between(low, high):
+    """
+    Get a rank sorting strictly between two ranks
+
+    Args:
+        low: Lower rank ('' for no lower bound)
+        high: Upper rank (None for no upper bound), greater than low
+
+    Returns:
+        New rank, not ending in '0'
+    """
+    if high is not None:
+        # Keep the common prefix (low padded with '0') and split after it
+        prefix = 0
+        while (low[prefix] if prefix < len(low) else '0') == high[prefix]:
+            prefix += 1
+        if prefix:
+            return high[:prefix] + rank_between(low[prefix:], high[prefix:])
+
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high is not None else len(DIGITS)
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[low_digit] + rank_between(low[1:], None)
+
+def _place(previous, following):
+    """Get (priority_order, order_rank) between two neighbours, or None if there is no room"""
+    if previous is None and following is None:
+        return None
+    if previous is None:
+        return following.priority_order - 1, ''
+    if following is None:
+        return previous.priority_order + 1, ''
+
+    if previous.priority_order < following.priority_order:
+        rank = rank_between(previous.order_rank, None)
+    elif previous.order_rank < following.order_rank:
+        rank = rank_between(previous.order_rank, following.order_rank)
+    else:
+        return None
+    if len(rank) > MAX_RANK_LENGTH:
+        return None
+    return previous.priority_order, rank
+
+def set_priority_orders(test_id, priority_orders):
+    """
+    Set the priority_order of many questions of a test in one UPDATE ... FROM (VALUES ...)
+
+    Their order_rank is reset, so the given integers alone decide the order.
+    Questions of other tests are left alone.
+
+    Args:
+        test_id: Test ID
+        priority_orders: dict of question ID to priority_order
+
+    Returns:
+        Number of questions updated
+    """
+    if not priority_orders:
+        return 0
+
+    orders = sa.values(
+        sa.column('id', sa.Integer), sa.column('priority_order', sa.Integer), name='v'
+    ).data(list(priority_orders.items())).cte('v')
+
+    result = db.session.execute(
+        sa.update(Question)
+        .where(Question.id == orders.c.id, Question.test_id == test_id)
+        .values(priority_order=orders.c.priority_order, order_rank='')
+        .returning(Question.id),
+        execution_options={'synchronize_session': False}
+    )
+    # Count RETURNING rows: pysqlite reports no rowcount for statements starting with WITH
+    return len(result.all())
+
+def move_question(question, after):
+    """
+    Move a question right after another one of its test, updating only its row
+
+    Args:
+        question: Question to move
+        after: Question it should follow, or None to make it the first one
+    """
+    others = Question.query.filter(Question.test_id == question.test_id, Question.id != question.id)
+    if after is None:
+        following = others.order_by(*QUESTION_ORDER).first()
+    else:
+        following = others.filter(
+            sa.tuple_(*QUESTION_ORDER) > sa.tuple_(after.priority_order, after.order_rank, after.id)
+        ).order_by(*QUESTION_ORDER).first()
+
+    place = _place(after, following)
+    if place is None and following is None:
+        return
+
+    if place is None:
+        # No rank left between the neighbours: renumber the test 1..n, then place again
+        ordered = others.order_by(*QUESTION_ORDER).all()
+        set_priority_orders(question.test_id, {other.id: index + 1 for index, other in enumerate(ordered)})
+        for index, other in enumerate(ordered):
+            set_committed_value(other, 'priority_order', index + 1)
+            set_committed_value(other, 'order_rank', '')
+        position = ordered.index(after) + 1 if after is not None else 0
+        place = _place(after, ordered[position] if position < len(ordered) else None)
+
+    question.priority_order, question.order_rank = place
@@ -1,11 +1,63 @@
 """
 Role-Based Access Control (RBAC) utilities
 """
+import threading
+from datetime import datetime
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g
+from app.database import db
 from app.models.user import User
-from app.models.access_matrix import AccessMatrix
+from app.models.access_matrix import AccessMatrix, AccessMatrixVersion
 from app.models.tenant import Tenant
+from app.utils.permission_trie import CompiledPermissions
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Map stored user roles to RBAC roles
+ROLE_MAPPING = {
+    'user': 'user',
+    'employee': 'employee',
+    'manager': 'manager',
+    'sales_rep': 'employee',
+    'tenant': 'tenant_admin'
+}
+
+# Bit positions of the (resource, action) pairs carried in the token's
+# permission mask. Append only: reordering invalidates issued tokens.
+PERMISSION_BITS = [
+    (resource, action)
+    for resource in ['employees', 'users', 'tests', 'reports', 'tenants']
+    for action in ['create', 'read', 'update', 'delete']
+]
+PERMISSION_BIT_INDEX = {pair: bit for bit, pair in enumerate(PERMISSION_BITS)}
+
+def map_user_role(user_role):
+    """Map a stored user role to its RBAC role"""
+    return ROLE_MAPPING.get(user_role, 'user')
+
+def get_matrix_version():
+    """Get the current access matrix version (read at most once per request)"""
+    if 'access_matrix_version' not in g:
+        version = db.session.query(AccessMatrixVersion.version).filter_by(id=1).scalar()
+        g.access_matrix_version = version or 0
+    return g.access_matrix_version
+
+def bump_matrix_version():
+    """
+    Increment the access matrix version in the current transaction
+    
+    Call this alongside any access matrix change, before committing, so
+    tokens minted against the old matrix fall back to a DB check.
+    """
+    # One upsert, so concurrent first bumps cannot both try to insert the row
+    insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    stmt = insert(AccessMatrixVersion).values(id=1, version=1)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[AccessMatrixVersion.id],
+        set_={'version': AccessMatrixVersion.version + 1, 'updated_at': datetime.utcnow()}
+    ))
+    g.pop('access_matrix_version', None)
 
 def get_user_role_from_token():
     """Extract user role from JWT token or database"""
@@ -27,19 +79,15 @@ def get_user_role_from_token():
     if user_type == 'tenant':
         return 'tenant_admin'
     
-    # For users, get role from database
+    # For users, use the role minted into the token, else fall back to the database
     if user_type == 'user':
+        token_role = request.current_user.get('role')
+        if token_role:
+            return token_role
+        
         user = User.query.get(user_id)
         if user:
-            # Map user role to RBAC role
-            role_mapping = {
-                'user': 'user',
-                'employee': 'employee',
-                'manager': 'manager',
-                'sales_rep': 'employee',
-                'tenant': 'tenant_admin'
-            }
-            return role_mapping.get(user.role, 'user')
+            return map_user_role(user.role)
     
     return None
 
@@ -69,7 +117,7 @@ def has_permission(role, tenant_id, resource, action):
     Args:
         role: User role (super_admin, tenant_admin, manager, employee, user)
         tenant_id: Tenant ID (for tenant-specific permissions)
-        resource: Resource name (employees, users, tests, reports, etc.)
+        resource: Resource name (employees, users, tests.responses, etc.)
         action: Action (create, read, update, delete)
     
     Returns:
@@ -83,28 +131,133 @@ def has_permission(role, tenant_id, resource, action):
     if role == 'tenant_admin':
         return True
     
-    # Get access matrix for this role and tenant
-    # First try tenant-specific, then global
-    matrix = None
-    if tenant_id:
-        matrix = AccessMatrix.query.filter_by(
-            tenant_id=tenant_id,
-            role=role,
-            is_active=True
-        ).first()
-    
-    if not matrix:
-        # Try global/default permissions
-        matrix = AccessMatrix.query.filter_by(
-            tenant_id=None,
-            role=role,
-            is_active=True
-        ).first()
-    
-    if not matrix:
+    compiled = permission_cache.get(tenant_id, role)
+    
+    if not compiled:
         return False
     
-    return matrix.has_permission(resource, action)
+    return compiled.allows(resource, action)
+
+class PermissionCache:
+    """
+    Per-process compiled permission tables keyed by (tenant_id, role)
+    
+    The whole cache is dropped when the access matrix version read for the
+    current request differs from the one it was built at, so changes made
+    by any worker are seen on the next request.
+    """
+    
+    def __init__(self):
+        self._version = None
+        self._tables = {}
+        self._lock = threading.Lock()
+    
+    def get(self, tenant_id, role):
+        """
+        Get the compiled permissions for a role, tenant-specific first, then global
+        
+        Returns:
+            CompiledPermissions, or None if no active matrix applies
+        """
+        version = get_matrix_version()
+        
+        with self._lock:
+            if version != self._version:
+                self._tables = {}
+                self._version = version
+            tables = self._tables
+        
+        key = (tenant_id or None, role)
+        if key not in tables:
+            self._load(tables, tenant_id or None)
+            tables.setdefault(key, None)
+        
+        return tables[key]
+    
+    def _load(self, tables, tenant_id):
+        """Compile every active matrix for a tenant (and the global ones) in one query"""
+        query = AccessMatrix.query.filter(AccessMatrix.is_active == True)
+        if tenant_id:
+            query = query.filter(or_(AccessMatrix.tenant_id == tenant_id, AccessMatrix.tenant_id.is_(None)))
+        else:
+            query = query.filter(AccessMatrix.tenant_id.is_(None))
+        
+        global_roles = {}
+        tenant_roles = {}
+        for matrix in query.all():
+            target = tenant_roles if matrix.tenant_id else global_roles
+            target[matrix.role] = CompiledPermissions(matrix.permissions)
+        
+        for role, compiled in {**global_roles, **tenant_roles}.items():
+            tables[(tenant_id, role)] = compiled
+
+permission_cache = PermissionCache()
+
+def compute_permission_mask(role, tenant_id):
+    """
+    Compute the effective permission bitmask for a role (see PERMISSION_BITS)
+    
+    Returns:
+        int with bit N set if the role may perform PERMISSION_BITS[N]
+    """
+    if role in ('super_admin', 'tenant_admin'):
+        return (1 << len(PERMISSION_BITS)) - 1
+    
+    compiled = permission_cache.get(tenant_id, role)
+    if not compiled:
+        return 0
+    
+    mask = 0
+    for bit, (resource, action) in enumerate(PERMISSION_BITS):
+        if compiled.allows(resource, action):
+            mask |= 1 << bit
+    return mask
+
+def get_effective_permissions(role, tenant_id):
+    """
+    Get the full effective permission map for a role
+    
+    Returns:
+        dict of {resource: [actions]}; unrestricted roles get every
+        built-in resource with 'all'
+    """
+    if role in ('super_admin', 'tenant_admin'):
+        return {resource: ['all'] for resource, _ in PERMISSION_BITS}
+    
+    compiled = permission_cache.get(tenant_id, role)
+    return compiled.to_map() if compiled else {}
+
+def build_rbac_claims(role, tenant_id):
+    """
+    Build the authorization claims minted into a user's access token
+    
+    Returns:
+        dict with the permission mask and the access matrix version it was computed at
+    """
+    return {
+        'permissions': compute_permission_mask(role, tenant_id),
+        'matrix_version': get_matrix_version()
+    }
+
+def check_token_permission(resource, action):
+    """
+    Authorize from the permission mask carried in the token
+    
+    Returns:
+        True/False if the token can answer, None if it is missing claims,
+        was minted against an older access matrix, or the pair has no bit
+    """
+    payload = getattr(request, 'current_user', None) or {}
+    mask = payload.get('perms')
+    bit = PERMISSION_BIT_INDEX.get((resource, action))
+    
+    if mask is None or bit is None:
+        return None
+    
+    if payload.get('mv') != get_matrix_version():
+        return None
+    
+    return bool(mask & (1 << bit))
 
 def permission_required(resource, action):
     """
@@ -125,8 +278,12 @@ def permission_required(resource, action):
             if not role:
                 return jsonify({'error': 'Unable to determine user role'}), 403
             
-            # Check permission
-            if not has_permission(role, tenant_id, resource, action):
+            # Check permission from the token, falling back to the access matrix
+            allowed = check_token_permission(resource, action)
+            if allowed is None:
+                allowed = has_permission(role, tenant_id, resource, action)
+            
+            if not allowed:
                 return jsonify({
                     'error': f'Access denied. {role} does not have {action} permission for {resource}'
                 }), 403
@@ -0,0 +1,34 @@
+"""
+Optional Redis connection for state shared across worker processes
+
+Redis is only needed when REDIS_URL is set; the redis package is imported
+lazily so single-process deployments do not depend on it.
+"""
+import threading
+from app.config import Config
+
+_client = None
+_lock = threading.Lock()
+
+def get_redis():
+    """
+    Get the shared Redis client
+    
+    Returns:
+        redis.Redis instance, or None if REDIS_URL is not configured
+    """
+    global _client
+    
+    if not Config.REDIS_URL:
+        return None
+    
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import redis
+                _client = redis.Redis.from_url(
+                    Config.REDIS_URL,
+                    socket_timeout=Config.REDIS_SOCKET_TIMEOUT
+                )
+    
+    return _client
@@ -0,0 +1,118 @@
+"""
+Rotating refresh tokens
+
+Refresh tokens are opaque random strings; only their SHA-256 is stored.
+Each use rotates the token: the presented one is revoked and a new one in
+the same family is issued. Presenting an already-rotated token means it
+leaked, so the whole family is revoked.
+"""
+import uuid
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app.config import Config
+from app.database import db
+from app.models.refresh_token import RefreshToken
+
+class InvalidRefreshToken(Exception):
+    """Raised when a refresh token is unknown, expired or revoked"""
+
+def _hash_token(raw_token):
+    return hashlib.sha256(raw_token.encode('utf-8')).hexdigest()
+
+def issue_refresh_token(user_id, user_type, tenant_id=None, family_id=None):
+    """
+    Issue and store a new refresh token
+    
+    Args:
+        user_id: ID of the admin, tenant or user
+        user_type: Type of user ('admin', 'tenant', 'user')
+        tenant_id: Optional tenant ID
+        family_id: Family to continue when rotating; a new login starts a new family
+    
+    Returns:
+        Raw refresh token string (only returned once, never stored)
+    """
+    raw_token = secrets.token_urlsafe(48)
+    
+    db.session.add(RefreshToken(
+        token_hash=_hash_token(raw_token),
+        family_id=family_id or uuid.uuid4().hex,
+        user_id=user_id,
+        user_type=user_type,
+        tenant_id=tenant_id,
+        expires_at=datetime.utcnow() + timedelta(days=Config.JWT_REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    db.session.commit()
+    
+    return raw_token
+
+def rotate_refresh_token(raw_token):
+    """
+    Exchange a refresh token for a new one in the same family
+    
+    Args:
+        raw_token: Refresh token presented by the client
+    
+    Returns:
+        Tuple (record of the presented token, new raw refresh token)
+    
+    Raises:
+        InvalidRefreshToken: If the token cannot be used
+    """
+    token_hash = _hash_token(raw_token)
+    now = datetime.utcnow()
+    
+    # Claim the token in one statement, so of two concurrent uses only one can
+    # rotate it; the other finds it revoked and is treated as reuse
+    record = db.session.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == token_hash,
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > now
+        )
+        .values(revoked_at=now)
+        .returning(RefreshToken),
+        execution_options={'synchronize_session': False}
+    ).scalar_one_or_none()
+    
+    if not record:
+        record = RefreshToken.query.filter_by(token_hash=token_hash).first()
+        
+        if not record:
+            raise InvalidRefreshToken('Invalid refresh token')
+        
+        if record.revoked_at is not None:
+            # Reuse of a rotated token: assume it leaked and end the whole session
+            revoke_refresh_family(record.family_id)
+            raise InvalidRefreshToken('Refresh token has been revoked')
+        
+        raise InvalidRefreshToken('Refresh token has expired')
+    
+    new_token = issue_refresh_token(record.user_id, record.user_type, record.tenant_id, record.family_id)
+    
+    return record, new_token
+
+def revoke_refresh_family(family_id):
+    """Revoke every token in a refresh token family"""
+    RefreshToken.query.filter_by(family_id=family_id, revoked_at=None).update(
+        {RefreshToken.revoked_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+
+def revoke_refresh_token(raw_token):
+    """Revoke the family of a refresh token, if it exists"""
+    record = RefreshToken.query.filter_by(token_hash=_hash_token(raw_token)).first()
+    if record:
+        revoke_refresh_family(record.family_id)
+
+def revoke_user_refresh_tokens(user_id, user_type):
+    """Revoke all refresh tokens of a user, e.g. after a password change"""
+    RefreshToken.query.filter_by(user_id=user_id, user_type=user_type, revoked_at=None).update(
+        {RefreshToken.revoked_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
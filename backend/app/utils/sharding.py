@@ -0,0 +1,305 @@
+"""
+Tenant sharding for db.session
+
+With DATABASE_SHARD_URLS set, tenant data (users, tests, questions and
+test_responses) can live in several databases. The main database is the
+catalog: it keeps admins, tenants, the access matrix, tokens, the shard map
+(tenant_shards) and the login directory (user_directory), and is also the
+'default' shard of every tenant without a shard map entry.
+
+Statements on the sharded models go to the current tenant's shard. The
+current tenant is the one set with use_tenant(), else the tenant in the
+caller's JWT, else, for admins, the tenant_id request argument. Shard map
+entries are cached per worker for SHARD_MAP_TTL_SECONDS.
+
+A tenant being moved between shards (see app/shard_moves.py) is frozen:
+its data stays readable, and writes answer 503 until the move is done.
+"""
+import time
+import threading
+from contextlib import contextmanager
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session
+from app.config import Config
+from app.utils.deadline import mark_timed_out
+from app.utils.metrics import metrics
+
+SHARD_BIND_PREFIX = 'shard_'
+DEFAULT_SHARD = 'default'
+
+# Tables holding tenant data; everything else lives in the main database
+SHARDED_TABLES = ('users', 'tests', 'questions', 'test_responses')
+
+ACTIVE = 'active'
+MOVING = 'moving'
+
+class ShardNotResolved(Exception):
+    """Raised when tenant data is accessed without a current tenant"""
+
+    def __init__(self, message='tenant_id is required to access tenant data'):
+        super().__init__(message)
+
+class TenantMoving(Exception):
+    """Raised on writes to a tenant that is being moved between shards"""
+
+    def __init__(self, message='Tenant is being moved, please retry shortly'):
+        super().__init__(message)
+
+def sharding_enabled():
+    """Check if any shards besides the main database are configured"""
+    return bool(Config.DATABASE_SHARD_URLS)
+
+def shard_binds(urls):
+    """
+    Build SQLALCHEMY_BINDS entries for shard URLs
+
+    Shard connections replace the main database's connect_args, so each
+    URL must carry its own host and credentials.
+    """
+    from app.utils.sqlite import sqlite_connect_args
+    return {
+        f'{SHARD_BIND_PREFIX}{name}': {
+            'url': url,
+            'connect_args': sqlite_connect_args() if url.startswith('sqlite') else {}
+        }
+        for name, url in urls.items()
+    }
+
+def shard_names():
+    """Get all shard names, the main database first"""
+    return [DEFAULT_SHARD, *Config.DATABASE_SHARD_URLS]
+
+def bind_key(shard):
+    """Get the SQLALCHEMY_BINDS key of a shard (None for the main database)"""
+    if shard == DEFAULT_SHARD:
+        return None
+    if shard not in Config.DATABASE_SHARD_URLS:
+        raise ShardNotResolved(f'Unknown shard: {shard}')
+    return f'{SHARD_BIND_PREFIX}{shard}'
+
+class ShardMap:
+    """
+    Cached tenant -> (shard, status) lookups
+
+    Args:
+        ttl: Seconds an entry is cached; a moved tenant is seen by every
+            worker within this time
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, tenant_id):
+        """
+        Get the shard of a tenant
+
+        Returns:
+            (shard name, status) tuple
+        """
+        now = time.monotonic()
+        entry = self._entries.get(tenant_id)
+        if entry is not None and entry[2] > now:
+            return entry[0], entry[1]
+
+        # Straight from the main database: never a replica, never the caller's transaction
+        from app.database import db
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                text('SELECT shard, status FROM tenant_shards WHERE tenant_id = :tenant_id')
+                .execution_options(query_budget=False),
+                {'tenant_id': tenant_id}
+            ).first()
+        metrics.incr('db.shard_map.lookups')
+
+        shard, status = tuple(row) if row else (DEFAULT_SHARD, ACTIVE)
+        with self._lock:
+            self._entries[tenant_id] = (shard, status, now + self.ttl)
+            if len(self._entries) > 10000:
+                self._entries = {key: value for key, value in self._entries.items() if value[2] > now}
+        return shard, status
+
+    def invalidate(self, tenant_id=None):
+        """Forget one tenant's entry, or all of them"""
+        with self._lock:
+            if tenant_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(tenant_id, None)
+
+shard_map = ShardMap(ttl=Config.SHARD_MAP_TTL_SECONDS)
+
+def use_tenant(tenant_id):
+    """Route the rest of this request (or app context) to a tenant's shard"""
+    g.shard_tenant_id = tenant_id
+
+@contextmanager
+def on_shard(shard):
+    """Route sharded statements to one shard, whatever the current tenant"""
+    previous = g.get('shard_override')
+    g.shard_override = shard
+    try:
+        yield
+    finally:
+        g.shard_override = previous
+
+def each_shard():
+    """
+    Iterate over the shards with db.session routed to each in turn
+
+    Usage:
+        total = 0
+        for shard in each_shard():
+            total += User.query.count()
+    """
+    for shard in shard_names():
+        with on_shard(shard):
+            yield shard
+
+def current_tenant_id():
+    """Get the tenant whose shard serves the current statement, if any"""
+    if has_app_context() and g.get('shard_tenant_id') is not None:
+        return g.shard_tenant_id
+
+    if has_request_context():
+        payload = getattr(request, 'current_user', None) or {}
+        if payload.get('tenant_id'):
+            return payload['tenant_id']
+        if payload.get('user_type') == 'admin':
+            return request.args.get('tenant_id', type=int)
+
+    return None
+
+def shard_engine(engines, mapper, writing):
+    """
+    Get the engine of the current tenant's shard for a statement
+
+    Args:
+        engines: The session's engines by bind key
+        mapper: Mapper the statement is for, if any
+        writing: Whether the statement writes
+
+    Returns:
+        Shard engine, or None to use the main database routing
+    """
+    if not sharding_enabled() or mapper is None:
+        return None
+
+    table = getattr(inspect(mapper), 'local_table', None)
+    if table is None or table.name not in SHARDED_TABLES:
+        return None
+
+    shard = g.get('shard_override') if has_app_context() else None
+    if shard is None:
+        tenant_id = current_tenant_id()
+        if tenant_id is None:
+            raise ShardNotResolved()
+
+        shard, status = shard_map.lookup(tenant_id)
+        if status == MOVING and writing:
+            mark_timed_out('tenant_moving')
+            raise TenantMoving()
+
+    key = bind_key(shard)
+    return None if key is None else engines[key]
+
+def shard_engine_for_tenant(tenant_id):
+    """Get the engine holding a tenant's data (for code outside db.session)"""
+    from app.database import db
+    shard = shard_map.lookup(tenant_id)[0] if sharding_enabled() and tenant_id is not None else DEFAULT_SHARD
+    return db.engines[bind_key(shard)]
+
+def directory_tenant_ids(email):
+    """Get the IDs of the tenants that have a user with this email"""
+    from app.models.shard_map import UserDirectoryEntry
+    entries = UserDirectoryEntry.query.filter_by(email=email).order_by(UserDirectoryEntry.tenant_id).all()
+    return [entry.tenant_id for entry in entries]
+
+def find_user_tenant_id(user_id):
+    """
+    Find the tenant of a user by ID alone, by asking each shard
+
+    Ids are unique across shards (see app/shard_moves.py), so at most one
+    shard answers.
+    """
+    from app.models.user import User
+    for shard in shard_names():
+        with on_shard(shard):
+            tenant_id = User.query.with_entities(User.tenant_id).filter_by(id=user_id).scalar()
+        if tenant_id is not None:
+            return tenant_id
+    return None
+
+def copy_tenant_row(tenant_id, shard):
+    """Copy a tenant's catalog row to a shard, where it anchors the foreign keys of its data"""
+    from app.database import db
+    tenants = db.metadata.tables['tenants']
+
+    with db.engine.connect() as conn:
+        row = conn.execute(select(tenants).where(tenants.c.id == tenant_id)).mappings().first()
+    with db.engines[bind_key(shard)].begin() as conn:
+        if row is not None and conn.execute(select(tenants.c.id).where(tenants.c.id == tenant_id)).first() is None:
+            conn.execute(tenants.insert(), dict(row))
+
+def drop_tenant_row(tenant_id, shard):
+    """Delete a tenant's row from a shard; the database cascades to all of its data there"""
+    from app.database import db
+    if shard == DEFAULT_SHARD:
+        return
+
+    tenants = db.metadata.tables['tenants']
+    with db.engines[bind_key(shard)].begin() as conn:
+        conn.execute(tenants.delete().where(tenants.c.id == tenant_id))
+
+def place_tenant(tenant_id, shard=None):
+    """
+    Put a new tenant on a shard (NEW_TENANT_SHARD by default)
+
+    The tenant must be committed to the main database already; the caller
+    commits the shard map entry.
+    """
+    from app.database import db
+    from app.models.shard_map import TenantShard
+
+    shard = shard or Config.NEW_TENANT_SHARD
+    if not sharding_enabled() or shard == DEFAULT_SHARD:
+        return
+
+    copy_tenant_row(tenant_id, shard)
+    db.session.add(TenantShard(tenant_id=tenant_id, shard=shard, status=ACTIVE))
+    shard_map.invalidate(tenant_id)
+
+def _directory_entry(session, email, tenant_id):
+    from app.models.shard_map import UserDirectoryEntry
+    with session.no_autoflush:
+        return session.get(UserDirectoryEntry, (email, tenant_id))
+
+@event.listens_for(Session, 'before_flush')
+def _sync_user_directory(session, flush_context, instances):
+    """Keep user_directory in step with the users being added, renamed or deleted"""
+    from app.models.user import User
+    from app.models.shard_map import UserDirectoryEntry
+
+    added, removed = [], []
+    for user in list(session.new):
+        if isinstance(user, User):
+            added.append((user.email, user.tenant_id))
+    for user in list(session.dirty):
+        if isinstance(user, User):
+            history = inspect(user).attrs.email.history
+            if history.added and history.deleted:
+                removed.append((history.deleted[0], user.tenant_id))
+                added.append((user.email, user.tenant_id))
+    for user in list(session.deleted):
+        if isinstance(user, User):
+            removed.append((user.email, user.tenant_id))
+
+    for email, tenant_id in removed:
+        entry = _directory_entry(session, email, tenant_id)
+        if entry is not None:
+            session.delete(entry)
+    for email, tenant_id in added:
+        if email and tenant_id and _directory_entry(session, email, tenant_id) is None:
+            session.add(UserDirectoryEntry(email=email, tenant_id=tenant_id))
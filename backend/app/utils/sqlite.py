@@ -0,0 +1,189 @@
+"""
+Embedded SQLite backend
+
+With DATABASE_ENGINE=sqlite the app runs on one SQLite file (SQLITE_PATH)
+instead of a PostgreSQL server: for single-node installs and for test
+runs. Every connection gets pragmas tuned for a web workload:
+
+    journal_mode=WAL      readers never block the writer, or each other
+    synchronous=NORMAL    fsync at checkpoints only (durable with WAL)
+    foreign_keys=ON       enforce the ON DELETE CASCADE rules
+    busy_timeout          wait for the write lock instead of failing
+    cache_size, mmap_size keep hot pages in memory
+
+Each request thread checks out its own connection from the pool. Every
+transaction begins deferred: it reads from a WAL snapshot and takes the
+write lock only at its first write, so a request holds the lock for no
+longer than its writes, and side connections (shard map lookups, tenant
+copies, revocation syncs) never queue behind their own request.
+
+A transaction that wrote first waits for the lock (busy_timeout). One that
+read first cannot wait: if another writer committed since its snapshot,
+its first write fails at once with SQLITE_BUSY. Such a request is run
+again, after a short backoff, if it had not committed a write yet, with
+its session's transactions taking the write lock when they begin; after
+BUSY_ATTEMPTS it answers 503 with Retry-After. end_read_transaction()
+drops a snapshot ahead of slow work such as bcrypt, so a login's write
+does not fail because of commits made while it hashed.
+
+Replicas, partitioning, statement timeouts and id interleaving across
+shards are PostgreSQL features and are off on SQLite.
+"""
+import os
+import time
+import random
+import sqlite3
+from functools import wraps
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app.config import Config
+from app.utils.deadline import mark_timed_out
+from app.utils.metrics import metrics
+
+# Runs of a request whose transactions found the database busy, and the first backoff in seconds
+BUSY_ATTEMPTS = 4
+BUSY_BACKOFF = 0.01
+
+def sqlite_connect_args():
+    """connect_args for pysqlite connections shared by a pool across threads"""
+    return {
+        'check_same_thread': False,
+        'timeout': Config.SQLITE_BUSY_TIMEOUT_MS / 1000
+    }
+
+def _pragmas():
+    return [
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA foreign_keys = ON',
+        f'PRAGMA busy_timeout = {Config.SQLITE_BUSY_TIMEOUT_MS}',
+        f'PRAGMA cache_size = -{Config.SQLITE_CACHE_MB * 1024}',
+        f'PRAGMA mmap_size = {Config.SQLITE_MMAP_MB * 1024 * 1024}',
+        'PRAGMA temp_store = MEMORY'
+    ]
+
+def _is_busy(error):
+    """Check for SQLITE_BUSY, including its extended codes such as SQLITE_BUSY_SNAPSHOT"""
+    return (getattr(error, 'sqlite_errorcode', 0) & 0xff) == sqlite3.SQLITE_BUSY
+
+def _wrote(conn):
+    """Whether the connection's current transaction has changed any rows"""
+    changes = conn.info.get('sqlite_changes')
+    return changes is not None and conn.connection.dbapi_connection.total_changes != changes
+
+def configure_engine(engine):
+    """Apply the pragmas and transaction handling to a SQLite engine (others are left alone)"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    database = engine.url.database
+    if database and database != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy, not pysqlite, decide when transactions begin
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in _pragmas():
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        if conn.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+            return
+        conn.exec_driver_sql('BEGIN')
+        conn.info['sqlite_changes'] = conn.connection.dbapi_connection.total_changes
+
+    @event.listens_for(engine, 'commit')
+    def on_commit(conn):
+        if has_request_context() and _wrote(conn):
+            g.sqlite_committed = True
+
+    @event.listens_for(engine, 'handle_error')
+    def on_error(context):
+        if has_request_context() and _is_busy(context.original_exception):
+            g.sqlite_busy = True
+
+@event.listens_for(Session, 'after_begin')
+def _session_begin(session, transaction, connection):
+    if connection.dialect.name != 'sqlite' or connection.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+        return
+    session.info.setdefault('sqlite_connections', []).append(connection)
+
+    # A request run again after SQLITE_BUSY takes the write lock before its first read,
+    # where it can wait for it; side connections (not the session's) stay deferred
+    if has_request_context() and g.get('sqlite_write_first'):
+        connection.exec_driver_sql('ROLLBACK', execution_options={'query_budget': False})
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+@event.listens_for(Session, 'after_transaction_end')
+def _forget_connections(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('sqlite_connections', None)
+
+def end_read_transaction(session):
+    """
+    Commit a SQLite session transaction that has not written, keeping loaded objects
+
+    Call before slow work outside the database. Does nothing on other
+    databases, or while the session has changes to flush or commit.
+    """
+    connections = session.info.get('sqlite_connections')
+    if not connections or session.new or session.dirty or session.deleted:
+        return
+    if any(_wrote(conn) for conn in connections):
+        return
+
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+def _retry_when_busy(app, view):
+    """Wrap a view to run it again when SQLITE_BUSY failed it before it committed a write"""
+    from app.database import db
+
+    def should_retry(attempt):
+        if not g.sqlite_busy or g.sqlite_committed:
+            return False
+        if attempt == BUSY_ATTEMPTS:
+            mark_timed_out('database_busy')
+            return False
+        return True
+
+    @wraps(view)
+    def retrying_view(*args, **kwargs):
+        for attempt in range(1, BUSY_ATTEMPTS + 1):
+            g.sqlite_busy = g.sqlite_committed = False
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except OperationalError:
+                if not should_retry(attempt):
+                    raise
+            else:
+                if response.status_code < 500 or not should_retry(attempt):
+                    return response
+
+            db.session.rollback()
+            g.sqlite_write_first = True
+            metrics.incr('db.sqlite.busy_retries')
+            time.sleep(random.uniform(0, BUSY_BACKOFF * 2 ** attempt))
+
+    return retrying_view
+
+def init_app(app):
+    """Run requests again when a busy SQLite database failed them (no-op without SQLite)"""
+    from app.database import db
+
+    with app.app_context():
+        if not any(engine.dialect.name == 'sqlite' for engine in db.engines.values()):
+            return
+
+    for endpoint, view in list(app.view_functions.items()):
+        app.view_functions[endpoint] = _retry_when_busy(app, view)
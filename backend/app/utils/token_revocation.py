@@ -0,0 +1,121 @@
+"""
+In-memory revocation set for access tokens
+
+Revoked token IDs (jti) are persisted in revoked_tokens and mirrored into a
+per-process hash set, so decode_access_token checks revocation with one set
+lookup and never queries the DB on the happy path. A background thread pulls
+rows revoked since the last sync every TOKEN_REVOCATION_SYNC_SECONDS and
+prunes entries whose tokens have expired anyway.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.config import Config
+from app.database import db
+from app.utils.metrics import metrics
+
+# Re-read this much history on every sync so rows from transactions that
+# committed late are not skipped
+SYNC_OVERLAP = timedelta(seconds=60)
+
+class RevocationFilter:
+    """
+    Set of revoked access token IDs, rebuilt incrementally from the DB
+
+    Args:
+        sync_interval: Seconds between incremental syncs
+    """
+
+    def __init__(self, sync_interval):
+        self.sync_interval = sync_interval
+        self.app = None
+        self._revoked = {}  # jti -> expires_at
+        self._synced_until = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        """Bind the filter to an app"""
+        self.app = app
+        metrics.register_gauge('token_revocation.size', lambda: len(self._revoked))
+
+    def _ensure_started(self):
+        """Load the set and start the sync thread lazily, and again after fork"""
+        if self._pid == os.getpid() or self.app is None:
+            return
+
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+
+            self.sync()
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='token-revocation-sync', daemon=True)
+            thread.start()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception:
+                self.app.logger.exception('Token revocation sync failed')
+
+    def sync(self):
+        """Pull revocations added since the last sync and prune expired ones"""
+        from app.models.refresh_token import RevokedToken
+
+        with self._sync_lock:
+            now = datetime.utcnow()
+
+            with self.app.app_context():
+                query = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+                    RevokedToken.expires_at > now
+                )
+                if self._synced_until is not None:
+                    query = query.filter(RevokedToken.revoked_at > self._synced_until - SYNC_OVERLAP)
+                rows = query.all()
+
+            with self._lock:
+                for jti, expires_at in rows:
+                    self._revoked[jti] = expires_at
+                self._synced_until = now
+
+                for jti in [j for j, expires_at in self._revoked.items() if expires_at <= now]:
+                    del self._revoked[jti]
+
+            metrics.incr('token_revocation.syncs')
+
+    def is_revoked(self, jti):
+        """Check if an access token ID has been revoked"""
+        if not jti:
+            return False
+        self._ensure_started()
+        return jti in self._revoked
+
+    def revoke(self, jti, expires_at):
+        """
+        Revoke an access token ID
+
+        Adds a revoked_tokens row in the current transaction (the caller
+        commits) and takes effect in this process immediately; other workers
+        pick it up on their next sync. Revoking a token again, e.g. from a
+        worker that has not synced it yet, is a no-op.
+        """
+        from app.models.refresh_token import RevokedToken
+
+        if not jti or self.is_revoked(jti):
+            return
+
+        insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+        db.session.execute(insert(RevokedToken).values(
+            jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=[RevokedToken.jti]))
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+revocation_filter = RevocationFilter(sync_interval=Config.TOKEN_REVOCATION_SYNC_SECONDS)
@@ -0,0 +1,93 @@
+"""
+Gunicorn configuration for production serving
+
+Usage:
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Modes (GUNICORN_WORKER_CLASS):
+    sync     - pre-fork workers, one request at a time each
+    gthread  - pre-fork workers with GUNICORN_THREADS threads each (default)
+    gevent   - pre-fork workers with GUNICORN_WORKER_CONNECTIONS green threads
+               each, for I/O-bound endpoints (psycopg2 is made cooperative)
+
+The app is preloaded in the master and frozen with gc.freeze() before
+forking, so its pages stay shared copy-on-write across workers. Each worker
+disposes the inherited SQLAlchemy connection pool after fork. SIGTERM
+stops accepting connections and lets in-flight requests finish within
+GUNICORN_GRACEFUL_TIMEOUT seconds.
+"""
+import gc
+import os
+import multiprocessing
+
+cpu_count = multiprocessing.cpu_count()
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before the app is preloaded, so locks and sockets created at
+    # import time are already cooperative
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.getenv('GUNICORN_BIND', f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', '5000')}")
+
+workers = int(os.getenv('GUNICORN_WORKERS', cpu_count * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers periodically to bound memory growth (0 disables)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# Every worker owns a bcrypt process pool; share the cores between them
+# instead of giving each worker one process per core
+os.environ.setdefault('PASSWORD_HASH_WORKERS', str(max(1, cpu_count // workers)))
+# With more workers than cores, one process each still oversubscribes the
+# CPU, so bcrypt calls are also capped host-wide (see on_starting)
+os.environ.setdefault('PASSWORD_HASH_HOST_LIMIT', str(cpu_count))
+
+def _flask_app(server):
+    return server.app.wsgi()
+
+def on_starting(server):
+    # Created in the master, so every forked worker shares the same slots
+    from app.config import Config
+    from app.utils.password_hasher import password_hasher
+    password_hasher.share_host_limit(Config.PASSWORD_HASH_HOST_LIMIT)
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the GC's generations, so collections
+    # in the workers do not touch (and un-share) the preloaded pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+    # Connections opened by the master must not be shared with the workers
+    from app.database import db
+    with _flask_app(server).app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def worker_exit(server, worker):
+    # Write out buffered last_login updates and pending answer saves before the worker goes away
+    from app.utils.answer_buffer import answer_buffer
+    from app.utils.last_login_buffer import last_login_buffer
+    for name, buffer in (('last_login', last_login_buffer), ('answer', answer_buffer)):
+        try:
+            buffer.flush()
+        except Exception:
+            server.log.exception('%s flush on worker exit failed', name)
@@ -0,0 +1,133 @@
+"""
+Benchmark answer saves: one commit per save vs the group commit
+
+Adds a tenant, a test and --takers users with an open response each to the
+configured database (same environment as the app, e.g. DATABASE_* or
+DATABASE_ENGINE=sqlite), then has --threads clients save single answers
+for random takers through POST /api/test/responses/<id>/answers, as
+TestTaking does while they type, for --duration seconds per mode:
+
+    ANSWER_FLUSH_MS=0   every save commits its own UPDATE
+    ANSWER_FLUSH_MS=N   saves join the next group commit (app/utils/answer_buffer.py)
+
+and reports saves/s, commits/s and the p50/p99 latency of a save, which
+includes waiting for its commit.
+
+Usage (from backend/):
+    python scripts/bench_answer_saves.py --takers 5000 --threads 64 --flush-ms 0 5 20
+
+Adds rows it does not remove; run it on a scratch database.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import create_app
+from app.database import db
+from app.models.tenant import Tenant
+from app.models.test import Test, TestResponse
+from app.models.user import User
+from app.utils.answer_buffer import answer_buffer
+from app.utils.jwt_manager import create_access_token
+
+QUESTIONS = 20
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def prepare(takers):
+    """Add a tenant, a test and one open response per taker; returns [(response_id, token)]"""
+    suffix = uuid.uuid4().hex[:8]
+    tenant = Tenant(name=f'Bench {suffix}', slug=f'bench-{suffix}', email=f'bench-{suffix}@example.com',
+                    admin_name='Bench', admin_email=f'admin-{suffix}@example.com', admin_password='x')
+    db.session.add(tenant)
+    db.session.flush()
+    test = Test(tenant_id=tenant.id, title='Answer save benchmark')
+    users = [
+        User(tenant_id=tenant.id, name=f'Taker {i}', email=f'taker{i}-{suffix}@example.com', password='x', role='user')
+        for i in range(takers)
+    ]
+    db.session.add(test)
+    db.session.add_all(users)
+    db.session.flush()
+    responses = [TestResponse(test_id=test.id, user_id=user.id, tenant_id=tenant.id, responses={}, is_completed=False)
+                 for user in users]
+    db.session.add_all(responses)
+    db.session.flush()
+    takers = [
+        (response.id, create_access_token(user.id, 'user', user.email, tenant_id=tenant.id, role='user'))
+        for user, response in zip(users, responses)
+    ]
+    db.session.commit()
+    return takers
+
+def run(app, takers, threads, duration):
+    """Save answers from threads for duration seconds; returns (seconds, latencies, failures)"""
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def worker():
+        client = app.test_client()
+        mine = []
+        while time.perf_counter() < stop:
+            response_id, token = random.choice(takers)
+            start = time.perf_counter()
+            response = client.post(f'/api/test/responses/{response_id}/answers', headers={
+                'Authorization': f'Bearer {token}'
+            }, json={'question_id': random.randint(1, QUESTIONS), 'answer': 'x' * random.randint(1, 40)})
+            mine.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                with lock:
+                    failures.append(f'{response.status_code}: {response.get_data(as_text=True)[:200]}')
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, latencies, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--takers', type=int, default=5000, help='Test-takers with an open response')
+    parser.add_argument('--threads', type=int, default=64, help='Saves in flight at once')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per mode')
+    parser.add_argument('--flush-ms', type=float, nargs='+', default=[0, 5], help='ANSWER_FLUSH_MS values to compare')
+    args = parser.parse_args()
+
+    app = create_app()
+    commits = [0]
+
+    with app.app_context():
+        takers = prepare(args.takers)
+        dialect = db.engine.dialect.name
+        for engine in db.engines.values():
+            event.listen(engine, 'commit', lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+    print(f'{dialect}: {args.takers} test-takers, {args.threads} threads, {args.duration:.0f}s per mode')
+    for flush_ms in args.flush_ms:
+        answer_buffer.flush_interval = flush_ms / 1000
+        commits[0] = 0
+        seconds, latencies, failures = run(app, takers, args.threads, args.duration)
+        answer_buffer.flush()
+        print(f'ANSWER_FLUSH_MS={flush_ms:<4g} {len(latencies) / seconds:7.0f} saves/s  {commits[0] / seconds:7.0f} commits/s  '
+              f'p50 {percentile(latencies, .5) * 1000:7.2f} ms  p99 {percentile(latencies, .99) * 1000:7.2f} ms  '
+              f'failed {len(failures)}')
+        if failures:
+            print(f'  e.g. {failures[0]}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark JSON document writes: read-modify-write vs server-side merge
+
+Creates a scratch table on the configured database (same environment as
+the app) holding --rows documents of --keys answers each, times writes of
+one key per document, then drops the table.
+
+    rewrite     SELECT the document, change one key in Python, UPDATE the
+                whole document (how answers were saved before jsonb_merge)
+    merge       UPDATE ... SET doc = jsonb_merge(doc, {key: value})
+    batch       one UPDATE ... FROM (VALUES ...) merging a patch into each
+                of --batch documents (the answer buffer's flush)
+
+Answers are a mix of strings, numbers, lists, booleans and nulls (one in
+five). On SQLite the batch merge is also timed with plain json_patch(),
+which deletes keys set to null; jsonb_merge only uses it for patches
+without nulls or objects.
+
+Usage (from backend/):
+    python scripts/bench_jsonb_merge.py --rows 2000 --keys 100
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, Integer, MetaData, Table, column, func, select, update, values
+from app import create_app
+from app.database import db
+from app.models.types import JSONDocument
+from app.utils.jsonb import jsonb_merge
+
+documents = Table(
+    'bench_jsonb_merge', MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('doc', JSONDocument, nullable=False)
+)
+
+def answer():
+    return random.choice([None, True, random.randint(0, 9), 'x' * random.randint(10, 200), ['a', 'b']])
+
+def timed(label, rows, write):
+    start = time.perf_counter()
+    write()
+    seconds = time.perf_counter() - start
+    print(f'{label:<22} {rows / seconds:9.0f} docs/s  {seconds / rows * 1e6:8.0f} us/doc')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--keys', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        engine = db.engine
+        documents.drop(engine, checkfirst=True)
+        documents.create(engine)
+        try:
+            with engine.begin() as conn:
+                conn.execute(documents.insert(), [
+                    {'id': row, 'doc': {str(key): answer() for key in range(args.keys)}}
+                    for row in range(args.rows)
+                ])
+
+            print(f'{engine.dialect.name}: {args.rows} documents of {args.keys} keys')
+            ids = list(range(args.rows))
+
+            def rewrite():
+                for row in ids:
+                    with engine.begin() as conn:
+                        doc = conn.execute(select(documents.c.doc).where(documents.c.id == row)).scalar()
+                        doc[str(random.randrange(args.keys))] = answer()
+                        conn.execute(update(documents).where(documents.c.id == row).values(doc=doc))
+
+            def merge():
+                for row in ids:
+                    with engine.begin() as conn:
+                        conn.execute(update(documents).where(documents.c.id == row).values(
+                            doc=jsonb_merge(documents.c.doc, {str(random.randrange(args.keys)): answer()})
+                        ))
+
+            def batch(merged):
+                def write():
+                    for start in range(0, args.rows, args.batch):
+                        patches = values(column('id', Integer), column('patch', JSONDocument), name='v').data([
+                            (row, {str(random.randrange(args.keys)): answer(), 'new': answer()})
+                            for row in ids[start:start + args.batch]
+                        ]).cte('v')
+                        with engine.begin() as conn:
+                            conn.execute(update(documents).where(documents.c.id == patches.c.id).values(
+                                doc=merged(documents.c.doc, patches.c.patch)
+                            ))
+                return write
+
+            timed('rewrite', args.rows, rewrite)
+            timed('merge', args.rows, merge)
+            timed('batch merge', args.rows, batch(jsonb_merge))
+            if engine.dialect.name == 'sqlite':
+                timed('batch json_patch', args.rows, batch(
+                    lambda doc, patch: func.json_patch(doc, patch, type_=JSONDocument)
+                ))
+        finally:
+            documents.drop(engine)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark the last_login write: one commit per login vs the write-behind buffer
+
+Replays logins of existing users against the configured database (same
+environment as the app, e.g. DATABASE_* or DATABASE_ENGINE=sqlite) and
+times only the last_login write, which is what the buffer changes; the
+bcrypt check in front of it is the same in both modes.
+
+    per-login   UPDATE users SET last_login ... and COMMIT for every login
+                (LAST_LOGIN_FLUSH_SECONDS=0)
+    buffered    LastLoginBuffer.record() on the login path, then the
+                background flushes (one UPDATE ... FROM (VALUES ...) per
+                batch), timed separately
+
+Usage (from backend/):
+    python scripts/bench_last_login.py --logins 20000 --threads 8
+
+Writes last_login of the users it picks; run it on a scratch database.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import create_app
+from app.database import db
+from app.models.user import User
+from app.utils.last_login_buffer import LastLoginBuffer
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def replay(app, users, logins, threads, login):
+    """Run logins spread over threads; returns (seconds, per-login latencies)"""
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        mine = []
+        with app.app_context():
+            for _ in range(count):
+                user_id, tenant_id = random.choice(users)
+                start = time.perf_counter()
+                login(user_id, tenant_id)
+                mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(logins // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--logins', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--flush-seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    commits = [0]
+
+    with app.app_context():
+        users = [tuple(row) for row in db.session.query(User.id, User.tenant_id).all()]
+        if not users:
+            sys.exit('No users to log in; create some first')
+        for engine in db.engines.values():
+            event.listen(engine, 'commit', lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+    def per_login(user_id, tenant_id):
+        User.query.filter_by(id=user_id).update({'last_login': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+    buffer = LastLoginBuffer(flush_interval=args.flush_seconds)
+    buffer.app = app
+
+    def buffered(user_id, tenant_id):
+        buffer.record(user_id, datetime.utcnow(), tenant_id)
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    print(f'{dialect}: {len(users)} users, {args.logins} logins, {args.threads} threads')
+
+    commits[0] = 0
+    seconds, latencies = replay(app, users, args.logins, args.threads, per_login)
+    print(f'per-login  {len(latencies) / seconds:9.0f} logins/s  {commits[0] / seconds:7.0f} commits/s  '
+          f'write p50 {percentile(latencies, .5) * 1000:7.3f} ms  p99 {percentile(latencies, .99) * 1000:7.3f} ms')
+
+    # No background flusher: the logins are timed alone, then one flush writes them all
+    buffer._thread_pid = os.getpid()
+    commits[0] = 0
+    seconds, latencies = replay(app, users, args.logins, args.threads, buffered)
+    flush_start = time.perf_counter()
+    rows = buffer.flush()
+    flush_seconds = time.perf_counter() - flush_start
+    print(f'buffered   {len(latencies) / seconds:9.0f} logins/s  {commits[0]} commit(s) for {rows} users  '
+          f'write p50 {percentile(latencies, .5) * 1000:7.3f} ms  p99 {percentile(latencies, .99) * 1000:7.3f} ms  '
+          f'flush {flush_seconds * 1000:.0f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark test_responses lookups and inserts before and after partitioning
+
+Runs against the configured PostgreSQL database and CONVERTS its
+test_responses table; use a scratch database.
+
+    1. --seed N inserts N completed responses spread over the existing
+       tests (and their tenants) and users, with generate_series, created
+       over the last 720 days (so --strategy range fills ~25 months)
+    2. times --lookups random lookups of each hot query shape, after an
+       untimed pass over the same rows:
+         by key     WHERE id = :id AND <partitioning key> (TestResponse's key:
+                    tenant_id for hash, created_at for range)
+         by id      WHERE id = :id AND tenant_id = :tenant (get_caller_response)
+         by user    WHERE tenant_id = :tenant AND user_id = :user
+       and --inserts single-row INSERTs of new responses, each committed
+    3. runs `partition-test-responses --strategy` (timed) and repeats step 2
+
+Usage (from backend/):
+    python scripts/bench_partitioning.py --seed 50000000 --strategy hash --partitions 16
+    python scripts/bench_partitioning.py --seed 50000000 --strategy range
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from app import create_app
+from app.database import db
+from app.partitioning import PARTITION_KEYS, STRATEGIES, get_strategy, partition_test_responses
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def report(name, latencies):
+    print(f'  {name:<8} p50 {percentile(latencies, .5) * 1000:7.3f} ms  p99 {percentile(latencies, .99) * 1000:7.3f} ms')
+
+def seed(conn, rows, batch_size=1000000):
+    tests = conn.execute(text('SELECT id, tenant_id FROM tests')).all()
+    users = conn.execute(text('SELECT id, tenant_id FROM users')).all()
+    pairs = [(test, user) for test, tenant in tests for user, user_tenant in users if user_tenant == tenant]
+    if not pairs:
+        sys.exit('Seeding needs at least one test and one user of the same tenant')
+
+    start_time = time.perf_counter()
+    for start in range(0, rows, batch_size):
+        conn.execute(text(
+            'INSERT INTO test_responses (test_id, user_id, tenant_id, responses, is_completed, '
+            'started_at, completed_at, created_at, updated_at) '
+            "SELECT p.test_id, p.user_id, t.tenant_id, jsonb_build_object('1', g, '2', 'answer ' || g), true, "
+            "now() - (g % 720 || ' days')::interval, now(), now() - (g % 720 || ' days')::interval, now() "
+            'FROM generate_series(1, :count) g '
+            'JOIN unnest(CAST(:tests AS int[]), CAST(:users AS int[])) WITH ORDINALITY AS p (test_id, user_id, n) '
+            'ON p.n = g % :pairs + 1 '
+            'JOIN tests t ON t.id = p.test_id'
+        ), {
+            'count': min(batch_size, rows - start),
+            'tests': [test for test, _ in pairs],
+            'users': [user for _, user in pairs],
+            'pairs': len(pairs)
+        })
+        conn.commit()
+        print(f'seeded {min(start + batch_size, rows)} rows ({time.perf_counter() - start_time:.0f}s)', flush=True)
+    conn.execute(text('ANALYZE test_responses'))
+    conn.commit()
+
+def measure_lookups(conn, lookups, strategy):
+    rows = conn.execute(text(
+        'SELECT id, tenant_id, user_id, created_at FROM test_responses TABLESAMPLE SYSTEM (1) LIMIT :n'
+    ), {'n': lookups}).all()
+    key = PARTITION_KEYS[strategy]
+    shapes = {
+        'by key': (f'SELECT * FROM test_responses WHERE id = :id AND {key} = :key', lambda row: {
+            'id': row.id, 'key': getattr(row, key)}),
+        'by id': ('SELECT * FROM test_responses WHERE id = :id AND tenant_id = :tenant', lambda row: {
+            'id': row.id, 'tenant': row.tenant_id}),
+        'by user': ('SELECT id FROM test_responses WHERE tenant_id = :tenant AND user_id = :user', lambda row: {
+            'tenant': row.tenant_id, 'user': row.user_id}),
+    }
+    for name, (query, params) in shapes.items():
+        # One untimed pass, so both tables are measured with warm caches
+        for row in rows:
+            conn.execute(text(query), params(row)).all()
+        latencies = []
+        for row in random.sample(rows, len(rows)):
+            start = time.perf_counter()
+            conn.execute(text(query), params(row)).all()
+            latencies.append(time.perf_counter() - start)
+        report(name, latencies)
+    conn.rollback()
+
+def measure_inserts(conn, inserts):
+    pairs = conn.execute(text(
+        'SELECT DISTINCT test_id, user_id, tenant_id FROM test_responses TABLESAMPLE SYSTEM (0.1) LIMIT 1000'
+    )).all()
+    conn.commit()
+    latencies = []
+    for _ in range(inserts):
+        test_id, user_id, tenant_id = random.choice(pairs)
+        start = time.perf_counter()
+        conn.execute(text(
+            'INSERT INTO test_responses (test_id, user_id, tenant_id, responses, is_completed, '
+            'started_at, created_at, updated_at) '
+            "VALUES (:test, :user, :tenant, '{}', false, now(), now(), now())"
+        ), {'test': test_id, 'user': user_id, 'tenant': tenant_id})
+        conn.commit()
+        latencies.append(time.perf_counter() - start)
+    report('insert', latencies)
+    print(f'  {"":<8} {len(latencies) / sum(latencies):7.0f} committed inserts/s (one connection)')
+
+def measure(lookups, inserts, strategy):
+    with db.engine.connect() as conn:
+        measure_lookups(conn, lookups, strategy)
+        measure_inserts(conn, inserts)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategy', choices=STRATEGIES, default='hash')
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--inserts', type=int, default=2000)
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit('Partitioning needs PostgreSQL')
+
+        with db.engine.connect() as conn:
+            if get_strategy(conn):
+                sys.exit('test_responses is already partitioned')
+            if args.seed:
+                seed(conn, args.seed)
+            total = conn.execute(text('SELECT count(*) FROM test_responses')).scalar()
+
+        print(f'{total} responses, unpartitioned:')
+        measure(args.lookups, args.inserts, args.strategy)
+
+        start = time.perf_counter()
+        partition_test_responses(
+            strategy=args.strategy, partitions=args.partitions, batch_size=args.batch_size,
+            echo=lambda message: None
+        )
+        print(f'converted to {args.strategy} partitions in {time.perf_counter() - start:.0f}s')
+
+        print(f'partitioned by {PARTITION_KEYS[args.strategy]}:')
+        measure(args.lookups, args.inserts, args.strategy)
+
+if __name__ == '__main__':
+    main()
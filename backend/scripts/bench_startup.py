@@ -0,0 +1,132 @@
+"""
+Benchmark worker startup: import time, time-to-first-request and memory
+
+Uses the same environment as the app (DATABASE_*, GUNICORN_*, ...); the
+app factory does no database work, so no database needs to be reachable.
+
+    import        seconds to `import app.main` (which builds the app) in a
+                  fresh interpreter, best of --runs, and the share spent in
+                  create_app()
+    first request seconds from starting `gunicorn -c gunicorn.conf.py
+                  app.main:app` until GET /health answers 200
+    memory        per worker once every worker has answered a request:
+                  RSS, PSS (shared pages split between the processes that
+                  map them) and private (pages only this worker has, i.e.
+                  what each extra worker costs), from /proc (Linux only)
+
+Usage (from backend/):
+    python scripts/bench_startup.py --workers 4 --runs 5
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = '''
+import time
+start = time.perf_counter()
+import app
+import app.main
+imported = time.perf_counter()
+app.create_app()
+print(imported - start, time.perf_counter() - imported)
+'''
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def get(url, timeout=1):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.status
+
+def memory_kb(pid):
+    """(RSS, PSS, private) of a process in kB"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+def children(pid):
+    pids = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            pids.extend(int(child) for child in f.read().split())
+    return pids
+
+def measure_import(runs):
+    imports, factories = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE], cwd=BACKEND, capture_output=True, text=True, check=True
+        ).stdout.split()
+        imports.append(float(output[0]))
+        factories.append(float(output[1]))
+    print(f'import app.main     {min(imports) * 1000:8.1f} ms (best of {runs})')
+    print(f'create_app()        {min(factories) * 1000:8.1f} ms (best of {runs}, modules already imported)')
+
+def measure_server(workers, worker_class, runs):
+    first_requests = []
+    for run in range(runs):
+        port = free_port()
+        env = dict(os.environ, GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKERS=str(workers),
+                   GUNICORN_WORKER_CLASS=worker_class, GUNICORN_ACCESS_LOG='/dev/null')
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app.main:app'],
+            cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            while True:
+                if server.poll() is not None:
+                    sys.exit('gunicorn exited; run it by hand to see why')
+                try:
+                    if get(f'http://127.0.0.1:{port}/health') == 200:
+                        break
+                except OSError:
+                    time.sleep(0.005)
+            first_requests.append(time.perf_counter() - start)
+
+            if run == runs - 1:
+                # Let every worker boot and serve, then read their memory
+                deadline = time.time() + 30
+                while len(children(server.pid)) < workers and time.time() < deadline:
+                    time.sleep(0.1)
+                for _ in range(workers * 20):
+                    get(f'http://127.0.0.1:{port}/health')
+                time.sleep(0.5)
+                print(f'\n{"process":<14} {"RSS":>10} {"PSS":>10} {"private":>10}')
+                rss, pss, private = memory_kb(server.pid)
+                print(f'{"master":<14} {rss / 1024:8.1f}MB {pss / 1024:8.1f}MB {private / 1024:8.1f}MB')
+                for pid in children(server.pid):
+                    rss, pss, private = memory_kb(pid)
+                    print(f'{f"worker {pid}":<14} {rss / 1024:8.1f}MB {pss / 1024:8.1f}MB {private / 1024:8.1f}MB')
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    first_requests.sort()
+    print(f'\nfirst request       {first_requests[len(first_requests) // 2] * 1000:8.1f} ms median, '
+          f'{first_requests[0] * 1000:.1f} ms best ({runs} starts of {workers} {worker_class} workers)')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--worker-class', default=os.getenv('GUNICORN_WORKER_CLASS', 'gthread'))
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    measure_import(args.runs)
+    measure_server(args.workers, args.worker_class, args.runs)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""
+Shared test setup
+
+Run from backend/:
+    python -m pytest tests
+
+Tests that need PostgreSQL read a scratch database from TEST_POSTGRES_URL
+(e.g. postgresql+psycopg2://postgres@localhost/multitenant_test) and are
+skipped without it. They wipe its public schema.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests never wait on a bcrypt process pool
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
@@ -0,0 +1,124 @@
+"""
+Every budgeted route must stay within its query budget
+
+Runs the app on a throwaway SQLite file with TESTING set, so a route that
+issues more statements than its @query_budget raises QueryBudgetExceeded
+instead of logging a warning, and calls each budgeted route.
+"""
+import uuid
+import pytest
+from flask import request
+
+PASSWORD = 'Passw0rd!'
+
+def _headers(token):
+    return {'Authorization': f'Bearer {token}'}
+
+def _ok(response, *codes):
+    assert response.status_code in codes, (response.status_code, response.get_data(as_text=True))
+    return response.get_json()
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    from app.config import Config
+
+    Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path_factory.mktemp("query_budget") / "app.db"}'
+    Config.SQLALCHEMY_ENGINE_OPTIONS = {}
+    Config.BCRYPT_ROUNDS = 4
+
+    from app import create_app
+
+    app = create_app()
+    app.config['TESTING'] = True
+    result = app.test_cli_runner().invoke(args=['bootstrap'])
+    assert result.exit_code == 0, (result.output, result.exception)
+
+    app.called_endpoints = set()
+
+    @app.after_request
+    def record_endpoint(response):
+        app.called_endpoints.add(request.endpoint)
+        return response
+
+    return app
+
+@pytest.fixture(scope='module')
+def tokens(app):
+    from app.config import Config
+    from app.database import db
+    from app.models.tenant import Tenant
+    from app.models.user import User
+    from app.utils.auth import hash_password
+
+    suffix = uuid.uuid4().hex[:8]
+    with app.app_context():
+        tenant = Tenant(name=f'Budget {suffix}', slug=f'budget-{suffix}', email=f'budget-{suffix}@example.com',
+                        admin_name='Admin', admin_email=f'admin-{suffix}@example.com',
+                        admin_password=hash_password(PASSWORD))
+        db.session.add(tenant)
+        db.session.flush()
+        db.session.add(User(tenant_id=tenant.id, name='User', email=f'user-{suffix}@example.com',
+                            password=hash_password(PASSWORD)))
+        db.session.commit()
+
+    client = app.test_client()
+    return {
+        'admin': _ok(client.post('/api/admin/login', json={
+            'email': Config.ADMIN_EMAIL, 'password': Config.ADMIN_PASSWORD}), 200)['token'],
+        'tenant': _ok(client.post('/api/tenant/login', json={
+            'email': f'admin-{suffix}@example.com', 'password': PASSWORD}), 200)['token'],
+        'user': _ok(client.post('/api/user/login', json={
+            'email': f'user-{suffix}@example.com', 'password': PASSWORD}), 200)['token'],
+    }
+
+def test_budgeted_routes_stay_within_budget(app, tokens):
+    client = app.test_client()
+    tenant, user = _headers(tokens['tenant']), _headers(tokens['user'])
+
+    test_id = _ok(client.post('/api/test/tests', headers=tenant, json={'title': 'Budget'}), 201)['test']['id']
+    question_ids = [
+        _ok(client.post(f'/api/test/tests/{test_id}/questions', headers=tenant, json={
+            'question_text': f'Question {i}', 'question_type': 'text'}), 201)['question']['id']
+        for i in range(4)
+    ]
+    _ok(client.put(f'/api/test/questions/{question_ids[-1]}', headers=tenant, json={'question_text': 'Edited'}), 200)
+    _ok(client.delete(f'/api/test/questions/{question_ids.pop()}', headers=tenant), 200)
+    _ok(client.put(f'/api/test/tests/{test_id}', headers=tenant, json={'title': 'Budget, edited'}), 200)
+
+    _ok(client.post(f'/api/test/tests/{test_id}/questions/reorder', headers=tenant, json={'question_orders': [
+        {'question_id': question_id, 'priority_order': 10 - i} for i, question_id in enumerate(question_ids)]}), 200)
+    _ok(client.post(f'/api/test/questions/{question_ids[0]}/move', headers=tenant, json={
+        'after_question_id': question_ids[1]}), 200)
+    _ok(client.post(f'/api/test/questions/{question_ids[0]}/move', headers=tenant, json={}), 200)
+    _ok(client.get(f'/api/test/tests/{test_id}/questions', headers=tenant), 200)
+
+    for caller in ('admin', 'tenant', 'user'):
+        _ok(client.get('/api/test/tests', headers=_headers(tokens[caller])), 200)
+    _ok(client.get(f'/api/test/tests/{test_id}', headers=user), 200)
+
+    response_id = _ok(client.post(f'/api/test/tests/{test_id}/start', headers=user), 201)['response']['id']
+    _ok(client.post(f'/api/test/tests/{test_id}/start', headers=user), 200)
+    _ok(client.post(f'/api/test/responses/{response_id}/answers', headers=user, json={
+        'question_id': question_ids[0], 'answer': 'First'}), 200)
+    _ok(client.patch(f'/api/test/responses/{response_id}/answers', headers=user, json={
+        'answers': {str(question_id): f'Answer {question_id}' for question_id in question_ids}}), 200)
+    _ok(client.get(f'/api/test/responses/{response_id}', headers=user), 200)
+    _ok(client.get('/api/test/responses', headers=user), 200)
+    _ok(client.post(f'/api/test/responses/{response_id}/complete', headers=user), 200)
+
+    _ok(client.delete(f'/api/test/tests/{test_id}', headers=tenant), 200)
+
+def test_every_budgeted_route_is_called(app):
+    budgeted = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    assert budgeted, 'no route carries a query budget'
+    assert budgeted <= app.called_endpoints, f'not called: {sorted(budgeted - app.called_endpoints)}'
+
+def test_exceeding_a_budget_raises_when_testing(app):
+    from sqlalchemy import text
+    from app.database import db
+    from app.utils.query_budget import QueryBudgetExceeded, query_budget
+
+    view = query_budget(1)(lambda: [db.session.execute(text('SELECT 1')) for _ in range(2)] and 'ok')
+    with app.test_request_context('/'):
+        with pytest.raises(QueryBudgetExceeded):
+            view()
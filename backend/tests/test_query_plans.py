@@ -0,0 +1,97 @@
+"""
+Every hot query shape must use the index built for it
+
+Seeds a scratch PostgreSQL database (TEST_POSTGRES_URL) with realistic
+volumes, ANALYZEs it and checks each shape's plan by index name, with the
+planner's default costs.
+"""
+import os
+import pytest
+from sqlalchemy import text
+
+POSTGRES_URL = os.getenv('TEST_POSTGRES_URL')
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason='TEST_POSTGRES_URL is not set')
+
+TENANTS = 100
+USERS = 200000
+TESTS_PER_TENANT = 20
+RESPONSES = 500000
+
+def _seed(conn):
+    conn.execute(text(
+        "INSERT INTO tenants (name, slug, email, admin_name, admin_email, admin_password, is_active, "
+        "subscription_status, created_at, updated_at) "
+        "SELECT 'Tenant ' || g, 'tenant-' || g, 'tenant' || g || '@example.com', 'Admin', "
+        "'admin' || g || '@example.com', 'x', true, 'active', now(), now() "
+        "FROM generate_series(1, :tenants) g"
+    ), {'tenants': TENANTS})
+
+    # 80% users, 15% employees, 4% managers, 1% sales reps; 90% active
+    conn.execute(text(
+        "INSERT INTO users (tenant_id, name, email, password, role, access_level, is_active, is_verified, "
+        "password_reset_required, created_at, updated_at) "
+        "SELECT t.ids[g % :tenants + 1], 'User ' || g, 'user' || g || '@example.com', 'x', "
+        "CASE WHEN g % 100 < 80 THEN 'user' WHEN g % 100 < 95 THEN 'employee' "
+        "WHEN g % 100 < 99 THEN 'manager' ELSE 'sales_rep' END, "
+        "'basic', g % 10 <> 0, true, false, now(), now() "
+        "FROM generate_series(1, :users) g, (SELECT array_agg(id ORDER BY id) AS ids FROM tenants) t"
+    ), {'tenants': TENANTS, 'users': USERS})
+
+    # 70% of tests active
+    conn.execute(text(
+        "INSERT INTO tests (tenant_id, title, is_active, created_at, updated_at) "
+        "SELECT tenants.id, 'Test ' || g, g % 10 < 7, now(), now() "
+        "FROM tenants, generate_series(1, :tests) g"
+    ), {'tests': TESTS_PER_TENANT})
+
+    # Responses by users to their own tenant's tests; 5% still open
+    conn.execute(text(
+        "WITH u AS (SELECT id, tenant_id, row_number() OVER (ORDER BY id) - 1 AS n FROM users), "
+        "t AS (SELECT id, tenant_id, row_number() OVER (PARTITION BY tenant_id ORDER BY id) - 1 AS n FROM tests) "
+        "INSERT INTO test_responses (test_id, user_id, tenant_id, responses, answers_version, is_completed, "
+        "started_at, created_at, updated_at) "
+        "SELECT t.id, u.id, u.tenant_id, '{}', 0, g % 20 <> 0, now(), now(), now() "
+        "FROM generate_series(1, :responses) g "
+        "JOIN u ON u.n = g % :users "
+        "JOIN t ON t.tenant_id = u.tenant_id AND t.n = g % :tests"
+    ), {'responses': RESPONSES, 'users': USERS, 'tests': TESTS_PER_TENANT})
+
+    conn.execute(text('ANALYZE'))
+
+@pytest.fixture(scope='module')
+def app():
+    from app.config import Config
+
+    Config.SQLALCHEMY_DATABASE_URI = POSTGRES_URL
+    Config.SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    from app import create_app
+    from app.database import db
+    from app.migrations import run_migrations
+
+    app = create_app()
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text('DROP SCHEMA public CASCADE'))
+            conn.execute(text('CREATE SCHEMA public'))
+        run_migrations(echo=lambda message: None)
+        with db.engine.begin() as conn:
+            _seed(conn)
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+def test_hot_queries_use_their_indexes(app):
+    from app.query_plans import HOT_QUERY_INDEXES, hot_queries, plan_indexes
+
+    with app.app_context():
+        queries = hot_queries()
+        misses = {
+            name: plan_indexes(queries[name]) for name, index in HOT_QUERY_INDEXES.items()
+            if index not in plan_indexes(queries[name])
+        }
+
+    assert not misses, f'shapes not using their index (indexes used instead): {misses}'
@@ -28,7 +28,7 @@ function AdminLogin() {
       const response = await adminAPI.login(formData);
 
       // Save token and user data
-      setAuthToken(response.data.token);
+      setAuthToken(response.data.token, response.data.refresh_token);
       const userData = {
         ...response.data.admin,
         user_type: "admin",
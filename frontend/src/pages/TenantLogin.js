@@ -28,7 +28,7 @@ function TenantLogin() {
       const response = await tenantAPI.login(formData);
 
       // Save token and user data
-      setAuthToken(response.data.token);
+      setAuthToken(response.data.token, response.data.refresh_token);
       const userData = {
         ...response.data.tenant,
         user_type: "tenant",
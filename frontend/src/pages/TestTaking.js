@@ -79,11 +79,9 @@ function TestTaking() {
     try {
       setSubmitting(true);
       
-      // First, submit any unsaved answers
-      for (const [questionId, answer] of Object.entries(answers)) {
-        if (response && !response.responses[questionId]) {
-          await testAPI.submitAnswer(response.id, questionId, answer);
-        }
+      // First, save all answers in one request (autosaves may still be in flight)
+      if (response && Object.keys(answers).length > 0) {
+        await testAPI.submitAnswers(response.id, answers);
       }
       
       // Upload image if provided
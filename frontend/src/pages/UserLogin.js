@@ -47,7 +47,7 @@ function UserLogin() {
       }
 
       // Save token and user data
-      setAuthToken(response.data.token);
+      setAuthToken(response.data.token, response.data.refresh_token);
       const userData = {
         ...response.data.user,
         user_type: "user",
@@ -26,16 +26,51 @@ api.interceptors.request.use(
   }
 );
 
+// Single in-flight refresh shared by concurrent 401s
+let refreshPromise = null;
+
+const refreshAccessToken = () => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem("refresh_token");
+    refreshPromise = axios
+      .post(`${API_BASE_URL}/auth/refresh`, { refresh_token: refreshToken })
+      .then((res) => {
+        localStorage.setItem("token", res.data.token);
+        localStorage.setItem("refresh_token", res.data.refresh_token);
+        return res.data.token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Response interceptor - Handle errors
 api.interceptors.response.use(
   (response) => {
     return response;
   },
-  (error) => {
+  async (error) => {
     if (error.response) {
       // Handle 401 - Unauthorized (token expired or invalid)
       if (error.response.status === 401) {
+        const original = error.config;
+
+        // Try once to get a new access token with the refresh token
+        if (!original._retried && localStorage.getItem("refresh_token")) {
+          original._retried = true;
+          try {
+            const token = await refreshAccessToken();
+            original.headers.Authorization = `Bearer ${token}`;
+            return api(original);
+          } catch (refreshError) {
+            // Fall through to logout
+          }
+        }
+
         localStorage.removeItem("token");
+        localStorage.removeItem("refresh_token");
         localStorage.removeItem("user");
         window.location.href = "/login";
       }
@@ -109,12 +144,18 @@ export const userAPI = {
 
 // ==================== HELPER FUNCTIONS ====================
 
-export const setAuthToken = (token) => {
+export const setAuthToken = (token, refreshToken) => {
   if (token) {
     localStorage.setItem("token", token);
   } else {
     localStorage.removeItem("token");
   }
+
+  if (refreshToken) {
+    localStorage.setItem("refresh_token", refreshToken);
+  } else {
+    localStorage.removeItem("refresh_token");
+  }
 };
 
 export const getAuthToken = () => {
@@ -134,8 +175,22 @@ export const getUser = () => {
   return user ? JSON.parse(user) : null;
 };
 
-export const logout = () => {
+export const logout = async () => {
+  const token = localStorage.getItem("token");
+  const refreshToken = localStorage.getItem("refresh_token");
+  // Best effort: revoke the session server-side, and only then forget the
+  // tokens (interceptors run asynchronously, so the header is set here)
+  if (token) {
+    await api
+      .post(
+        "/auth/logout",
+        { refresh_token: refreshToken },
+        { headers: { Authorization: `Bearer ${token}` } }
+      )
+      .catch(() => {});
+  }
   localStorage.removeItem("token");
+  localStorage.removeItem("refresh_token");
   localStorage.removeItem("user");
   window.location.href = "/login";
 };
@@ -161,6 +216,8 @@ export const testAPI = {
   deleteQuestion: (questionId) => api.delete(`/test/questions/${questionId}`),
   reorderQuestions: (testId, questionOrders) =>
     api.post(`/test/tests/${testId}/questions/reorder`, { question_orders: questionOrders }),
+  moveQuestion: (questionId, afterQuestionId) =>
+    api.post(`/test/questions/${questionId}/move`, { after_question_id: afterQuestionId }),
 
   // Test Taking (User)
   startTest: (testId) => api.post(`/test/tests/${testId}/start`),
@@ -169,6 +226,8 @@ export const testAPI = {
       question_id: questionId,
       answer: answer,
     }),
+  submitAnswers: (responseId, answers) =>
+    api.patch(`/test/responses/${responseId}/answers`, { answers }),
   uploadImage: (responseId, imageFile) => {
     const formData = new FormData();
     formData.append("image", imageFile);